@@ -0,0 +1,230 @@
+"""
+Benchmark of the API client (dlaas.tuilib.api) against a local stand-in of the DLaaS API: latency of each endpoint,
+throughput of concurrent requests, and time and peak memory (traced Python allocations) of large uploads/downloads.
+The stand-in is a threaded HTTP server (HTTPS with --certfile/--keyfile, in which case the client must trust the
+certificate, e.g. via REQUESTS_CA_BUNDLE) which reads and discards the request bodies and serves synthetic
+payloads; the client is pointed to it via the DLAAS_API_URL environment variable.
+
+Usage: python benchmarks/api/bench_api.py [--requests N] [--concurrency N [N ...]] [--payload_mb N] [--save PATH]
+
+Author: @lbabetto
+"""
+
+import os
+import ssl
+import sys
+import json
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from time import perf_counter
+from statistics import mean, quantiles
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dlaas.tuilib import api
+
+CHUNK = b"\0" * (1024 * 1024)
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    """Handler serving the DLaaS API endpoints: request bodies are read and discarded, downloads are streamed from a
+    constant buffer (the size is set by the download_size attribute of the server)"""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, so that clients reusing connections can be evaluated
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self) -> int:
+        remaining = int(self.headers.get("Content-Length", 0))
+        size = remaining
+        while remaining:
+            remaining -= len(self.rfile.read(min(remaining, len(CHUNK))))
+        return size
+
+    def reply(self, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/v1/download":
+            remaining = self.server.download_size
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(remaining))
+            self.end_headers()
+            while remaining:
+                chunk = CHUNK[: min(remaining, len(CHUNK))]
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+        elif path == "/v1/browse_files":
+            files = "".join(f"  - file_{i}.txt\n" for i in range(self.server.browse_files))
+            self.reply(f"Filter: None\nFiles:\n{files}".encode(), content_type="text/plain")
+        elif path == "/v1/job_status":
+            self.reply(b"JOBID PARTITION NAME USER ST TIME NODES\n", content_type="text/plain")
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        size = self.read_body()
+        self.reply(json.dumps({"path": self.path, "received_bytes": size}).encode())
+
+    do_PUT = do_PATCH = do_DELETE = do_POST
+
+
+class FakeAPIServer(ThreadingHTTPServer):
+    """Threaded server with a listen backlog large enough for the concurrency tests"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def start_server(args) -> FakeAPIServer:
+    """Start the API stand-in in a background thread, on a free local port"""
+
+    server = FakeAPIServer(("127.0.0.1", 0), FakeAPIHandler)
+    server.download_size = 0
+    server.browse_files = args.browse_files
+    scheme = "http"
+    if args.certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(args.certfile, args.keyfile or None)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ["DLAAS_API_URL"] = f"{scheme}://localhost:{server.server_address[1]}"
+    return server
+
+
+def write_file(path: str, size: int) -> str:
+    with open(path, "wb") as f:
+        for _ in range(size // len(CHUNK)):
+            f.write(CHUNK)
+        f.write(CHUNK[: size % len(CHUNK)])
+    return path
+
+
+def run_latency(args) -> dict[str, dict[str, float]]:
+    """Latency of sequential calls to each endpoint, with small payloads"""
+
+    write_file("small.txt", 1024)
+    with open("small.json", "w") as f:
+        json.dump({"id": "1"}, f)
+    with open("query.txt", "w") as f:
+        f.write("SELECT * FROM metadata WHERE id = '1'")
+
+    calls = {
+        "upload": lambda: api.upload(ip="", token="bench", file="small.txt", json_data="small.json"),
+        "replace": lambda: api.replace(ip="", token="bench", file="small.txt", json_data="small.json"),
+        "update": lambda: api.update(ip="", token="bench", file="small.txt", json_data="small.json"),
+        "download": lambda: api.download(ip="", token="bench", file="small.txt"),
+        "delete": lambda: api.delete(ip="", token="bench", file="small.txt"),
+        "query_python": lambda: api.query_python(ip="", token="bench", query_file="query.txt", config_json={}),
+        "browse": lambda: api.browse(ip="", token="bench"),
+        "job_status": lambda: api.job_status(ip="", token="bench"),
+    }
+
+    print(f"{'endpoint':<20}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    results = {}
+    for name, call in calls.items():
+        latencies = []
+        for _ in range(args.requests):
+            start = perf_counter()
+            call().raise_for_status()
+            latencies.append((perf_counter() - start) * 1e3)
+        percentiles = quantiles(latencies, n=20) if len(latencies) > 1 else latencies * 19
+        results[name] = {"mean_ms": mean(latencies), "p50_ms": percentiles[9], "p95_ms": percentiles[18]}
+        print(f"{name:<20}" + "".join(f"{value:>10.2f}" for value in results[name].values()))
+
+    return results
+
+
+def run_concurrency(args) -> dict[str, float]:
+    """Throughput of browse requests issued by a pool of threads"""
+
+    print(f"\n{'threads':<20}{'requests/s':>12}")
+    results = {}
+    for threads in args.concurrency:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            start = perf_counter()
+            for response in executor.map(lambda _: api.browse(ip="", token="bench"), range(args.requests)):
+                response.raise_for_status()
+            elapsed = perf_counter() - start
+        results[str(threads)] = args.requests / elapsed
+        print(f"{threads:<20}{results[str(threads)]:>12.1f}")
+
+    return results
+
+
+def run_payloads(server: FakeAPIServer, args) -> dict[str, dict[str, float]]:
+    """Time and peak memory of the upload and download of a large file (the peak is measured in a separate call,
+    since tracemalloc slows down the execution)"""
+
+    size = args.payload_mb * 1024 * 1024
+    server.download_size = size
+    write_file("large.dat", size)
+
+    calls = {
+        "upload": lambda: api.upload(ip="", token="bench", file="large.dat", json_data="small.json"),
+        "download": lambda: api.download(ip="", token="bench", file="large.dat"),
+    }
+
+    print(f"\n{'payload':<20}{'s':>10}{'MB/s':>10}{'peak MB':>10}")
+    results = {}
+    for name, call in calls.items():
+        start = perf_counter()
+        call().raise_for_status()
+        elapsed = perf_counter() - start
+
+        tracemalloc.start()
+        try:
+            call()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        results[name] = {"seconds": elapsed, "MBps": args.payload_mb / elapsed, "peak_MB": peak / 1e6}
+        print(f"{name:<20}{elapsed:>10.2f}{results[name]['MBps']:>10.1f}{results[name]['peak_MB']:>10.1f}")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API client benchmark")
+    parser.add_argument("--requests", type=int, default=200, help="number of requests per endpoint/concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="numbers of client threads")
+    parser.add_argument("--payload_mb", type=int, default=256, help="size of the large upload/download, in MB")
+    parser.add_argument("--browse_files", type=int, default=1000, help="number of files listed by browse_files")
+    parser.add_argument("--certfile", default="", help="certificate of the stand-in server, enables HTTPS")
+    parser.add_argument("--keyfile", default="", help="private key of the certificate, if not in certfile")
+    parser.add_argument("--save", default="", help="path of the JSON file in which the results are saved")
+    args = parser.parse_args()
+
+    server = start_server(args)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:  # download writes to the current folder
+        os.chdir(workdir)
+        try:
+            results = {
+                "latency": run_latency(args),
+                "concurrency": run_concurrency(args),
+                "payloads": run_payloads(server, args),
+            }
+        finally:
+            os.chdir(cwd)
+            server.shutdown()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": sys.version.split()[0], "args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
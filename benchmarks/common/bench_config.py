@@ -0,0 +1,44 @@
+"""
+Micro-benchmark of the configuration loading: Config construction (default files and validation), custom
+overrides and validation of the configuration keywords, with cold and warm validation cache
+
+Usage: python benchmarks/common/bench_config.py [--repeat N]
+
+Author: @lbabetto
+"""
+
+import argparse
+from timeit import timeit
+
+from dlaas.tuilib.common import Config, sanitize_dictionary, check_format
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Configuration loading benchmark")
+    parser.add_argument("--repeat", type=int, default=1000, help="number of calls per case")
+    args = parser.parse_args()
+    n = args.repeat
+
+    results = {}
+
+    config = dict(Config("server").__dict__)
+
+    def sanitize_cold():
+        check_format.cache_clear()
+        sanitize_dictionary(dict(config))
+
+    results["sanitize (cold cache)"] = timeit(sanitize_cold, number=n)
+    results["sanitize (warm cache)"] = timeit(lambda: sanitize_dictionary(dict(config)), number=n)
+    results["Config('server')"] = timeit(lambda: Config("server"), number=n)
+    results["Config('hpc')"] = timeit(lambda: Config("hpc"), number=n)
+    results["Config('hpc') + custom"] = timeit(
+        lambda: Config("hpc").load_custom_config({"ip": "localhost", "port": "27018"}), number=n
+    )
+
+    print(f"{'case':<30}{'us/call':>12}")
+    for case, elapsed in results.items():
+        print(f"{case:<30}{elapsed / n * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Micro-benchmark of the SQL-to-MongoDB translation: full parsing vs. cache hits (exact and templated queries)
+
+Usage: python benchmarks/hpc/bench_convert_SQL_to_mongo.py [--repeat N]
+
+Author: @lbabetto
+"""
+
+import argparse
+from timeit import timeit
+
+from dlaas.tuilib.hpc import parse_SQL
+from dlaas.tuilib.query import QueryCache
+
+QUERY = (
+    "SELECT a, b FROM metadata WHERE NOT ( last_name = 'Jacob' OR ( first_name != 'Chris' AND last_name != 'Lyon' ) ) "
+    "AND NOT is_active = 1"
+)
+
+
+def templated_queries(n: int) -> list[str]:
+    """Queries generated from the same template, differing in their string literals"""
+    return [QUERY.replace("'Jacob'", f"'Jacob{i}'") for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQL-to-MongoDB translation benchmark")
+    parser.add_argument("--repeat", type=int, default=1000, help="number of translations per case")
+    args = parser.parse_args()
+    n = args.repeat
+
+    results = {}
+
+    results["parse (no cache)"] = timeit(lambda: parse_SQL(QUERY), number=n)
+
+    cache = QueryCache()
+    cache.translate(QUERY, parse_SQL)
+    results["cache hit (same query)"] = timeit(lambda: cache.translate(QUERY, parse_SQL), number=n)
+
+    cache = QueryCache(parameterize=True)
+    cache.translate(QUERY, parse_SQL)
+    queries = iter(templated_queries(n))
+    results["cache hit (templated query)"] = timeit(lambda: cache.translate(next(queries), parse_SQL), number=n)
+
+    baseline = results["parse (no cache)"]
+    print(f"{'case':<30}{'us/call':>12}{'speedup':>10}")
+    for case, elapsed in results.items():
+        print(f"{case:<30}{elapsed / n * 1e6:>12.1f}{baseline / elapsed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
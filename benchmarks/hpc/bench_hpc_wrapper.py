@@ -0,0 +1,224 @@
+"""
+Benchmark of the stages of the HPC wrapper on synthetic collections: SQL translation, MongoDB query, user script,
+saving of the results and archive creation. For each stage the best wall time, the throughput and the peak memory
+(traced Python allocations) are reported; results can be saved to a JSON file and compared with those of a previous
+version, failing if any stage got slower than the given tolerance.
+
+By default the collections live in mongomock (in memory, convenient up to ~1M documents); with --mongo_uri they are
+generated in a MongoDB server (e.g. a mongod spawned locally, `mongod --dbpath /tmp/bench-db`), in the dl_tui_bench
+database, which is dropped at the end.
+
+Usage: python benchmarks/hpc/bench_hpc_wrapper.py [--documents N [N ...]] [--repeat N] [--mongo_uri URI]
+                                                  [--save PATH] [--compare PATH] [--tolerance FRACTION]
+
+Author: @lbabetto
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+import mongomock
+from pymongo import MongoClient
+
+from dlaas.tuilib.hpc import convert_SQL_to_mongo, retrieve_files, run_script, save_python_output
+from dlaas.tuilib.query import QUERY_CACHE
+from dlaas.tuilib.upload import archive_results, zstandard
+
+QUERY = "SELECT * FROM metadata WHERE category = 'c0'"
+
+# trivial user script: writes the list of its inputs to a single output file
+SCRIPT = """
+def main(files_in):
+    with open("files_in.txt", "w") as f:
+        f.write("\\n".join(files_in))
+    return ["files_in.txt"]
+"""
+
+BATCH_SIZE = 10000
+
+
+def generate_collection(collection, n: int, selectivity: float) -> None:
+    """Fill a collection with n synthetic documents, a fraction `selectivity` of which match QUERY"""
+    categories = max(1, round(1 / selectivity))
+    collection.drop()
+    for start in range(0, n, BATCH_SIZE):
+        collection.insert_many(
+            [
+                {"id": str(i), "path": f"/pfs/datalake/file_{i:09d}.dat", "category": f"c{i % categories}"}
+                for i in range(start, min(start + BATCH_SIZE, n))
+            ],
+            ordered=False,
+        )
+
+
+def write_output_files(count: int, size: int) -> list[str]:
+    """Create the output files of a job (random, hence incompressible, content)"""
+    files = []
+    for i in range(count):
+        path = os.path.abspath(f"result_{i}.dat")
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        files.append(path)
+    return files
+
+
+def measure(function, setup=None, repeat: int = 3) -> tuple[float, float]:
+    """Run a function `repeat` times (calling setup, untimed, before each run) and return the best wall time, in
+    seconds, and the peak memory allocated by the function, in MB. The peak is measured in a separate run, since
+    tracemalloc slows down the execution."""
+
+    best = float("inf")
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = perf_counter()
+        function(*args)
+        best = min(best, perf_counter() - start)
+
+    args = setup() if setup else ()
+    tracemalloc.start()
+    try:
+        function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return best, peak / 1e6
+
+
+def run_benchmarks(collection, sizes: list[int], args) -> dict[str, dict[str, float]]:
+    """Run all the cases, returning {case: {"seconds", "throughput", "unit", "peak_MB"}}"""
+
+    results = {}
+
+    def record(case: str, seconds: float, peak: float, amount: float, unit: str) -> None:
+        results[case] = {"seconds": seconds, "throughput": amount / max(seconds, 1e-9), "unit": unit, "peak_MB": peak}
+        print(f"{case:<40}{seconds * 1e3:>12.2f}{results[case]['throughput']:>14.1f} {unit:<9}{peak:>10.2f}")
+
+    print(f"{'case':<40}{'ms':>12}{'throughput':>24}{'peak MB':>10}")
+
+    def translate():
+        QUERY_CACHE.clear()
+        convert_SQL_to_mongo(QUERY)
+
+    record("convert_SQL_to_mongo", *measure(translate, repeat=args.repeat), 1, "queries/s")
+    query_filters, query_fields = convert_SQL_to_mongo(QUERY)
+
+    for n in sizes:
+        generate_collection(collection, n, args.selectivity)
+        files_in = []
+
+        def retrieve():
+            files_in[:] = retrieve_files(collection, query_filters=query_filters, query_fields=query_fields)
+
+        record(f"retrieve_files ({n} docs)", *measure(retrieve, repeat=args.repeat), n, "docs/s")
+        record(
+            f"run_script ({len(files_in)} files)",
+            *measure(lambda: run_script(SCRIPT, files_in), repeat=args.repeat),
+            len(files_in),
+            "files/s",
+        )
+
+    collection.drop()
+
+    total = args.output_files * args.output_size
+
+    def save(files_out: list[str]):
+        save_python_output(
+            sql_query=QUERY,
+            script=SCRIPT,
+            files_out=files_out,
+            pfs_prefix_path="/pfs/datalake",
+            s3_endpoint_url="https://s3.example.com/",
+            s3_bucket="bench",
+            job_id="bench",
+            collection=collection,
+        )
+
+    def setup_save():
+        if os.path.exists("output"):
+            for name in os.listdir("output"):
+                os.remove(os.path.join("output", name))
+        return (write_output_files(args.output_files, args.output_size),)
+
+    seconds, peak = measure(save, setup=setup_save, repeat=args.repeat)
+    record(f"save_python_output ({args.output_files} files)", seconds, peak, total / 1e6, "MB/s")
+
+    formats = ["zip", "store"] + (["tar.zst"] if zstandard is not None else [])
+    for archive_format in formats:
+        seconds, peak = measure(
+            lambda: archive_results("output", f"results.{archive_format}", archive_format=archive_format),
+            repeat=args.repeat,
+        )
+        record(f"archive_results ({archive_format})", seconds, peak, total / 1e6, "MB/s")
+
+    return results
+
+
+def compare(results: dict[str, dict[str, float]], baseline_path: str, tolerance: float) -> list[str]:
+    """Compare the results with those saved by a previous run, returning the cases which got slower than the
+    tolerance (e.g. 0.2: more than 20% slower)"""
+
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)["results"]
+
+    print(f"\n{'case':<40}{'baseline ms':>14}{'ms':>12}{'change':>10}")
+    regressions = []
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        change = result["seconds"] / baseline[case]["seconds"] - 1
+        flag = ""
+        if change > tolerance:
+            regressions.append(case)
+            flag = "  REGRESSION"
+        print(
+            f"{case:<40}{baseline[case]['seconds'] * 1e3:>14.2f}{result['seconds'] * 1e3:>12.2f}{change:>+10.1%}{flag}"
+        )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HPC wrapper benchmark")
+    parser.add_argument(
+        "--documents", type=int, nargs="+", default=[10000, 100000], help="sizes of the synthetic collections"
+    )
+    parser.add_argument("--selectivity", type=float, default=0.1, help="fraction of the documents matching the query")
+    parser.add_argument("--output_files", type=int, default=100, help="number of output files saved and archived")
+    parser.add_argument("--output_size", type=int, default=1024 * 1024, help="size of each output file, in bytes")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs per case (the best one is reported)")
+    parser.add_argument("--mongo_uri", default="", help="URI of a MongoDB server, mongomock is used if not provided")
+    parser.add_argument("--save", default="", help="path of the JSON file in which the results are saved")
+    parser.add_argument("--compare", default="", help="path of the JSON file with the results of a previous run")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="slowdown tolerated when comparing, 0.2 by default"
+    )
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_uri) if args.mongo_uri else mongomock.MongoClient()
+    collection = client["dl_tui_bench"]["metadata"]
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:  # the wrapper functions write to the current folder
+        os.chdir(workdir)
+        try:
+            results = run_benchmarks(collection, args.documents, args)
+        finally:
+            os.chdir(cwd)
+            client.drop_database("dl_tui_bench")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": sys.version.split()[0], "args": vars(args), "results": results}, f, indent=2)
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
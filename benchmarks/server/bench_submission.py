@@ -0,0 +1,157 @@
+"""
+Load test of the job submission of dl_tui_server against a simulated Slurm cluster (see backends.py): synthetic jobs
+are submitted by a pool of threads through create_remote_directory, copy_json_input, copy_user_executable, launch_job
+and upload_results, reporting the submission throughput, the tail latency and the mean time spent in each step
+
+Usage: python benchmarks/server/bench_submission.py [--jobs N] [--workers N] [--sbatch_latency S] [--copy_latency S]
+                                                    [--failure_rate P] [--save PATH]
+
+Author: @lbabetto
+"""
+
+import os
+import sys
+import json
+import uuid
+import argparse
+import tempfile
+from time import perf_counter
+from statistics import quantiles
+from concurrent.futures import ThreadPoolExecutor
+
+from dlaas.tuilib.backends import SIMULATED_SLURM
+from dlaas.tuilib.metrics import METRICS
+from dlaas.tuilib.server import (
+    create_remote_directory,
+    copy_json_input,
+    copy_user_executable,
+    launch_job,
+    upload_results,
+)
+
+STEPS = ["create_remote_directory", "copy_json_input", "copy_user_executable", "launch_job", "upload_results"]
+
+
+def write_jobs(n: int, workdir: str) -> list[str]:
+    """Write the inputs of n synthetic jobs, half of which with a user script"""
+
+    script_path = os.path.join(workdir, "user_script.py")
+    with open(script_path, "w") as f:
+        f.write("def main(files_in):\n    return files_in\n")
+
+    paths = []
+    for i in range(n):
+        job_id = uuid.uuid4().hex
+        user_input = {
+            "id": job_id,
+            "sql_query": f"SELECT * FROM metadata WHERE id = '{i}'",
+        }
+        if i % 2:
+            user_input["script_path"] = script_path
+        path = os.path.join(workdir, f"input_{job_id}.json")
+        with open(path, "w") as f:
+            json.dump(user_input, f)
+        paths.append(path)
+
+    return paths
+
+
+def use_simulated_backend(workdir: str) -> None:
+    """Select the simulated backend (an operator-only option) in a copy of the configuration files of the current
+    user, in a temporary home folder"""
+
+    config_dir = os.path.join(workdir, ".config", "dlaas")
+    os.makedirs(config_dir)
+    for version in ["hpc", "server"]:
+        config = {}
+        path = os.path.expanduser(f"~/.config/dlaas/config_{version}.json")
+        if os.path.isfile(path):
+            with open(path, "r") as f:
+                config = json.load(f)
+        if version == "server":
+            config["backend"] = "simulated"
+        with open(os.path.join(config_dir, f"config_{version}.json"), "w") as f:
+            json.dump(config, f)
+    os.environ["HOME"] = workdir
+
+
+def submit(json_path: str) -> tuple[float, bool]:
+    """Submit a job, returning the submission time and whether it succeeded"""
+
+    start = perf_counter()
+    try:
+        create_remote_directory(json_path=json_path)
+        copy_json_input(json_path=json_path)
+        _, _, build_job_id = copy_user_executable(json_path=json_path)
+        _, _, slurm_job_id = launch_job(json_path=json_path, build_job_id=build_job_id)
+        upload_results(json_path=json_path, slurm_job_id=slurm_job_id)
+    except RuntimeError:  # submission failed (simulated sbatch error)
+        return perf_counter() - start, False
+
+    return perf_counter() - start, True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Job submission load test")
+    parser.add_argument("--jobs", type=int, default=1000, help="number of synthetic jobs")
+    parser.add_argument("--workers", type=int, default=16, help="number of concurrent submissions")
+    parser.add_argument("--sbatch_latency", type=float, default=0.2, help="mean duration of sbatch, in seconds")
+    parser.add_argument("--copy_latency", type=float, default=0.05, help="mean duration of other commands, in seconds")
+    parser.add_argument("--failure_rate", type=float, default=0.01, help="probability of an sbatch call failing")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the simulation")
+    parser.add_argument("--save", default="", help="path of the JSON file in which the results are saved")
+    args = parser.parse_args()
+
+    SIMULATED_SLURM.configure(
+        sbatch_latency=args.sbatch_latency,
+        copy_latency=args.copy_latency,
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+    )
+    METRICS.reset()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        use_simulated_backend(workdir)
+        paths = write_jobs(args.jobs, workdir)
+
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            outcomes = list(executor.map(submit, paths))
+        elapsed = perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in outcomes)
+    submitted = sum(ok for _, ok in outcomes)
+    percentiles = quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+
+    results = {
+        "submitted": submitted,
+        "failed": len(outcomes) - submitted,
+        "submissions_per_second": submitted / elapsed,
+        "p50_s": percentiles[49],
+        "p95_s": percentiles[94],
+        "p99_s": percentiles[98],
+        "max_s": latencies[-1],
+        "steps_mean_s": {
+            step: series["sum"] / series["count"]
+            for step in STEPS
+            if (series := METRICS.histograms.get(("dl_tui_ssh_seconds", (("step", step),))))
+        },
+    }
+
+    print(f"{'jobs':<28}{args.jobs} ({submitted} submitted, {results['failed']} failed)")
+    print(f"{'submissions/s':<28}{results['submissions_per_second']:.1f}")
+    print(
+        f"{'latency p50/p95/p99/max':<28}"
+        + " / ".join(f"{results[key]:.3f}" for key in ["p50_s", "p95_s", "p99_s", "max_s"])
+        + " s"
+    )
+    for step, seconds in results["steps_mean_s"].items():
+        print(f"  {step:<26}{seconds * 1e3:.1f} ms")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": sys.version.split()[0], "args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
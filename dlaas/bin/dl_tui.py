@@ -20,6 +20,7 @@ import json
 import argparse
 
 from dlaas.tuilib.common import Config
+from dlaas.tuilib.tracing import get_trace_path, load_spans, format_timeline
 from dlaas.tuilib.api import (
     upload,
     replace,
@@ -52,7 +53,9 @@ Example commands [arguments within parentheses are optional]:
     DELETE      | dl_tui --delete --key=file.jpg
     BROWSE      | dl_tui --browse [--filter="category = dog"]
     JOB_STATUS  | dl_tui --job_status [--user="john"] [--config_json=/path/to/config.json]
+    TRACE       | dl_tui --trace=JOB_ID [--trace_dir /path/to/traces [/path/to/other/traces]]
     QUERY (PYTHON)    | dl_tui --query --query_file=/path/to/query.txt [--python_file=/path/to/script.py] [--config_json=/path/to/config.json]
+    QUERY (DRY RUN)   | dl_tui --query --query_file=/path/to/query.txt --dry-run [--config_json=/path/to/config.json]
     QUERY (CONTAINER) | dl_tui --query --query_file=/path/to/query.txt [--container_path=/path/to/container.sif] [--container_url=docker://url/to/container.sif] [--exec_command="command to be executed within the container"] [--config_json=/path/to/config.json]
     """,
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -109,6 +112,13 @@ Example commands [arguments within parentheses are optional]:
         action="store_true",
     )
 
+    actions.add_argument(
+        "--trace",
+        help="show the timeline of a job, from the spans recorded by the server and HPC executables",
+        metavar="JOB_ID",
+        default=None,
+    )
+
     # Optional arguments
 
     parser.add_argument(
@@ -193,6 +203,13 @@ Example commands [arguments within parentheses are optional]:
         default=None,
     )
 
+    parser.add_argument(
+        "--dry-run",
+        help="[--query] | count the files matching the query and their total size, without launching the job. \
+        Requires direct access to the MongoDB server (credentials in config_hpc.json)",
+        action="store_true",
+    )
+
     parser.add_argument(
         "--filter",
         help="[--browse] | SQL-like query for filtering files, \
@@ -206,6 +223,14 @@ Example commands [arguments within parentheses are optional]:
         default=None,
     )
 
+    parser.add_argument(
+        "--trace_dir",
+        help="[--trace] | folders containing the trace files of the job (by default, the trace_dir of the hpc and \
+        server configuration)",
+        nargs="+",
+        default=None,
+    )
+
     parser.add_argument(
         "-v",
         "--verbose",
@@ -367,7 +392,35 @@ Example commands [arguments within parentheses are optional]:
         logger.debug(f"config_hpc: {config_json['config_hpc']}")
         logger.debug(f"config_server: {config_json['config_server']}")
 
-        if args.python_file:
+        if args.dry_run:
+            # the dry run queries the metadata directly, needing the HPC-side dependencies (sqlparse, pymongo) and
+            # the MongoDB credentials in config_hpc.json: imported here, so that the other actions do not need them
+            from dlaas.tuilib.hpc import convert_SQL_to_mongo, preflight_query
+            from dlaas.tuilib.mongo import get_read_collection
+            from dlaas.tuilib.server import estimate_resources
+
+            config_hpc = Config("hpc")
+            config_hpc.load_custom_config(config_json["config_hpc"])
+            config_server = Config("server")
+            config_server.load_custom_config(config_json["config_server"])
+
+            with open(args.query_file, "r") as f:
+                sql_query = f.read()
+            query_filters, _ = convert_SQL_to_mongo(sql_query=sql_query)
+
+            result = preflight_query(
+                collection=get_read_collection(config_hpc),
+                query_filters=query_filters,
+                size_field=config_hpc.size_field,
+            )
+            resources = estimate_resources(matches=result["matches"], config=config_server)
+
+            print(f"Query: {sql_query}")
+            print(f"Matching files: {result['matches']}")
+            print(f"Total size: {result['size'] / 1e6:.1f} MB")
+            print(f"Estimated resources: {resources['nodes']} nodes, walltime {resources['walltime']}")
+
+        elif args.python_file:
             response = query_python(
                 ip=args.ip,
                 token=args.token,
@@ -431,6 +484,17 @@ Example commands [arguments within parentheses are optional]:
             print(response.text)
             response.raise_for_status()
 
+    # Show job timeline
+    elif args.trace:
+
+        # checking for missing options
+        trace_dirs = args.trace_dir or [Config("server").trace_dir, Config("hpc").trace_dir]
+        paths = sorted({get_trace_path(trace_dir, args.trace) for trace_dir in trace_dirs if trace_dir})
+        if not paths:
+            raise KeyError("Required argument is missing: --trace_dir (or trace_dir in the configuration)")
+
+        print(format_timeline(load_spans(paths)))
+
     # Check job status
     elif args.job_status:
 
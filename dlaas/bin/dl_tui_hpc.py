@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 """
-Wrapper which needs to be run from command line providing the following information in JSON format:
+Wrapper which needs to be run from command line (`dl_tui_hpc run <json_path>`) providing the following information
+in JSON format:
 
   - ID: a unique ID for the job run (preferably of the UUID.hex form)
   - query: path to a file containing an SQL query
@@ -13,28 +14,135 @@ The wrapper then does the following:
   1. Takes user SQL query and converts it to Mongo spec using a custom sqlparse codebase (@lbabetto/sqlparse)
   2. Runs query on remote DB and retrieves the matching entries, generating a list with the paths to the files
   3. Takes the user-provided python script and runs it locally, feeding the input files list to the `main` function
-  4. Retrieves the output files from the `main` function and saves the files (of any kind, user-defined) in a zipped
-  archive which is then uploaded to the S3 bucket specified in the hpc config file.
+  4. Retrieves the output files from the `main` function and saves the files (of any kind, user-defined) in the
+  output folder, writing an upload manifest next to it.
+
+The results are then archived and uploaded to the S3 bucket specified in the hpc config file by the
+`dl_tui_hpc upload <manifest_path>` command, either in a separate Slurm job or at the end of the run (`--upload`).
 
 Author: @lbabetto
 """
 
-# setting up logging
 import logging
 
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-fh = logging.FileHandler("dl-tui.log", mode="w")
-fh.setLevel(logging.DEBUG)
-formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-fh.setFormatter(formatter)
-logger.addHandler(fh)
-
-from pymongo import MongoClient
+logger = logging.getLogger(__name__)
 
+import os
+import sys
+import json
 import argparse
+from time import time, time_ns
 from dlaas.tuilib.common import Config, UserInput
 from dlaas.tuilib.hpc import python_wrapper, container_wrapper
+from dlaas.tuilib.mongo import get_collection, get_read_collection
+from dlaas.tuilib.indexes import collect_filters, recommend_indexes, create_indexes
+from dlaas.tuilib.logs import get_log_options, setup_logging
+from dlaas.tuilib.metrics import METRICS, record_upload, save_metrics
+from dlaas.tuilib.tracing import TRACER
+from dlaas.tuilib.profiling import save_upload_profile
+from dlaas.tuilib.query import configure_query_cache
+from dlaas.tuilib.upload import get_upload_options, run_upload, update_manifest
+
+SUBCOMMANDS = ["run", "upload", "indexes"]
+
+# metrics are saved outside the job folder, which is deleted at the end of the job
+DEFAULT_METRICS_DIR = "~/.dlaas/metrics"
+
+
+def get_metrics_path(config: Config, job_id: str) -> str:
+    """Return the path of the JSON file with the metrics of a job (metrics_<job_id>.json), in the metrics_dir folder
+    if configured, otherwise in ~/.dlaas/metrics (the job folder is deleted at the end of the job). The folder is
+    created if missing.
+
+    Parameters
+    ----------
+    config : Config
+        hpc configuration
+    job_id : str
+        unique job identifier
+
+    Returns
+    -------
+    str
+        path of the metrics file
+    """
+
+    metrics_dir = config.metrics_dir or os.path.expanduser(DEFAULT_METRICS_DIR)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+    return os.path.join(metrics_dir, f"metrics_{job_id}.json")
+
+
+def get_job_config(manifest_path: str) -> Config:
+    """Return the hpc configuration of a job, with the custom options of the job recorded in its upload manifest, so
+    that an upload run in a separate job behaves as one run at the end of the job (`run --upload`)
+
+    Parameters
+    ----------
+    manifest_path : str
+        path to the upload manifest written by the run command
+
+    Returns
+    -------
+    Config
+        hpc configuration of the job
+    """
+
+    with open(manifest_path, "r") as f:
+        custom_config = json.load(f).get("config_hpc")
+
+    config = Config(version="hpc")
+    if custom_config:
+        config.load_custom_config(custom_config)
+
+    return config
+
+
+def upload(manifest_path: str) -> dict[str, str]:
+    """Upload the results of a run, registering the files added to the output folder after the run (Slurm logs,
+    job profile), recording its metrics and, if the job was profiled, adding the archive/upload stages to its profile
+
+    Parameters
+    ----------
+    manifest_path : str
+        path to the upload manifest written by the run command
+
+    Returns
+    -------
+    dict[str, str]
+        upload summary (see upload.run_upload)
+    """
+
+    config = get_job_config(manifest_path)
+
+    # files added to the output folder after the results were registered are registered before the upload
+    with open(manifest_path, "r") as f:
+        results = json.load(f).get("results")
+    collection = None
+    if results:
+        config.database = results["database"]
+        config.collection = results["collection"]
+        collection = get_collection(config)
+
+    start = time_ns()
+    summary = run_upload(manifest_path=manifest_path, collection=collection)
+    end = time_ns()
+    record_upload(summary)
+
+    # the upload may run in a separate job, in which tracing was not set up yet
+    if not TRACER.enabled and config.trace_dir:
+        TRACER.configure(job_id=summary["job_id"], trace_dir=config.trace_dir, service="dl_tui_hpc")
+    parent_id = TRACER.record("results_upload", start, end, bytes=summary["bytes"])
+    if "archive" in summary["stages"]:
+        TRACER.record("archive", start, start + int(summary["stages"]["archive"] * 1e9), parent_id=parent_id)
+    TRACER.record("upload", end - int(summary["stages"]["upload"] * 1e9), end, parent_id=parent_id)
+
+    if "profile" in summary:
+        config.database = summary["profile"]["database"]
+        config.collection = summary["profile"]["collection"]
+        save_upload_profile(collection=get_collection(config), job_id=summary["job_id"], summary=summary)
+
+    return summary
 
 
 def main():
@@ -47,76 +155,193 @@ HPC-side executable for Cineca's Data Lake as a Service.
 For further information, please consult the code repository (https://github.com/Eurocc-Italy/dl_tui)
 """,
     )
+    subparsers = parser.add_subparsers(dest="command", required=True)
 
-    parser.add_argument(
+    parser_run = subparsers.add_parser("run", help="run the query and the analysis on HPC")
+    parser_run.add_argument(
         "json_path",
         help="path to the JSON file containing the HPC job information",
     )
+    parser_run.add_argument(
+        "--upload",
+        action="store_true",
+        help="upload the results to S3 at the end of the run, instead of in a separate job",
+    )
+
+    parser_upload = subparsers.add_parser("upload", help="archive and upload the results of a completed run to S3")
+    parser_upload.add_argument(
+        "manifest_path",
+        help="path to the upload manifest written by the run command",
+    )
+
+    parser_indexes = subparsers.add_parser(
+        "indexes",
+        help="recommend (and optionally create) indexes on the metadata collection, based on the queries in the logs",
+    )
+    parser_indexes.add_argument(
+        "log_paths",
+        nargs="+",
+        help="paths (or glob patterns) of the logs containing the MongoDB query filters (e.g. dl-tui.log)",
+    )
+    parser_indexes.add_argument(
+        "--create",
+        action="store_true",
+        help="create the recommended indexes",
+    )
+    parser_indexes.add_argument(
+        "--min_queries",
+        type=int,
+        default=1,
+        help="minimum number of queries which would use an index for it to be recommended",
+    )
+
+    # backwards compatibility: `dl_tui_hpc <json_path>` is equivalent to `dl_tui_hpc run <json_path>`
+    argv = sys.argv[1:]
+    if argv and argv[0] not in SUBCOMMANDS + ["-h", "--help"]:
+        argv = ["run"] + argv
+
+    args = parser.parse_args(argv)
+
+    # setting up logging (the job log may be one of the inputs of the indexes command, it must not be overwritten)
+    if args.command != "indexes":
+        setup_logging("dl-tui.log", mode="w", **get_log_options(Config(version="hpc")))
+
+    if args.command == "upload":
+        summary = upload(manifest_path=args.manifest_path)
+        save_metrics(get_metrics_path(get_job_config(args.manifest_path), summary["job_id"]))
+        return
+
+    if args.command == "indexes":
+        config = Config(version="hpc")
+        collection = get_collection(config)
+
+        recommendations = recommend_indexes(
+            query_filters=collect_filters(args.log_paths),
+            collection=collection,
+            min_queries=args.min_queries,
+        )
+        for index in recommendations:
+            print(f"{index['queries']:>6} queries | {index['keys']}")
+
+        if args.create:
+            create_indexes(collection=collection, recommendations=recommendations)
+        return
 
-    args = parser.parse_args()
     json_path = args.json_path
 
     # reading user input
     user_input = UserInput.from_json(json_path=json_path)
 
+    # the input file is copied to HPC right before the job is submitted
+    submitted = os.path.getmtime(json_path)
+    METRICS.observe("dl_tui_queue_wait_seconds", max(time() - submitted, 0))
+
     # loading config and overwriting custom options
     config = Config(version="hpc")
     if user_input.config_hpc:
         config.load_custom_config(user_input.config_hpc)
-    logger.debug(f"HPC config: {config}")
+    logger.debug("HPC config: %s", config)
 
-    # setting up MongoDB URI
-    mongodb_uri = f"mongodb://{config.user}:{config.password}@{config.ip}:{config.port}/"
+    if config.trace_dir:
+        TRACER.configure(job_id=user_input.id, trace_dir=config.trace_dir, service="dl_tui_hpc")
+        TRACER.record("queue_wait", int(submitted * 1e9), time_ns())
 
-    # connecting to MongoDB server
-    logger.info(f"Connecting to MongoDB client: {mongodb_uri}")
-    client = MongoClient(mongodb_uri)
+    with TRACER.span("run"):
+        # setting up the cache for the SQL query translation
+        configure_query_cache(
+            maxsize=config.query_cache_size,
+            path=config.query_cache_path,
+            parameterize=config.query_cache_parameterize,
+        )
 
-    # accessing collection
-    logger.info(f"Loading database {config.database}, collection {config.collection}")
-    collection = client[config.database][config.collection]
+        collection = get_collection(config)  # results metadata are written on the primary
+        read_collection = get_read_collection(config)  # queries can be served by the secondaries
 
-    # Launch Singularity container (with path)
-    if user_input.container_path:
-        container_wrapper(
-            collection=collection,
-            sql_query=user_input.sql_query,
-            pfs_prefix_path=config.pfs_prefix_path,
-            s3_endpoint_url=config.s3_endpoint_url,
-            s3_bucket=config.s3_bucket,
-            job_id=user_input.id,
-            container_path=user_input.container_path,
-            exec_command=user_input.exec_command,
-        )
+        # Launch Singularity container (with path)
+        if user_input.container_path:
+            manifest = container_wrapper(
+                collection=collection,
+                sql_query=user_input.sql_query,
+                pfs_prefix_path=config.pfs_prefix_path,
+                s3_endpoint_url=config.s3_endpoint_url,
+                s3_bucket=config.s3_bucket,
+                job_id=user_input.id,
+                container_path=user_input.container_path,
+                exec_command=user_input.exec_command,
+                stage_inputs=config.stage_inputs,
+                staging_workers=config.staging_workers,
+                upload_options=get_upload_options(config),
+                query_filters=user_input.query_filters,
+                query_fields=user_input.query_fields,
+                explain_queries=config.explain_queries,
+                profile_job=config.profile_jobs,
+                read_collection=read_collection,
+                job_hash=user_input.job_hash or "",
+                previous_job_id=config.incremental_from,
+                incremental_overlap=config.incremental_overlap,
+            )
 
-    # Launch Singularity container (with URL)
-    elif user_input.container_url:
-        container_wrapper(
-            collection=collection,
-            sql_query=user_input.sql_query,
-            pfs_prefix_path=config.pfs_prefix_path,
-            s3_endpoint_url=config.s3_endpoint_url,
-            s3_bucket=config.s3_bucket,
-            job_id=user_input.id,
-            container_path=f"container_{user_input.id}.sif",
-            exec_command=user_input.exec_command,
-        )
+        # Launch Singularity container (with URL)
+        elif user_input.container_url:
+            manifest = container_wrapper(
+                collection=collection,
+                sql_query=user_input.sql_query,
+                pfs_prefix_path=config.pfs_prefix_path,
+                s3_endpoint_url=config.s3_endpoint_url,
+                s3_bucket=config.s3_bucket,
+                job_id=user_input.id,
+                container_path=f"container_{user_input.id}.sif",
+                exec_command=user_input.exec_command,
+                stage_inputs=config.stage_inputs,
+                staging_workers=config.staging_workers,
+                upload_options=get_upload_options(config),
+                query_filters=user_input.query_filters,
+                query_fields=user_input.query_fields,
+                explain_queries=config.explain_queries,
+                profile_job=config.profile_jobs,
+                read_collection=read_collection,
+                job_hash=user_input.job_hash or "",
+                previous_job_id=config.incremental_from,
+                incremental_overlap=config.incremental_overlap,
+            )
 
-    # Launch Python script (if missing, should just return the query matches)
-    else:
-        if user_input.script_path:
-            with open(user_input.script_path, "r") as f:
-                script = f.read()
+        # Launch Python script (if missing, should just return the query matches)
+        else:
+            script = ""
+            if user_input.script_path:
+                with open(user_input.script_path, "r") as f:
+                    script = f.read()
 
-        python_wrapper(
-            collection=collection,
-            sql_query=user_input.sql_query,
-            pfs_prefix_path=config.pfs_prefix_path,
-            s3_endpoint_url=config.s3_endpoint_url,
-            s3_bucket=config.s3_bucket,
-            job_id=user_input.id,
-            script=script,
-        )
+            manifest = python_wrapper(
+                collection=collection,
+                sql_query=user_input.sql_query,
+                pfs_prefix_path=config.pfs_prefix_path,
+                s3_endpoint_url=config.s3_endpoint_url,
+                s3_bucket=config.s3_bucket,
+                job_id=user_input.id,
+                script=script,
+                stage_inputs=config.stage_inputs,
+                staging_workers=config.staging_workers,
+                staging_shard_size=config.staging_shard_size,
+                upload_options=get_upload_options(config),
+                query_filters=user_input.query_filters,
+                query_fields=user_input.query_fields,
+                explain_queries=config.explain_queries,
+                profile_job=config.profile_jobs,
+                read_collection=read_collection,
+                job_hash=user_input.job_hash or "",
+                previous_job_id=config.incremental_from,
+                incremental_overlap=config.incremental_overlap,
+            )
+
+        # the custom options of the job are applied to the upload as well, also if run in a separate job
+        update_manifest(manifest_path=manifest, updates={"config_hpc": user_input.config_hpc or {}})
+
+        # uploading results within the same job, saving the queue time of the upload job
+        if args.upload:
+            upload(manifest_path=manifest)
+
+    save_metrics(get_metrics_path(config, user_input.id))
 
 
 if __name__ == "__main__":
@@ -7,27 +7,23 @@ runs the script on the query results.
 Author: @lbabetto
 """
 
-# setting up logging
 import logging
-import os
 
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-if not os.path.exists("/var/log/datalake"):
-    try:
-        os.makedirs("/var/log/datalake")
-        fh = logging.FileHandler("/var/log/datalake/dl-tui.log", mode="a")
-    except PermissionError:
-        fh = logging.FileHandler("dl-tui.log", mode="w")
-else:
-    fh = logging.FileHandler("/var/log/datalake/dl-tui.log", mode="a")
-fh.setLevel(logging.DEBUG)
-formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-fh.setFormatter(formatter)
-logger.addHandler(fh)
+logger = logging.getLogger(__name__)
 
+import os
+import json
 import argparse
+from dlaas.tuilib.common import Config, UserInput
+from dlaas.tuilib.logs import get_log_options, setup_logging
+from dlaas.tuilib.metrics import METRICS, save_metrics
+from dlaas.tuilib.tracing import TRACER
 from dlaas.tuilib.server import (
+    validate_query,
+    lookup_job_cache,
+    preflight_job,
+    is_local_job,
+    run_local_job,
     create_remote_directory,
     copy_json_input,
     copy_user_executable,
@@ -36,6 +32,55 @@ from dlaas.tuilib.server import (
 )
 
 
+def submit(json_path: str) -> str:
+    """Validate the job and submit it to HPC (unless the results of an identical job can be reused, or the job is
+    small enough to be run on this node)
+
+    Parameters
+    ----------
+    json_path : str
+        path to the JSON file containing the HPC job information
+
+    Returns
+    -------
+    str
+        outcome of the submission, "cached", "local" or "submitted"
+    """
+
+    with TRACER.span("validate_query"):
+        validate_query(json_path=json_path)  # invalid queries are rejected before reaching HPC
+
+    with TRACER.span("lookup_job_cache"):
+        cached = lookup_job_cache(json_path=json_path)  # identical jobs on unchanged data are not run again
+    if cached:
+        print(json.dumps(cached))
+        return "cached"
+
+    with TRACER.span("preflight_job"):
+        preflight = preflight_job(json_path=json_path)  # oversized queries are rejected, resources are estimated
+
+    if is_local_job(json_path=json_path, preflight=preflight):  # small jobs skip the Slurm queue, if a worker is free
+        with TRACER.span("run_local_job"):
+            local = run_local_job(json_path=json_path)
+        if local is not None:
+            return "local"
+
+    with TRACER.span("create_remote_directory"):
+        create_remote_directory(json_path=json_path)
+    with TRACER.span("copy_json_input"):
+        copy_json_input(json_path=json_path)
+
+    with TRACER.span("copy_user_executable"):
+        stdout, stderr, build_job_id = copy_user_executable(json_path=json_path)
+    with TRACER.span("launch_job"):
+        stdout, stderr, slurm_job_id = launch_job(json_path=json_path, build_job_id=build_job_id)
+
+    with TRACER.span("upload_results"):
+        upload_results(json_path=json_path, slurm_job_id=slurm_job_id)
+
+    return "submitted"
+
+
 def main():
     """Executable intended to run on the server VM"""
 
@@ -56,13 +101,35 @@ For further information, please consult the code repository (https://github.com/
     args = parser.parse_args()
     json_path = args.json_path
 
-    create_remote_directory(json_path=json_path)
-    copy_json_input(json_path=json_path)
+    config = Config("server")
 
-    stdout, stderr, build_job_id = copy_user_executable(json_path=json_path)
-    stdout, stderr, slurm_job_id = launch_job(json_path=json_path, build_job_id=build_job_id)
+    # setting up logging, in the shared log (rotated) if possible, otherwise in the current folder
+    log_options = get_log_options(config)
+    try:
+        os.makedirs("/var/log/datalake", exist_ok=True)
+        setup_logging("/var/log/datalake/dl-tui.log", mode="a", **log_options)
+    except PermissionError:
+        setup_logging("dl-tui.log", mode="w", **log_options)
 
-    upload_results(json_path=json_path, slurm_job_id=slurm_job_id)
+    if config.trace_dir:
+        TRACER.configure(
+            job_id=UserInput.from_json(json_path=json_path).id, trace_dir=config.trace_dir, service="dl_tui_server"
+        )
+
+    try:
+        with TRACER.span("submit"):
+            outcome = submit(json_path=json_path)
+    except Exception:
+        METRICS.inc("dl_tui_jobs_total", outcome="failed")
+        raise
+    else:
+        METRICS.inc("dl_tui_jobs_total", outcome=outcome)
+    finally:
+        if config.metrics_path:  # accumulated over the jobs, exported for the Prometheus node exporter
+            try:
+                save_metrics(f"{config.metrics_path}.json", prometheus_path=config.metrics_path)
+            except OSError as e:
+                logger.warning(f"Could not export metrics to {config.metrics_path}: {e}")
 
 
 if __name__ == "__main__":
@@ -15,6 +15,23 @@ import os
 import json
 
 
+def get_api_url(ip: str) -> str:
+    """Return the base URL of the DLaaS API. The DLAAS_API_URL environment variable, if set, takes precedence over the
+    IP address (e.g. for pointing the client to a local stand-in of the API, see benchmarks/api)
+
+    Parameters
+    ----------
+    ip : str
+        IP address of the machine running the API
+
+    Returns
+    -------
+    str
+        base URL of the API, without trailing slash
+    """
+    return os.environ.get("DLAAS_API_URL", "").rstrip("/") or f"https://{ip}.nip.io"
+
+
 def upload(
     ip: str,
     token: str,
@@ -50,7 +67,7 @@ def upload(
         "json_data": (os.path.basename(json_data), open(json_data, "r"), "application/json"),
     }
 
-    response = requests.post(f"https://{ip}.nip.io/v1/upload", headers=headers, files=files)
+    response = requests.post(f"{get_api_url(ip)}/v1/upload", headers=headers, files=files)
 
     logger.info(f"Uploading file {file} to Data Lake. Response: {response.status_code}")
 
@@ -92,7 +109,7 @@ def replace(
         "json_data": (os.path.basename(json_data), open(json_data, "r"), "application/json"),
     }
 
-    response = requests.put(f"https://{ip}.nip.io/v1/replace", headers=headers, files=files)
+    response = requests.put(f"{get_api_url(ip)}/v1/replace", headers=headers, files=files)
 
     logger.info(f"Replacing file {file} in Data Lake. Response: {response.status_code}")
 
@@ -137,7 +154,7 @@ def update(
         "json_data": (os.path.basename(json_data), open(json_data, "r"), "application/json"),
     }
 
-    response = requests.patch(f"https://{ip}.nip.io/v1/update", headers=headers, data=data, files=files)
+    response = requests.patch(f"{get_api_url(ip)}/v1/update", headers=headers, data=data, files=files)
 
     logger.info(f"Updating metadata for file {file} in Data Lake. Response: {response.status_code}")
 
@@ -172,7 +189,7 @@ def download(
         "Authorization": f"Bearer {token}",
     }
 
-    response = requests.get(f"https://{ip}.nip.io/v1/download", headers=headers, params={"file_name": file})
+    response = requests.get(f"{get_api_url(ip)}/v1/download", headers=headers, params={"file_name": file})
 
     logger.info(f"Downloading file {file} from Data Lake. Response: {response.status_code}")
 
@@ -210,7 +227,7 @@ def delete(
         "Authorization": f"Bearer {token}",
     }
 
-    response = requests.delete(f"https://{ip}.nip.io/v1/delete", headers=headers, params={"file_name": file})
+    response = requests.delete(f"{get_api_url(ip)}/v1/delete", headers=headers, params={"file_name": file})
 
     logger.info(f"Deleting file {file} from Data Lake. Response: {response.status_code}")
 
@@ -261,7 +278,7 @@ def query_python(
         }
 
     response = requests.post(
-        f"https://{ip}.nip.io/v1/query_and_process",
+        f"{get_api_url(ip)}/v1/query_and_process",
         headers=headers,
         files=files,
         data={"config_json": json.dumps(config_json)},
@@ -331,7 +348,7 @@ def query_container(
         }
 
     response = requests.post(
-        f"https://{ip}.nip.io/v1/launch_container",
+        f"{get_api_url(ip)}/v1/launch_container",
         headers=headers,
         files=files,
         data={"config_json": json.dumps(config_json), "exec_command": exec_command, "container_url": container_url},
@@ -372,7 +389,7 @@ def browse(
     token = token.rstrip("\n")
     headers = {"Authorization": f"Bearer {token}"}
 
-    response = requests.get(f"https://{ip}.nip.io/v1/browse_files", headers=headers, params={"filter": filter})
+    response = requests.get(f"{get_api_url(ip)}/v1/browse_files", headers=headers, params={"filter": filter})
 
     logger.info(f"Bwowsing files in from Data Lake. Filter: {filter}. Response: {response.status_code}")
 
@@ -404,7 +421,7 @@ def job_status(
     token = token.rstrip("\n")
     headers = {"Authorization": f"Bearer {token}"}
 
-    response = requests.get(f"https://{ip}.nip.io/v1/job_status", headers=headers, params={"hpc_ip": hpc_ip})
+    response = requests.get(f"{get_api_url(ip)}/v1/job_status", headers=headers, params={"hpc_ip": hpc_ip})
 
     logger.info(f"Checking job status on HPC. User: {filter}. Response: {response.status_code}")
 
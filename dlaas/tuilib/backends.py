@@ -0,0 +1,394 @@
+"""
+Execution backends used by dl_tui_server to run commands and copy files on HPC: real SSH/scp (default), the local
+shell (when the server runs on the cluster itself), and an in-process simulation of a Slurm cluster, with configurable
+sbatch latency, queue delays and failure rates, for testing and load-testing the submission offline. Also, the pool of
+workers and the resource limits for the small jobs run on the server node itself, without Slurm.
+
+Author: @lbabetto
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+import os
+import re
+import fcntl
+import shlex
+import random
+import shutil
+import threading
+import subprocess
+from time import sleep, time
+from contextlib import contextmanager
+
+
+class Backend:
+    """Interface of the execution backends: the commands are shell commands to be run on the HPC login node (e.g.
+    `cd $SCRATCH/<job_id>; sbatch ...`), paths on HPC may contain environment variables (e.g. $SCRATCH)"""
+
+    name = ""
+
+    def run(self, command: str, host: str = "") -> tuple[str, str]:
+        """Run a shell command on HPC
+
+        Parameters
+        ----------
+        command : str
+            shell command
+        host : str, optional
+            login node on which the command is run, the configured host by default
+
+        Returns
+        -------
+        tuple[str, str]
+            stdout and stderr of the command
+        """
+        raise NotImplementedError
+
+    def copy(self, source: str, destination: str) -> tuple[str, str]:
+        """Copy a local file to HPC
+
+        Parameters
+        ----------
+        source : str
+            path of the local file
+        destination : str
+            path on HPC
+
+        Returns
+        -------
+        tuple[str, str]
+            stdout and stderr of the copy
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def shell(command: str) -> tuple[str, str]:
+        """Run a command in the local shell, returning its decoded stdout and stderr"""
+        stdout, stderr = subprocess.Popen(
+            command,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        ).communicate()
+        return str(stdout, encoding="utf-8"), str(stderr, encoding="utf-8")
+
+
+class SSHBackend(Backend):
+    """Backend running the commands via ssh and copying the files via scp
+
+    Attributes
+    ----------
+    user : str
+        user name on HPC
+    host : str
+        login node
+    ssh_key : str
+        path of the SSH private key
+    """
+
+    name = "ssh"
+
+    def __init__(self, user: str, host: str, ssh_key: str) -> None:
+        """Initialization for SSHBackend class"""
+        self.user = user
+        self.host = host
+        self.ssh_key = ssh_key
+
+    def run(self, command: str, host: str = "") -> tuple[str, str]:
+        ssh_cmd = f"ssh -i {self.ssh_key} {self.user}@{host or self.host} {shlex.quote(command)}"
+        logger.debug(f"launching command: {ssh_cmd}")
+        return self.shell(ssh_cmd)
+
+    def copy(self, source: str, destination: str) -> tuple[str, str]:
+        # the destination is quoted, so that environment variables are expanded on HPC
+        scp_cmd = f"scp -i {self.ssh_key} {shlex.quote(source)} {self.user}@{self.host}:{shlex.quote(destination)}"
+        logger.debug(f"launching command: {scp_cmd}")
+        return self.shell(scp_cmd)
+
+
+class LocalBackend(Backend):
+    """Backend running the commands in the local shell, for servers running on a login node of the cluster"""
+
+    name = "local"
+
+    def run(self, command: str, host: str = "") -> tuple[str, str]:
+        logger.debug(f"launching command: {command}")
+        return self.shell(command)
+
+    def copy(self, source: str, destination: str) -> tuple[str, str]:
+        destination = os.path.expanduser(os.path.expandvars(destination))
+        logger.debug(f"copying {source} to {destination}")
+        try:
+            shutil.copy(source, destination)
+        except OSError as e:
+            return "", f"cp: {e}\n"
+        return "", ""
+
+
+class SimulatedSlurmBackend(Backend):
+    """In-process simulation of a Slurm cluster: commands are not run, but interpreted. Directories created with mkdir
+    and copied files are tracked (creating a directory twice fails, as on HPC); sbatch submissions take a random
+    time (exponentially distributed around the configured latency), fail with the configured probability and are
+    otherwise assigned an incremental job ID; each job waits in queue for a random time (exponentially distributed
+    around the configured delay) after its dependency, if any, and then runs for the configured time. The state of
+    the jobs is reported by sacct/squeue in the same format as Slurm. The simulation is shared by the whole process
+    (see SIMULATED_SLURM), so that consecutive submission steps see the same cluster.
+
+    Attributes
+    ----------
+    sbatch_latency : float
+        mean duration of an sbatch call, in seconds
+    copy_latency : float
+        mean duration of a file copy or of any other command, in seconds
+    queue_delay : float
+        mean queue wait of the jobs, in seconds
+    run_time : float
+        run time of the jobs, in seconds
+    failure_rate : float
+        probability of an sbatch call failing
+    """
+
+    name = "simulated"
+
+    SBATCH_ERROR = "sbatch: error: Batch job submission failed: Socket timed out on send/recv operation\n"
+
+    def __init__(self) -> None:
+        """Initialization for SimulatedSlurmBackend class"""
+        self.lock = threading.Lock()
+        self.configure()
+
+    def configure(
+        self,
+        sbatch_latency: float = 0,
+        copy_latency: float = 0,
+        queue_delay: float = 0,
+        run_time: float = 0,
+        failure_rate: float = 0,
+        seed: int = None,
+    ) -> None:
+        """Set the parameters of the simulation, forgetting all the directories, files and jobs
+
+        Parameters
+        ----------
+        sbatch_latency : float, optional
+            mean duration of an sbatch call, in seconds, 0 by default
+        copy_latency : float, optional
+            mean duration of a file copy or of any other command, in seconds, 0 by default
+        queue_delay : float, optional
+            mean queue wait of the jobs, in seconds, 0 by default
+        run_time : float, optional
+            run time of the jobs, in seconds, 0 by default
+        failure_rate : float, optional
+            probability of an sbatch call failing, 0 by default
+        seed : int, optional
+            seed of the random generator, for reproducible simulations
+        """
+        with self.lock:
+            self.sbatch_latency = float(sbatch_latency)
+            self.copy_latency = float(copy_latency)
+            self.queue_delay = float(queue_delay)
+            self.run_time = float(run_time)
+            self.failure_rate = float(failure_rate)
+            self.random = random.Random(seed)
+            self.directories = set()
+            self.files = set()
+            self.jobs = {}
+            self.next_job_id = 1
+
+    def wait(self, mean: float) -> None:
+        """Sleep for a random time, exponentially distributed around the given mean"""
+        if mean > 0:
+            with self.lock:
+                duration = self.random.expovariate(1 / mean)
+            sleep(duration)
+
+    def get_state(self, job: dict[str, float], now: float) -> tuple[str, float, float]:
+        """Return state, start and end time of a job at the given time"""
+        start = job["submit"] + job["queue"]
+        dependency = self.jobs.get(job["dependency"])
+        if dependency is not None:
+            state, _, end = self.get_state(dependency, now)
+            if state == "FAILED":
+                return "CANCELLED", 0, 0
+            if state != "COMPLETED":
+                return "PENDING", 0, 0
+            start = max(start, end + job["queue"])
+        if now < start:
+            return "PENDING", 0, 0
+        if now < start + self.run_time:
+            return "RUNNING", start, 0
+        return "COMPLETED", start, start + self.run_time
+
+    def sbatch(self, command: str) -> tuple[str, str]:
+        self.wait(self.sbatch_latency)
+        with self.lock:
+            if self.random.random() < self.failure_rate:
+                return "", self.SBATCH_ERROR
+            job_id = self.next_job_id
+            self.next_job_id += 1
+            dependency = re.search(r"-d afterok:(\d+)", command)
+            self.jobs[job_id] = {
+                "submit": time(),
+                "queue": self.random.expovariate(1 / self.queue_delay) if self.queue_delay > 0 else 0,
+                "dependency": int(dependency.group(1)) if dependency else None,
+            }
+        return f"Submitted batch job {job_id}\n", ""
+
+    def report(self, states: list[str]) -> str:
+        """Return the jobs in the given states, in the pipe-separated format of sacct -P/squeue --format=%all"""
+        now = time()
+        lines = ["JobID|State|Submit|Start|End|Dependency"]
+        with self.lock:
+            for job_id, job in self.jobs.items():
+                state, start, end = self.get_state(job, now)
+                if state in states:
+                    dependency = f"afterok:{job['dependency']}" if job["dependency"] else ""
+                    lines.append(f"{job_id}|{state}|{job['submit']:.0f}|{start:.0f}|{end:.0f}|{dependency}")
+        return "\n".join(lines) + "\n"
+
+    def run(self, command: str, host: str = "") -> tuple[str, str]:
+        logger.debug(f"simulating command: {command}")
+
+        if "sbatch " in command:
+            return self.sbatch(command)
+
+        self.wait(self.copy_latency)
+        if command.startswith("mkdir "):
+            path = command.split()[-1]
+            with self.lock:
+                if path in self.directories:
+                    return "", f"mkdir: cannot create directory '{path}': File exists\n"
+                self.directories.add(path)
+        elif command.startswith("sacct"):
+            return self.report(["COMPLETED", "FAILED", "CANCELLED"]), ""
+        elif command.startswith("squeue"):
+            return self.report(["PENDING", "RUNNING"]), ""
+        return "", ""
+
+    def copy(self, source: str, destination: str) -> tuple[str, str]:
+        logger.debug(f"simulating copy of {source} to {destination}")
+        self.wait(self.copy_latency)
+        with self.lock:
+            if os.path.dirname(destination) not in self.directories:
+                return "", f"scp: {destination}: No such file or directory\n"
+            self.files.add(destination)
+        return "", ""
+
+
+# simulated cluster of the current process
+SIMULATED_SLURM = SimulatedSlurmBackend()
+
+BACKENDS = ["ssh", "local", "simulated"]
+
+
+def get_backend(config) -> Backend:
+    """Return the execution backend selected by the `backend` option of the server configuration
+
+    Parameters
+    ----------
+    config : Config
+        server configuration
+
+    Returns
+    -------
+    Backend
+        execution backend
+
+    Raises
+    ------
+    ValueError
+        if the backend is not supported
+    """
+
+    name = getattr(config, "backend", "ssh")
+    if name == "ssh":
+        return SSHBackend(user=config.user, host=config.host, ssh_key=config.ssh_key)
+    if name == "local":
+        return LocalBackend()
+    if name == "simulated":
+        return SIMULATED_SLURM
+    raise ValueError(f"Unsupported backend: {name}. Supported backends: {', '.join(BACKENDS)}")
+
+
+class LocalWorkerPool:
+    """Pool of workers for running jobs on the server node. Each worker is a lock file, so that the limit on the
+    concurrent jobs holds across the dl_tui_server processes; a job gets a worker only if one is free, otherwise it is
+    expected to be submitted to Slurm.
+
+    Attributes
+    ----------
+    directory : str
+        folder containing the lock files
+    workers : int
+        number of workers
+    """
+
+    def __init__(self, directory: str, workers: int) -> None:
+        """Initialization for LocalWorkerPool class"""
+        self.directory = directory
+        self.workers = int(workers)
+
+    @contextmanager
+    def worker(self):
+        """Context manager holding a free worker for the duration of the job
+
+        Yields
+        ------
+        int
+            index of the worker, None if all the workers are busy
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+        for index in range(self.workers):
+            with open(os.path.join(self.directory, f"worker_{index}.lock"), "w") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:  # busy
+                    continue
+                yield index
+                return
+        yield None
+
+
+def sandbox_command(
+    command: list[str], cpu_seconds: int = 0, memory_mb: int = 0, niceness: int = 10, user: str = ""
+) -> list[str]:
+    """Wrap the command of a sandboxed job so that it runs with resource limits: CPU time and address space are
+    capped with ulimit, and the job runs at lower priority than the server, in a shell which then replaces itself with
+    the job (the limits are applied by the wrapper, not in the server process, which may be running threads).
+    Optionally, the job runs as a separate (unprivileged) user, through sudo.
+
+    Parameters
+    ----------
+    command : list[str]
+        command of the job
+    cpu_seconds : int, optional
+        maximum CPU time, in seconds (the job is killed when exceeded), no limit if 0 (default)
+    memory_mb : int, optional
+        maximum address space, in MB (allocations fail when exceeded), no limit if 0 (default)
+    niceness : int, optional
+        increment of the niceness of the job, 10 by default
+    user : str, optional
+        if provided, user running the job (the server user must be allowed to run commands as this user with sudo,
+        without password)
+
+    Returns
+    -------
+    list[str]
+        wrapped command
+    """
+
+    limits = []
+    if int(cpu_seconds):
+        limits.append(f"ulimit -t {int(cpu_seconds)}")
+    if int(memory_mb):
+        limits.append(f"ulimit -v {int(memory_mb) * 1024}")
+    script = "; ".join(limits + [f'exec nice -n {int(niceness)} "$@"'])
+
+    wrapped = ["sh", "-c", script, "sh"] + list(command)
+    if user:
+        wrapped = ["sudo", "-n", "-H", "-u", user, "--"] + wrapped
+
+    return wrapped
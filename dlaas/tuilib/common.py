@@ -10,8 +10,239 @@ logger = logging.getLogger(__name__)
 
 import os
 import sys
+import ast
+import copy
 import json
 import re
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:  # faster JSON decoding is optional, install with `pip install dl_tui[orjson]`
+    orjson = None
+
+# expected format of each configuration keyword, as a list of alternative regular expressions (full match)
+KEYWORD_FORMATS = {
+    "version": ["server", "hpc"],
+    ###############
+    #  config_hpc #
+    ###############
+    "user": [r"[a-zA-Z0-9_-]+"],  # any single word (word: character sequence containing alphanumerics or _)
+    "password": [r"[a-zA-Z0-9_-]+"],  # any single word
+    "ip": [
+        r"[a-zA-Z0-9_\.-]+[a-zA-Z0-9_-]+"
+    ],  # any word sequence (with - and _) optionally delimited by dots, but not ending with one
+    "port": [r"[0-9]+"],  # any number
+    "database": [r"[a-zA-Z0-9_-]+"],  # any single word
+    "collection": [r"[a-zA-Z0-9_-]+"],  # any single word
+    "s3_endpoint_url": [
+        r"(https?:\/\/)?([a-zA-Z0-9_-]+\.)+[a-zA-Z0-9_-]+(:[0-9]+)?\/?"
+    ],  # "https://XXX.(XXX.)*n.XXX:XXXX/",
+    "s3_bucket": [r"[a-zA-Z0-9_-]+"],  # any single word
+    "pfs_prefix_path": [r"\/([a-zA-Z0-9_-]+\/?)+"],  # any word sequence (no .) delimited by slashes, starting with /
+    "omp_num_threads": [r"[0-9]+"],  # any number,
+    "mpi_np": [r"[0-9]+"],  # any number,
+    "modules": [r"\[('([a-zA-Z0-9_.-]+\/?)+',? ?)*\]"],  # list of module names, delmited by commas
+    "stage_inputs": [r"(true|false|True|False|0|1)"],  # boolean
+    "staging_workers": [r"[0-9]+"],  # any number
+    "staging_shard_size": [r"[0-9]+"],  # any number
+    "output_layout": [r"archive", r"objects"],  # supported output layouts
+    "archive_format": [r"zip", r"store", r"tar\.zst"],  # supported archive formats
+    "archive_streaming": [r"(true|false|True|False|0|1)"],  # boolean
+    "compress_level": [r"[0-9]+"],  # any number
+    "archive_threads": [r"[0-9]+"],  # any number
+    "s3_multipart_threshold": [r"[0-9]+"],  # any number
+    "s3_multipart_chunksize": [r"[0-9]+"],  # any number
+    "s3_max_concurrency": [r"[0-9]+"],  # any number
+    "s3_use_threads": [r"(true|false|True|False|0|1)"],  # boolean
+    "s3_max_attempts": [r"[0-9]+"],  # any number
+    "query_cache_size": [r"[0-9]+"],  # any number
+    "query_cache_path": [r"((~)?\/([a-zA-Z0-9_.-]+\/?)+)?"],  # empty, or any path starting with ~ or /
+    "query_cache_parameterize": [r"(true|false|True|False|0|1)"],  # boolean
+    "size_field": [r"[a-zA-Z0-9_.-]+"],  # any single word, possibly a dotted path
+    "explain_queries": [r"(true|false|True|False|0|1)"],  # boolean
+    "profile_jobs": [r"(true|false|True|False|0|1)"],  # boolean
+    "mongo_max_pool_size": [r"[0-9]+"],  # any number
+    "mongo_min_pool_size": [r"[0-9]+"],  # any number
+    "mongo_max_idle_time_ms": [r"[0-9]+"],  # any number
+    "mongo_server_selection_timeout_ms": [r"[0-9]+"],  # any number
+    "mongo_connect_timeout_ms": [r"[0-9]+"],  # any number
+    "mongo_socket_timeout_ms": [r"[0-9]+"],  # any number
+    "mongo_compressors": [r"((zstd|snappy|zlib)(,(zstd|snappy|zlib))*)?"],  # comma-separated compressors, or empty
+    "mongo_read_preference": [
+        r"primary",
+        r"primaryPreferred",
+        r"secondary",
+        r"secondaryPreferred",
+        r"nearest",
+    ],  # supported read preference modes
+    "mongo_read_uri": [r"(mongodb(\+srv)?:\/\/\S+)?"],  # empty, or MongoDB connection string
+    "incremental_from": [r"([a-zA-Z0-9_-]+)?"],  # empty, or any single word (job identifier)
+    "incremental_overlap": [r"[0-9]+"],  # any number
+    "query_read_preference": [
+        r"primary",
+        r"primaryPreferred",
+        r"secondary",
+        r"secondaryPreferred",
+        r"nearest",
+    ],  # supported read preference modes
+    "log_format": [r"json", r"text"],  # supported log formats (same for config_server)
+    "log_max_bytes": [r"[0-9]+"],  # any number (same for config_server)
+    "log_backup_count": [r"[0-9]+"],  # any number (same for config_server)
+    "log_max_length": [r"[0-9]+"],  # any number (same for config_server)
+    "trace_dir": [r"(\/([a-zA-Z0-9_.-]+\/?)+)?"],  # empty, or path starting with / (same for config_server)
+    "metrics_dir": [r"(\/([a-zA-Z0-9_.-]+\/?)+)?"],  # empty, or any word sequence delimited by slashes, starting with /
+    #################
+    # config_server #
+    #################
+    # "user": same format as in config_hpc
+    "host": [
+        r"[a-zA-Z0-9_\.-]+[a-zA-Z0-9_-]+"
+    ],  # any word sequence (with - and _) optionally delimited by dots, but not ending with one
+    "venv_path": [r"^(~)?\/([a-zA-Z0-9_.-]+\/?)+"],  # any word sequence delimited by slashes, can start with ~ or /
+    "ssh_key": [r"^(~)?\/([a-zA-Z0-9_.-]+\/?)+"],  # any word sequence delimited by slashes, can start with ~ or /
+    "compute_partition": [r"[a-zA-Z0-9_-]+"],  # any single word,
+    "upload_partition": [r"[a-zA-Z0-9_-]+"],  # any single word
+    "account": [r"[a-zA-Z0-9_-]+"],  # any single word
+    "qos": [r"[a-zA-Z0-9_-]+"],  # any single word
+    "mail": [r"[a-zA-Z0-9_\.]+@[a-zA-Z0-9_\.]+"],  # any valid email type (no dashes or pluses)
+    "walltime": [r"([0-9]+-)?([0-9]+:)?([0-9]+:)?[0-9]+"],  # DD-HH:MM:SS
+    "nodes": [r"[0-9]+(k|m)?"],  # any number, possibly ending with k or m
+    "tasks_per_node": [r"[0-9]+"],  # any number
+    "cpus_per_task": [r"[0-9]+"],  # any number
+    "gpus": [r"[0-9]+"],  # any number
+    "inline_upload": [r"(true|false|True|False|0|1)"],  # boolean
+    "preflight": [r"(true|false|True|False|0|1)"],  # boolean
+    "max_matches": [r"[0-9]+"],  # any number
+    "max_result_size": [r"[0-9]+(\.[0-9]+)?"],  # any number, possibly decimal
+    "auto_resources": [r"(true|false|True|False|0|1)"],  # boolean
+    "files_per_node": [r"[1-9][0-9]*"],  # any positive number
+    "seconds_per_file": [r"[0-9]+(\.[0-9]+)?"],  # any number, possibly decimal
+    "max_nodes": [r"[1-9][0-9]*"],  # any positive number
+    "max_walltime": [r"([0-9]+-)?([0-9]+:)?([0-9]+:)?[0-9]+"],  # DD-HH:MM:SS
+    "job_cache": [r"(true|false|True|False|0|1)"],  # boolean
+    "metrics_path": [
+        r"(\/([a-zA-Z0-9_.-]+\/?)+)?"
+    ],  # empty, or any word sequence delimited by slashes, starting with /
+    "backend": [r"ssh", r"local", r"simulated"],  # supported execution backends (see backends.py)
+    "local_max_matches": [r"[0-9]+"],  # any number
+    "local_workers": [r"[0-9]+"],  # any number
+    "local_timeout": [r"[0-9]+"],  # any number
+    "local_memory": [r"[0-9]+"],  # any number
+    "local_dir": [r"((~)?\/([a-zA-Z0-9_.-]+\/?)+)?"],  # empty, or any path starting with ~ or /
+    "local_user": [r"([a-zA-Z0-9_-]+)?"],  # empty, or any single word (user name)
+    "debug": [r"[a-zA-Z0-9_-]+"],  # any single word
+}
+
+
+# keywords which can only be set by the operator (default or user configuration files), and are refused in the custom
+# configuration of a job, since they control what runs on the server node and how, and which files are written
+OPERATOR_KEYWORDS = {
+    "backend",
+    "query_cache_path",
+    "metrics_dir",
+    "metrics_path",
+    "trace_dir",
+    "local_max_matches",
+    "local_workers",
+    "local_timeout",
+    "local_memory",
+    "local_dir",
+    "local_user",
+}
+
+# keywords converted to int after validation
+INTEGER_KEYWORDS = {
+    "port",
+    "omp_num_threads",
+    "mpi_np",
+    "staging_workers",
+    "staging_shard_size",
+    "compress_level",
+    "archive_threads",
+    "s3_multipart_threshold",
+    "s3_multipart_chunksize",
+    "s3_max_concurrency",
+    "s3_max_attempts",
+    "query_cache_size",
+    "mongo_max_pool_size",
+    "mongo_min_pool_size",
+    "mongo_max_idle_time_ms",
+    "mongo_server_selection_timeout_ms",
+    "mongo_connect_timeout_ms",
+    "mongo_socket_timeout_ms",
+    "incremental_overlap",
+    "log_max_bytes",
+    "log_backup_count",
+    "log_max_length",
+    "nodes",  # unless a k/m suffix is used
+    "tasks_per_node",
+    "cpus_per_task",
+    "gpus",
+    "max_matches",
+    "files_per_node",
+    "max_nodes",
+    "local_max_matches",
+    "local_workers",
+    "local_timeout",
+    "local_memory",
+}
+
+# patterns are compiled once, at import
+COMPILED_FORMATS = {
+    key: tuple(re.compile(pattern) for pattern in patterns) for key, patterns in KEYWORD_FORMATS.items()
+}
+
+
+@lru_cache(maxsize=4096)
+def check_format(key: str, value: str) -> None:
+    """Check that the value of a keyword matches the expected format. Successful checks are memoized, so that
+    configurations which are validated multiple times (e.g. at each Config construction) are only matched once;
+    failed checks always raise.
+
+    Parameters
+    ----------
+    key : str
+        configuration keyword
+    value : str
+        value of the keyword, as a string
+
+    Raises
+    ------
+    SyntaxError
+        if the value does not match the expected format
+    KeyError
+        if the keyword is unknown
+    """
+
+    for pattern in COMPILED_FORMATS[key]:
+        if pattern.fullmatch(value):
+            return
+    raise SyntaxError(f"Unexpected format for keyword '{key}': {value}")
+
+
+def coerce_value(key: str, value):
+    """Convert the (already validated) value of a keyword to its type: integer keywords given as strings (e.g. in a
+    custom configuration) are converted to int, other values are returned as they are
+
+    Parameters
+    ----------
+    key : str
+        configuration keyword
+    value : Any
+        value of the keyword
+
+    Returns
+    -------
+    Any
+        converted value
+    """
+
+    if key in INTEGER_KEYWORDS and isinstance(value, str) and value.isdigit():
+        return int(value)
+    return value
 
 
 def sanitize_dictionary(dictionary: dict[str, str]) -> None:
@@ -19,6 +250,7 @@ def sanitize_dictionary(dictionary: dict[str, str]) -> None:
     be used on the self.__dict__ dictionary of Config("server") or Config("hpc") instances.
     For each keyword it performs a regex match to ensure the expected format is found, for example the
     value of the keyword "walltime" must be something like DD-HH:MM:SS, or HH:MM:SS, or MM:SS.
+    Integer keywords (see INTEGER_KEYWORDS) are converted to int in place.
 
     Parameters
     ----------
@@ -31,63 +263,120 @@ def sanitize_dictionary(dictionary: dict[str, str]) -> None:
         if any keyword does not match the expected regex format, raise exception and stop code execution.
     """
 
-    keyword_formats = {
-        "version": ["server", "hpc"],
-        ###############
-        #  config_hpc #
-        ###############
-        "user": [r"[a-zA-Z0-9_-]+"],  # any single word (word: character sequence containing alphanumerics or _)
-        "password": [r"[a-zA-Z0-9_-]+"],  # any single word
-        "ip": [
-            r"[a-zA-Z0-9_\.-]+[a-zA-Z0-9_-]+"
-        ],  # any word sequence (with - and _) optionally delimited by dots, but not ending with one
-        "port": [r"[0-9]+"],  # any number
-        "database": [r"[a-zA-Z0-9_-]+"],  # any single word
-        "collection": [r"[a-zA-Z0-9_-]+"],  # any single word
-        "s3_endpoint_url": [
-            r"(https?:\/\/)?([a-zA-Z0-9_-]+\.)+[a-zA-Z0-9_-]+(:[0-9]+)?\/?"
-        ],  # "https://XXX.(XXX.)*n.XXX:XXXX/",
-        "s3_bucket": [r"[a-zA-Z0-9_-]+"],  # any single word
-        "pfs_prefix_path": [
-            r"\/([a-zA-Z0-9_-]+\/?)+"
-        ],  # any word sequence (no .) delimited by slashes, starting with /
-        "omp_num_threads": [r"[0-9]+"],  # any number,
-        "mpi_np": [r"[0-9]+"],  # any number,
-        "modules": [r"\[('([a-zA-Z0-9_.-]+\/?)+',? ?)*\]"],  # list of module names, delmited by commas
-        #################
-        # config_server #
-        #################
-        "user": [r"[a-zA-Z0-9_-]+"],  # any single word (word: character sequence containing alphanumerics or _)
-        "host": [
-            r"[a-zA-Z0-9_\.-]+[a-zA-Z0-9_-]+"
-        ],  # any word sequence (with - and _) optionally delimited by dots, but not ending with one
-        "venv_path": [r"^(~)?\/([a-zA-Z0-9_.-]+\/?)+"],  # any word sequence delimited by slashes, can start with ~ or /
-        "ssh_key": [r"^(~)?\/([a-zA-Z0-9_.-]+\/?)+"],  # any word sequence delimited by slashes, can start with ~ or /
-        "compute_partition": [r"[a-zA-Z0-9_-]+"],  # any single word,
-        "upload_partition": [r"[a-zA-Z0-9_-]+"],  # any single word
-        "account": [r"[a-zA-Z0-9_-]+"],  # any single word
-        "qos": [r"[a-zA-Z0-9_-]+"],  # any single word
-        "mail": [r"[a-zA-Z0-9_\.]+@[a-zA-Z0-9_\.]+"],  # any valid email type (no dashes or pluses)
-        "walltime": [r"([0-9]+-)?([0-9]+:)?([0-9]+:)?[0-9]+"],  # DD-HH:MM:SS
-        "nodes": [r"[0-9]+(k|m)?"],  # any number, possibly ending with k or m
-        "tasks_per_node": [r"[0-9]+"],  # any number
-        "cpus_per_task": [r"[0-9]+"],  # any number
-        "gpus": [r"[0-9]+"],  # any number
-        "debug": [r"[a-zA-Z0-9_-]+"],  # any single word
-    }
-
     # make sure keyword values match the expected format
     for key, value in dictionary.items():
-        for pattern in keyword_formats[key]:
-            match = re.fullmatch(pattern, str(value))
-            if match:
-                break
-        else:
-            raise SyntaxError(f"Unexpected format for keyword '{key}': {value}")
+        check_format(key, str(value))
+        dictionary[key] = coerce_value(key, value)
+
+
+def check_custom_keys(custom_config: dict[str, str]) -> None:
+    """Check that a custom configuration does not set any operator-only keyword (see OPERATOR_KEYWORDS)
+
+    Parameters
+    ----------
+    custom_config : dict[str, str]
+        custom configuration of a job
+
+    Raises
+    ------
+    KeyError
+        if an operator-only keyword is set
+    """
+
+    for key in custom_config:
+        if key in OPERATOR_KEYWORDS:
+            raise KeyError(
+                f"Parameter '{key}' can only be set in the configuration file, not in a custom configuration"
+            )
+
+
+def loads(content: str | bytes):
+    """Decode a JSON document, using orjson if available
+
+    Parameters
+    ----------
+    content : str | bytes
+        JSON document
+
+    Returns
+    -------
+    Any
+        decoded content
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def dumps(data) -> str:
+    """Encode data as a (compact) JSON document, using orjson if available
+
+    Parameters
+    ----------
+    data : Any
+        JSON-serializable data
+
+    Returns
+    -------
+    str
+        JSON document
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data).decode()
+        except TypeError:  # e.g. non-string keys, let the standard library deal with them
+            pass
+    return json.dumps(data, separators=(",", ":"))
+
+
+# parsed configuration files, keyed by path: (inode, mtime, size) signature and content
+_CONFIG_FILES = {}
+_CONFIG_FILES_LOCK = threading.Lock()
+
+
+def load_config_file(path: str) -> dict[str, str]:
+    """Read a JSON configuration file, parsing it only once per process: the content is cached and re-read only if
+    the file changes (different inode, modification time or size). A copy is returned, so that it can be modified
+    (e.g. by custom options) without affecting the cache.
+
+    Parameters
+    ----------
+    path : str
+        path to the JSON configuration file
+
+    Returns
+    -------
+    dict[str, str]
+        content of the file, None if the file does not exist
+    """
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    with _CONFIG_FILES_LOCK:
+        cached = _CONFIG_FILES.get(path)
+        if cached is None or cached[0] != signature:
+            with open(path, "r") as f:
+                cached = (signature, json.load(f))
+            _CONFIG_FILES[path] = cached
+            logger.debug(f"Loaded configuration file {path}")
+
+    # configuration values are flat (at most lists of strings), a shallow copy of each value is enough
+    return {key: copy.copy(value) if isinstance(value, (list, dict)) else value for key, value in cached[1].items()}
+
+
+# user input files decoded by the current process, keyed by path (least recently used ones are evicted)
+_INPUT_FILES = OrderedDict()
+_INPUT_FILES_LOCK = threading.Lock()
+_INPUT_FILES_MAXSIZE = 128
 
 
 class UserInput:
-    """Class containing command-line input arguments passed as JSON-formatted dictionary
+    """Class containing command-line input arguments passed as JSON-formatted dictionary. The accepted keys are
+    listed in FIELDS (id and sql_query are required), unknown keys are rejected.
 
     Attributes
     ----------
@@ -107,61 +396,128 @@ class UserInput:
         dictionary with custom configuration options for hpc version
     config_server : dict
         dictionary with custom configuration options for server version
+    query_filters : dict
+        filters (WHERE) of the SQL query in MongoDB spec, if already translated by the server
+    query_fields : dict
+        fields (SELECT) of the SQL query in MongoDB spec, if already translated by the server
+    job_hash : str
+        content hash of the job (query, script/container, custom config), if computed by the server for the job cache
     """
 
+    REQUIRED = ("id", "sql_query")
+    FIELDS = REQUIRED + (
+        "script_path",
+        "container_path",
+        "container_url",
+        "exec_command",
+        "config_hpc",
+        "config_server",
+        "query_filters",
+        "query_fields",
+        "job_hash",
+    )
+    # keys added by the server (see server.validate_query and server.lookup_job_cache), never taken from the user
+    INTERNAL = ("query_filters", "query_fields", "job_hash")
+
+    __slots__ = FIELDS
+
     def __init__(self, data: dict[str, str]) -> None:
-        """_summary_
+        """Initialization for UserInput class
+
+        Parameters
+        ----------
+        data : dict[str, str]
+            dictionary with the user input (id, sql_query, script, config)
 
-        Args:
-            data (dict[str, str]): dictionary with the user input (id, sql_query, script, config)
+        Raises
+        ------
+        KeyError
+            if a required key is missing or an unknown key is provided, or if the custom configuration sets an
+            operator-only keyword (see OPERATOR_KEYWORDS)
+        TypeError
+            if the custom configuration is not a dictionary
         """
-        logger.debug(f"Received input dict: {data}")
+        logger.debug("Received input dict: %s", data)
 
-        self.id = data["id"]
-        self.sql_query = data["sql_query"]
+        for key in self.REQUIRED:
+            if key not in data:
+                raise KeyError(f"Missing required key in user input: '{key}'")
 
-        try:
-            self.script_path = data["script_path"]
-        except KeyError:  # no script provided
-            self.script_path = None
+        for key in data:
+            if key not in self.FIELDS:
+                raise KeyError(f"Unknown key in user input: '{key}'")
 
-        try:
-            self.container_path = data["container_path"]
-        except KeyError:  # no container provided
-            self.container_path = None
+        for key in self.FIELDS:
+            setattr(self, key, data.get(key))
 
-        try:
-            self.container_url = data["container_url"]
-        except KeyError:  # no container provided
-            self.container_url = None
+        # custom config can be passed as a JSON-formatted string (possibly with single quotes, from the CLI)
+        self.config_hpc = self.decode_config(self.config_hpc)
+        self.config_server = self.decode_config(self.config_server)
+        for config in [self.config_hpc, self.config_server]:
+            check_custom_keys(config or {})
 
-        try:
-            self.exec_command = data["exec_command"]
-        except KeyError:  # no script provided
-            self.exec_command = None
+        logger.debug("UserInput: %r", self)
 
-        try:
-            self.config_hpc = json.loads(data["config_hpc"].replace("'", '"'))
-        except KeyError:  # no custom config provided
-            self.config_hpc = None
-        except AttributeError:  # config was initialized manually
-            self.config_hpc = data["config_hpc"]
+    @staticmethod
+    def decode_config(config: dict[str, str] | str) -> dict[str, str]:
+        """Decode a custom configuration passed as a JSON-formatted string
 
-        try:
-            self.config_server = json.loads(data["config_server"].replace("'", '"'))
-        except KeyError:  # no custom config provided
-            self.config_server = None
-        except AttributeError:  # config was initialized manually
-            self.config_server = data["config_server"]
-
-        logger.debug(f"UserInput.id: {self.id}")
-        logger.debug(f"UserInput.sql_query: {self.sql_query}")
-        logger.debug(f"UserInput.script_path: {self.script_path}")
-        logger.debug(f"UserInput.container_path: {self.container_path}")
-        logger.debug(f"UserInput.container_url: {self.container_url}")
-        logger.debug(f"UserInput.exec_command: {self.exec_command}")
-        logger.debug(f"UserInput.config_hpc: {self.config_hpc}")
-        logger.debug(f"UserInput.config_server: {self.config_server}")
+        Parameters
+        ----------
+        config : dict[str, str] | str
+            custom configuration, as dictionary or JSON-formatted string
+
+        Returns
+        -------
+        dict[str, str]
+            custom configuration, None if not provided
+
+        Raises
+        ------
+        TypeError
+            if the custom configuration is not a dictionary
+        """
+        if isinstance(config, str):
+            try:
+                config = loads(config)
+            except ValueError:  # single-quoted (Python-style) dictionary
+                try:
+                    config = ast.literal_eval(config)
+                except (SyntaxError, ValueError):
+                    raise ValueError(f"Custom configuration is not a valid JSON or Python dictionary: {config}")
+
+        if config is not None and not isinstance(config, dict):
+            raise TypeError(f"Custom configuration must be a dictionary, got {type(config).__name__}")
+
+        return config
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, UserInput):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        return f"UserInput({self.to_dict()})"
+
+    def to_dict(self) -> dict[str, str]:
+        """Return the user input as dictionary, omitting the keys which were not provided
+
+        Returns
+        -------
+        dict[str, str]
+            user input, which can be passed back to the constructor
+        """
+        return {key: getattr(self, key) for key in self.FIELDS if getattr(self, key) is not None}
+
+    def to_json(self) -> str:
+        """Return the user input as (compact) JSON-formatted string, e.g. for passing it to the HPC side
+
+        Returns
+        -------
+        str
+            JSON-formatted user input, which can be passed back to from_dict
+        """
+        return dumps(self.to_dict())
 
     @classmethod
     def from_cli(cls):
@@ -175,13 +531,15 @@ class UserInput:
         """
         user_input = " ".join(sys.argv[1:])
         logger.info(f"Received input from CLI: {user_input}")
-        data = json.loads(user_input)
+        data = loads(user_input)
         return cls(data)
 
     @classmethod
     def from_json(cls, json_path: str):
         """Class constructor from JSON file.
-        Expects the path to a JSON file as command line argument
+        Expects the path to a JSON file as command line argument. The file is decoded only once per process, and
+        again only if it changes (different inode, modification time or size), since the server reads it at each
+        step of the job submission. The last 128 files are kept in memory.
 
         Parameters
         ----------
@@ -202,11 +560,21 @@ class UserInput:
         if not json_path.endswith(".json"):
             raise TypeError("Provided input is not a .json file")
 
-        with open(json_path, "r") as f:
-            data = json.load(f)
-        logger.info(f"Received input from JSON file: {data}")
+        stat = os.stat(json_path)
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
 
-        return cls(data)
+        with _INPUT_FILES_LOCK:
+            cached = _INPUT_FILES.get(json_path)
+            if cached is None or cached[0] != signature:
+                with open(json_path, "rb") as f:
+                    cached = (signature, loads(f.read()))
+                _INPUT_FILES[json_path] = cached
+                logger.info(f"Received input from JSON file: {cached[1]}")
+            _INPUT_FILES.move_to_end(json_path)
+            while len(_INPUT_FILES) > _INPUT_FILES_MAXSIZE:
+                _INPUT_FILES.popitem(last=False)
+
+        return cls(cached[1])
 
     @classmethod
     def from_dict(cls, json_dict: str):
@@ -225,11 +593,50 @@ class UserInput:
 
         """
 
-        data = json.loads(json_dict)
+        data = loads(json_dict)
         logger.info(f"Received input from JSON file: {data}")
 
         return cls(data)
 
+    @classmethod
+    def from_jsonl(cls, jsonl_path: str) -> list:
+        """Class constructor for a batch of jobs, from a JSONL spool file (one JSON-formatted dictionary per line,
+        blank lines are skipped)
+
+        Parameters
+        ----------
+        jsonl_path : str
+            Path to the JSONL file with the input info of each job
+
+        Returns
+        -------
+        list[UserInput]
+            UserInput instances, in the order of the file
+
+        Raises
+        ------
+        TypeError
+            if the user does not provide a .jsonl file
+        """
+
+        if not jsonl_path.endswith(".jsonl"):
+            raise TypeError("Provided input is not a .jsonl file")
+
+        user_inputs = []
+        with open(jsonl_path, "rb") as f:
+            for number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    user_inputs.append(cls(loads(line)))
+                except (KeyError, TypeError, ValueError):
+                    logger.error(f"Invalid user input at line {number} of {jsonl_path}")
+                    raise
+
+        logger.info(f"Received {len(user_inputs)} inputs from JSONL file {jsonl_path}")
+
+        return user_inputs
+
 
 class Config:
     """Class containing configuration info for hpc/server.
@@ -267,6 +674,7 @@ class Config:
     def load_default_config(self, version: str) -> dict[str, str]:
         """Load default configuration as found in /etc/default.
         If present, overwrites these defaults with the contents of ~/.config/dlaas/config_<version>.json.
+        Files are only read once per process, unless they change (see load_config_file).
 
         Parameters
         ----------
@@ -278,13 +686,10 @@ class Config:
         dict[str, str]
             dictionary with the configuration info
         """
-        with open(f"{os.path.dirname(__file__)}/../etc/default/config_{version}.json", "r") as f:
-            base_config: dict[str, str] = json.load(f)
-
-        if os.path.exists(f"{os.environ['HOME']}/.config/dlaas/config_{version}.json"):
-            with open(f"{os.environ['HOME']}/.config/dlaas/config_{version}.json", "r") as f:
-                config: dict[str, str] = json.load(f)
+        base_config = load_config_file(f"{os.path.dirname(__file__)}/../etc/default/config_{version}.json")
 
+        config = load_config_file(f"{os.environ['HOME']}/.config/dlaas/config_{version}.json")
+        if config is not None:
             for key in config:
                 if key not in base_config:
                     raise KeyError(f"Unknown parameter in configuration file: '{key}'")
@@ -296,16 +701,23 @@ class Config:
         return base_config
 
     def load_custom_config(self, custom_config: dict[str, str]):
-        """Overwrites the default configurations with custom options
+        """Overwrites the default configurations with custom options. Operator-only options (see OPERATOR_KEYWORDS)
+        can only be set in the configuration files.
 
         Parameters
         ----------
         custom_config : dict[str, str]
             dictionary containing the settings to overwrite
+
+        Raises
+        ------
+        KeyError
+            if an option is unknown or operator-only
         """
         for key in custom_config:
             if key not in self.__dict__:
                 raise KeyError(f"Unknown parameter in custom configuration: '{key}'")
+        check_custom_keys(custom_config)
         self.__dict__.update(custom_config)
 
         sanitize_dictionary(self.__dict__)
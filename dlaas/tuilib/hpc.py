@@ -13,17 +13,35 @@ import sys
 import subprocess
 import shutil
 from sh import pushd
-from tempfile import mkdtemp
-from datetime import datetime
+from tempfile import mkdtemp, gettempdir
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
 
+from bson import ObjectId
 from pymongo.collection import Collection
 
 from importlib import import_module
 from sqlparse.builders.mongo_builder import MongoQueryBuilder
 
-
-def convert_SQL_to_mongo(sql_query: str) -> tuple[dict[str, str], dict[str, str]]:
-    """Converts SQL query to MongoDB spec
+from dlaas.tuilib.indexes import explain_query
+from dlaas.tuilib.logs import Preview
+from dlaas.tuilib.metrics import record_profile
+from dlaas.tuilib.profiling import JobProfile, get_profile_name
+from dlaas.tuilib.query import QUERY_CACHE, check_query_filters
+from dlaas.tuilib.upload import (
+    UPLOAD_OPTIONS,
+    describe_files,
+    get_archive_name,
+    get_objects_prefix,
+    list_output_files,
+    write_manifest,
+    update_manifest,
+)
+
+
+def parse_SQL(sql_query: str) -> tuple[dict[str, str], dict[str, str]]:
+    """Parses SQL query and builds the corresponding MongoDB spec
 
     Parameters
     ----------
@@ -37,7 +55,6 @@ def convert_SQL_to_mongo(sql_query: str) -> tuple[dict[str, str], dict[str, str]
     """
 
     builder = MongoQueryBuilder()
-    logger.info(f"User query: {sql_query}")
 
     mongo_query = builder.parse_and_build(query_string=sql_query)
     query_filters = mongo_query[0]
@@ -47,16 +64,76 @@ def convert_SQL_to_mongo(sql_query: str) -> tuple[dict[str, str], dict[str, str]
     except KeyError:  # if no fields are present, parser does not add the key
         query_fields = {}
 
+    return query_filters, query_fields  # type: ignore
+
+
+def convert_SQL_to_mongo(sql_query: str) -> tuple[dict[str, str], dict[str, str]]:
+    """Converts SQL query to MongoDB spec. Translations are cached (see query.py), so that repeated queries
+    are not parsed again.
+
+    Parameters
+    ----------
+    sql_query : str
+        SQL query
+
+    Returns
+    -------
+    tuple[dict[str, str], dict[str, str]]
+        dictionaries containing the filters (WHERE) and fields (SELECT) in MongoDB spec
+    """
+
+    logger.info(f"User query: {sql_query}")
+
+    query_filters, query_fields = QUERY_CACHE.translate(sql_query=sql_query, parse=parse_SQL)
+
     logger.info(f"MongoDB query filter: {query_filters}")
     logger.info(f"MongoDB query fields: {query_fields}")
 
-    return query_filters, query_fields  # type: ignore
+    return query_filters, query_fields
+
+
+def translate_query(
+    sql_query: str,
+    query_filters: dict[str, str] = None,
+    query_fields: dict[str, str] = None,
+) -> tuple[dict[str, str], dict[str, str]]:
+    """Get the MongoDB spec of the SQL query. If the query was already translated by the server (and shipped in the
+    job JSON), the translation is used as is, skipping parsing.
+
+    Parameters
+    ----------
+    sql_query : str
+        SQL query
+    query_filters : dict[str, str], optional
+        filters (WHERE) in MongoDB spec, as translated by the server
+    query_fields : dict[str, str], optional
+        fields (SELECT) in MongoDB spec, as translated by the server
+
+    Returns
+    -------
+    tuple[dict[str, str], dict[str, str]]
+        dictionaries containing the filters (WHERE) and fields (SELECT) in MongoDB spec
+    """
+
+    if query_filters is None:
+        return convert_SQL_to_mongo(sql_query=sql_query)
+
+    query_fields = query_fields or {}
+    check_query_filters(query_filters)
+
+    logger.info(f"User query: {sql_query}")
+    logger.info(f"Using MongoDB query translated by the server")
+    logger.info(f"MongoDB query filter: {query_filters}")
+    logger.info(f"MongoDB query fields: {query_fields}")
+
+    return query_filters, query_fields
 
 
 def retrieve_files(
     collection: Collection,
     query_filters: dict[str, str],
     query_fields: dict[str, str],
+    explain: bool = False,
 ) -> list[str]:
     """Generate a list of paths according to user query, interrogating the MongoDB database.
     NOTE: entries must have a "path" key and must be available at that path on the filesystem.
@@ -69,6 +146,8 @@ def retrieve_files(
         dictionary containing the query filters in MongoDB spec
     query_fields : dict[str, str]
         dictionary containing the query fields in MongoDB spec
+    explain : bool, optional
+        whether to log a summary of the query execution plan (see indexes.explain_query), False by default
 
     Returns
     -------
@@ -76,16 +155,408 @@ def retrieve_files(
         list containing the paths of the files matching the query
     """
 
+    if str(explain).lower() in ["true", "1"]:
+        explain_query(collection=collection, query_filters=query_filters, query_fields=query_fields)
+
     query_matches = []
 
     for entry in collection.find(filter=query_filters, projection=query_fields):
         query_matches.append(entry["path"])
 
-    logger.debug(f"Query results: {query_matches}")
+    logger.debug("Query results: %s", Preview(query_matches))
 
     return query_matches
 
 
+def preflight_query(
+    collection: Collection,
+    query_filters: dict[str, str],
+    size_field: str = "size",
+) -> dict[str, int]:
+    """Count the files matching the query and sum their size (as found in the metadata), without retrieving them.
+    Used for estimating the resources needed by a job before submitting it.
+
+    Parameters
+    ----------
+    collection : Collection
+        MongoDB collection on which to run the query
+    query_filters : dict[str, str]
+        dictionary containing the query filters in MongoDB spec
+    size_field : str, optional
+        metadata field containing the file size in bytes, "size" by default
+
+    Returns
+    -------
+    dict[str, int]
+        number of matching files ("matches") and their total size in bytes ("size"). Files without the size field
+        in their metadata are not included in the total size
+    """
+
+    start = perf_counter()
+
+    if query_filters:
+        matches = collection.count_documents(query_filters)
+    else:  # no filters, the count from the collection metadata is enough
+        matches = collection.estimated_document_count()
+
+    size = 0
+    if matches:
+        pipeline = [{"$group": {"_id": None, "size": {"$sum": f"${size_field}"}}}]
+        if query_filters:
+            pipeline.insert(0, {"$match": query_filters})
+        for group in collection.aggregate(pipeline):
+            size = group["size"]
+
+    logger.info(f"Pre-flight: {matches} matching files, {size / 1e6:.1f} MB in {perf_counter() - start:.3f} s")
+    if matches and not size:
+        logger.warning(f"No '{size_field}' field found in the metadata of the matching files, size is unknown")
+
+    return {"matches": matches, "size": size}
+
+
+def get_watermark(collection: Collection, query_filters: dict[str, str], exclude_job_id: str = "") -> str:
+    """Compute the watermark of the files matching a query: number of matches, latest ObjectId and latest upload
+    date. Inserting or deleting matching files changes the watermark, so two jobs with the same content hash and
+    the same watermark process the same data. Results entries created by job cache hits and those of the given
+    job are not considered, so that registering the results of a job does not invalidate it.
+
+    Parameters
+    ----------
+    collection : Collection
+        MongoDB collection on which to run the query
+    query_filters : dict[str, str]
+        dictionary containing the query filters in MongoDB spec
+    exclude_job_id : str, optional
+        job whose results entries are not considered
+
+    Returns
+    -------
+    str
+        watermark of the matching files
+    """
+
+    match = {"cached_from": {"$exists": False}}
+    if exclude_job_id:
+        match["job_id"] = {"$ne": exclude_job_id}
+    if query_filters:
+        match = {"$and": [query_filters, match]}
+
+    pipeline = [
+        {"$match": match},
+        {
+            "$group": {
+                "_id": None,
+                "count": {"$sum": 1},
+                "last_id": {"$max": "$_id"},
+                "last_date": {"$max": "$upload_date"},
+            }
+        },
+    ]
+
+    watermark = "0"
+    for group in collection.aggregate(pipeline):
+        watermark = f"{group['count']}:{group['last_id']}:{group['last_date']}"
+
+    logger.debug(f"Watermark of the query results: {watermark}")
+
+    return watermark
+
+
+def _window_filters(last_id: ObjectId, last_date: datetime, overlap: int) -> list[dict]:
+    """Return the filters selecting the files in the overlap window of a high-water mark, i.e. with an ObjectId or
+    upload date at most `overlap` seconds older than the mark (at the resolution of one second for ObjectIds), or
+    more recent
+
+    Parameters
+    ----------
+    last_id : ObjectId
+        latest ObjectId of the high-water mark, None if unknown
+    last_date : datetime
+        latest upload date of the high-water mark, None if unknown
+    overlap : int
+        width of the window, in seconds
+
+    Returns
+    -------
+    list[dict]
+        filters in MongoDB spec, to be combined with $or (empty if the mark is unknown)
+    """
+
+    window = []
+    if last_id is not None:
+        window.append({"_id": {"$gte": ObjectId.from_datetime(last_id.generation_time - timedelta(seconds=overlap))}})
+    if last_date is not None:
+        window.append({"upload_date": {"$gte": last_date - timedelta(seconds=overlap)}})
+    return window
+
+
+def get_high_water_mark(collection: Collection, query_filters: dict[str, str], overlap: int = 0) -> dict[str, str]:
+    """Compute the high-water mark of the files matching a query: their latest ObjectId and latest upload date, as
+    found in the data itself, and the files within the overlap window of the mark (ObjectId and upload date). Since
+    ObjectIds and upload dates are assigned by the clients, they are not ordered across writers, and a file
+    inserted late may be older than the mark: the next incremental run re-scans the overlap window and skips the
+    files of the window which were already there (see get_incremental_filters). Results entries are not
+    considered, since they are not input data.
+
+    Parameters
+    ----------
+    collection : Collection
+        MongoDB collection on which to run the query
+    query_filters : dict[str, str]
+        dictionary containing the query filters in MongoDB spec
+    overlap : int, optional
+        width of the overlap window, in seconds, 0 by default (files with an ObjectId of the same second as the mark,
+        or the same upload date)
+
+    Returns
+    -------
+    dict[str, str]
+        latest ObjectId ("query_last_id") and upload date ("query_last_date") of the matching files, None if no
+        files match (or have an upload date), width ("query_overlap") and files ("query_window") of the overlap window
+    """
+
+    match = {"job_id": {"$exists": False}}
+    if query_filters:
+        match = {"$and": [query_filters, match]}
+
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": None, "last_id": {"$max": "$_id"}, "last_date": {"$max": "$upload_date"}}},
+    ]
+
+    mark = {"query_last_id": None, "query_last_date": None}
+    for group in collection.aggregate(pipeline):
+        mark = {"query_last_id": group["last_id"], "query_last_date": group["last_date"]}
+
+    window = _window_filters(mark["query_last_id"], mark["query_last_date"], int(overlap))
+    mark["query_overlap"] = int(overlap)
+    mark["query_window"] = []
+    if window:
+        mark["query_window"] = [
+            {"_id": file["_id"], "upload_date": file.get("upload_date")}
+            for file in collection.find({"$and": [match, {"$or": window}]}, projection={"_id": 1, "upload_date": 1})
+        ]
+
+    logger.debug(
+        f"High-water mark of the query results: {mark['query_last_id']}, {mark['query_last_date']} "
+        f"({len(mark['query_window'])} files in the overlap window)"
+    )
+
+    return mark
+
+
+def get_incremental_filters(collection: Collection, query_filters: dict[str, str], previous_job_id: str) -> dict:
+    """Restrict the query filters to the files added or modified after the given job queried the metadata, i.e. with
+    a more recent ObjectId or upload date than the high-water mark of the files matched by the previous job (see
+    get_high_water_mark), so that recurring analyses only process the new data. Since ObjectIds and upload dates
+    are assigned by the clients, the overlap window of the mark is re-scanned, skipping the files which the
+    previous job found there (same ObjectId and upload date): files inserted late within the window are processed,
+    as well as files whose upload date was updated. The high-water mark is read from the results entries of the
+    previous job; for jobs registered before it was saved, the query date of the job (or the upload date of its
+    results) is used instead.
+
+    Parameters
+    ----------
+    collection : Collection
+        MongoDB collection containing the metadata and the results entries
+    query_filters : dict[str, str]
+        dictionary containing the query filters in MongoDB spec
+    previous_job_id : str
+        identifier of the previous job
+
+    Returns
+    -------
+    dict
+        query filters restricted to the new files
+
+    Raises
+    ------
+    ValueError
+        if no results entries are found for the previous job
+    """
+
+    previous = collection.find_one(
+        {"job_id": previous_job_id},
+        projection={
+            "query_last_id": 1,
+            "query_last_date": 1,
+            "query_overlap": 1,
+            "query_window": 1,
+            "query_date": 1,
+            "upload_date": 1,
+        },
+        sort=[("upload_date", 1)],
+    )
+    if previous is None:
+        raise ValueError(f"No results found for previous job {previous_job_id}, cannot run incrementally")
+
+    seen = []
+    if "query_last_id" in previous:  # high-water mark of the data matched by the previous job
+        overlap = previous.get("query_overlap", 0)
+        since = _window_filters(previous["query_last_id"], previous.get("query_last_date"), overlap)
+        seen = [{"_id": file["_id"], "upload_date": file["upload_date"]} for file in previous.get("query_window", [])]
+        logger.info(
+            f"Incremental run: only files added or modified after ObjectId {previous['query_last_id']} or upload "
+            f"date {previous.get('query_last_date')}, re-scanning {overlap} s before them and skipping the "
+            f"{len(seen)} files already found there (job {previous_job_id})"
+        )
+    else:
+        date = previous.get("query_date") or previous["upload_date"]
+        if isinstance(date, str):  # results registered before upload dates were saved as datetime
+            date = datetime.fromisoformat(date)
+        # ObjectId with the timestamp of the previous query (and zeroed counter), smaller than the ids of later inserts
+        since = [{"upload_date": {"$gt": date}}, {"_id": {"$gt": ObjectId.from_datetime(date)}}]
+        logger.info(f"Incremental run: only files added or modified since {date} (job {previous_job_id})")
+
+    # The results entries of the previous job were registered after its query, but are not new data.
+    delta = {"job_id": {"$ne": previous_job_id}}
+    if since:  # otherwise the previous job matched no files, all of them are new
+        delta["$or"] = since
+    if seen:  # files of the overlap window already processed by the previous job, unless their upload date changed
+        delta["$nor"] = seen
+
+    return {"$and": [query_filters, delta]} if query_filters else delta
+
+
+def get_staging_dir(job_id: str) -> str:
+    """Return the node-local directory in which the input files for a job are staged. The directory is created
+    within $TMPDIR (which on HPC usually points to node-local storage) or, if unset, the system temporary folder.
+
+    Parameters
+    ----------
+    job_id : str
+        unique job identifier, used to name the staging directory
+
+    Returns
+    -------
+    str
+        path to the staging directory
+    """
+
+    return f"{os.environ.get('TMPDIR', gettempdir())}/dlaas_stage_{job_id}"
+
+
+def stage_files(files_in: list[str], staging_dir: str, max_workers: int = 8) -> list[str]:
+    """Copy the files matching the query to node-local storage, using a pool of parallel copy threads, so that the
+    analysis does not hit the parallel filesystem every time a file is read. Files are staged flat in staging_dir
+    (as they are presented to containers in the /input folder); files sharing the same name are staged in numbered
+    subfolders, so that each staged path is unique.
+
+    Parameters
+    ----------
+    files_in : list[str]
+        list of paths of the files to be staged
+    staging_dir : str
+        path to the node-local directory in which the files are copied
+    max_workers : int, optional
+        number of parallel copy threads, 8 by default
+
+    Returns
+    -------
+    list[str]
+        list of paths of the staged files, in the same order as files_in
+
+    Raises
+    ------
+    OSError
+        if a file cannot be copied, so that the job does not run on partially staged inputs
+    """
+
+    os.makedirs(staging_dir, exist_ok=True)
+
+    destinations = []
+    occurrences = {}
+    for file in files_in:
+        name = os.path.basename(file)
+        occurrences[name] = occurrences.get(name, 0) + 1
+        if occurrences[name] == 1:
+            destinations.append(f"{staging_dir}/{name}")
+        else:  # duplicate file name, e.g. {staging_dir}/1/{name} for the second occurrence
+            os.makedirs(f"{staging_dir}/{occurrences[name] - 1}", exist_ok=True)
+            destinations.append(f"{staging_dir}/{occurrences[name] - 1}/{name}")
+
+    def copy(source: str, destination: str) -> str:
+        try:
+            shutil.copyfile(source, destination)
+        except OSError as e:
+            logger.error(f"Could not stage file '{source}': {repr(e)}")
+            raise
+        return destination
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=int(max_workers)) as pool:
+        files_staged = list(pool.map(copy, files_in, destinations))
+    elapsed = perf_counter() - start
+
+    size = sum(os.path.getsize(file) for file in files_staged)
+    logger.info(
+        f"Staged {len(files_staged)} files ({size / 1e6:.1f} MB) to {staging_dir} in {elapsed:.2f} s "
+        f"({size / 1e6 / max(elapsed, 1e-9):.1f} MB/s)"
+    )
+
+    return files_staged
+
+
+def release_shard(shard_dir: str, files_out: list[str]) -> None:
+    """Remove a processed shard from node-local storage. Staged files returned by the user script (and hence still
+    to be saved with the results) are kept until the end of the job.
+
+    Parameters
+    ----------
+    shard_dir : str
+        path to the node-local directory in which the shard was staged
+    files_out : list[str]
+        list of paths of the output files of the shard
+    """
+
+    keep = {os.path.abspath(file) for file in files_out}
+    if not any(file.startswith(os.path.abspath(shard_dir) + os.sep) for file in keep):
+        shutil.rmtree(shard_dir, ignore_errors=True)
+        return
+
+    for root, _, names in os.walk(shard_dir):
+        for name in names:
+            path = os.path.abspath(os.path.join(root, name))
+            if path not in keep:
+                os.remove(path)
+
+
+def iter_staged_shards(files_in: list[str], staging_dir: str, shard_size: int, max_workers: int = 8):
+    """Stage the input files in shards of shard_size files, yielding each shard once it is available on node-local
+    storage. While a shard is being processed, the next one is prefetched in the background. Each shard is staged in
+    its own subfolder of staging_dir (shard_0, shard_1, ...), so that prefetching never overwrites the files being
+    read; the caller is expected to remove it once processed (see release_shard).
+
+    Parameters
+    ----------
+    files_in : list[str]
+        list of paths of the files to be staged
+    staging_dir : str
+        path to the node-local directory in which the files are copied
+    shard_size : int
+        number of files in each shard
+    max_workers : int, optional
+        number of parallel copy threads, 8 by default
+
+    Yields
+    ------
+    tuple[str, list[str]]
+        directory of the current shard and list of paths of its staged files
+    """
+
+    shards = [files_in[i : i + int(shard_size)] for i in range(0, len(files_in), int(shard_size))]
+    if not shards:
+        return
+
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        future = prefetcher.submit(stage_files, shards[0], f"{staging_dir}/shard_0", max_workers)
+        for i in range(len(shards)):
+            files_staged = future.result()
+            if i + 1 < len(shards):
+                future = prefetcher.submit(stage_files, shards[i + 1], f"{staging_dir}/shard_{i + 1}", max_workers)
+            yield f"{staging_dir}/shard_{i}", files_staged
+
+
 def run_script(script: str, files_in: list[str]) -> list[str]:
     """Runs the `main` function in the user-provided Python script, feeding the paths containted in files_in.
     This function must take a list (of file paths) as input and return a list (of file paths) as output.
@@ -115,7 +586,7 @@ def run_script(script: str, files_in: list[str]) -> list[str]:
         if the user-provided script `main` function does not return a list, abort the run
     """
 
-    logger.info(f"User script:\n{script}")
+    logger.info("User script:\n%s", script)
 
     with open("user_script.py", "w") as f:
         f.write(script)
@@ -142,6 +613,75 @@ def run_script(script: str, files_in: list[str]) -> list[str]:
     return files_out
 
 
+def register_results(
+    collection: Collection,
+    job_id: str,
+    pfs_prefix_path: str,
+    upload_options: dict[str, str] = None,
+    max_workers: int = 8,
+    metadata: dict[str, str] = None,
+):
+    """Save the metadata of the job results in the MongoDB database. With the "archive" output layout, a single entry
+    is created for the results archive, listing the files it contains; with the "objects" layout, an entry is created
+    for each file in the output folder, so that the results can be queried like any other Data Lake file. Sizes and
+    checksums of the output files are computed in parallel, and all entries are written with a single unordered bulk
+    insert. The upload date is stored as a datetime (UTC), so that it can be indexed and queried by range.
+
+    Parameters
+    ----------
+    collection : Collection
+        MongoDB collection on which to save the results metadata
+    job_id : str
+        unique job identifier, used to create the S3 object key
+    pfs_prefix_path : str
+        path prefix for the location on the parallel filesystem
+    upload_options : dict[str, str], optional
+        archiving/upload settings (see UPLOAD_OPTIONS in upload.py), defaults are used for missing keys
+    max_workers : int, optional
+        number of parallel hashing threads, 8 by default
+    metadata : dict[str, str], optional
+        additional fields saved in all the results entries (e.g. job hash and watermark for the job cache)
+    """
+
+    options = {**UPLOAD_OPTIONS, **(upload_options or {})}
+
+    files = describe_files(list_output_files("output"), max_workers=max_workers)
+    upload_date = datetime.now(timezone.utc)
+
+    if options["output_layout"] == "objects":
+        prefix = get_objects_prefix(job_id=job_id)
+        documents = [
+            {
+                "job_id": job_id,
+                "s3_key": f"{prefix}{file['name']}",
+                "path": f"{pfs_prefix_path}/{prefix}{file['name']}",
+                "size": file["size"],
+                "checksum": file["checksum"],
+                "upload_date": upload_date,
+            }
+            for file in files
+        ]
+    else:
+        archive = get_archive_name(job_id=job_id, archive_format=options["archive_format"])
+        documents = [
+            {
+                "job_id": job_id,
+                "s3_key": archive,
+                "path": f"{pfs_prefix_path}/{archive}",
+                "files": files,
+                "file_count": len(files),
+                "upload_date": upload_date,
+            }
+        ]
+
+    for document in documents:
+        document.update(metadata or {})
+
+    if documents:
+        collection.insert_many(documents, ordered=False)
+    logger.info(f"Registered {len(documents)} results entries for job {job_id}")
+
+
 def save_python_output(
     sql_query: str,
     script: str,
@@ -151,11 +691,13 @@ def save_python_output(
     s3_bucket: str,
     job_id: str,
     collection: Collection,
-):
-    """Take a list of paths and save the corresponding files in a zipped archive, updating the MongoDB database
-    with the relevant data for the job (path oh parallel filesystem, s3 key, job identifier). Also, prepares a Python
-    script for the upload of the results to the S3 bucket, which is supposed to be launched via a subsequent job
-    on HPC with access to the S3 bucket.
+    upload_options: dict[str, str] = None,
+    metadata: dict[str, str] = None,
+) -> str:
+    """Take a list of paths and save the corresponding files in the output folder, updating the MongoDB database
+    with the relevant data for the job (path oh parallel filesystem, s3 key, job identifier). Also, prepares the
+    manifest for the upload of the results to the S3 bucket (via `dl_tui_hpc upload`), which is supposed to be
+    launched via a subsequent job on HPC with access to the S3 bucket, or at the end of the job itself.
 
     Parameters
     ----------
@@ -175,9 +717,18 @@ def save_python_output(
         unique job identifier, used to create the S3 object key
     collection : Collection
         MongoDB collection on which to save the results metadata
+    upload_options : dict[str, str], optional
+        archiving/upload settings (see UPLOAD_OPTIONS in upload.py)
+    metadata : dict[str, str], optional
+        additional fields saved in the results entries (see register_results)
+
+    Returns
+    -------
+    str
+        path to the upload manifest
     """
 
-    logger.debug(f"Processed results: {files_out}")
+    logger.debug("Processed results: %s", Preview(files_out))
 
     os.makedirs("output", exist_ok=True)
 
@@ -194,23 +745,143 @@ def save_python_output(
         except FileNotFoundError:
             logger.error(f"No such file or directory: '{file}'")
 
-    with open(f"upload_results_{job_id}.py", "w") as f:
-        content = "import os, boto3, shutil, glob\n"
-        content += 'for match in glob.glob("../slurm-*"):\n'
-        content += ' shutil.copy(match, f"output/{os.path.basename(match)}")\n'
-        content += f'shutil.make_archive("results_{job_id}", "zip", "output")\n'
-        content += 'shutil.rmtree("output")\n'
-        content += f's3 = boto3.client(service_name="s3", endpoint_url="{s3_endpoint_url}")\n'
-        content += f's3.upload_file(Filename="results_{job_id}.zip", Bucket="{s3_bucket}", Key="results_{job_id}.zip")'
-        f.write(content)
-
-    collection.insert_one(
-        {
-            "job_id": job_id,
-            "s3_key": f"results_{job_id}.zip",
-            "path": f"{pfs_prefix_path}/results_{job_id}.zip",
-            "upload_date": str(datetime.now()),
-        }
+    manifest = write_manifest(
+        job_id=job_id,
+        s3_endpoint_url=s3_endpoint_url,
+        s3_bucket=s3_bucket,
+        upload_options=upload_options,
+        collection=collection,
+    )
+
+    register_results(
+        collection=collection,
+        job_id=job_id,
+        pfs_prefix_path=pfs_prefix_path,
+        upload_options=upload_options,
+        metadata=metadata,
+    )
+
+    return manifest
+
+
+def query_and_profile(
+    collection: Collection,
+    sql_query: str,
+    query_filters: dict[str, str],
+    query_fields: dict[str, str],
+    explain_queries: bool,
+    profile: JobProfile,
+    job_hash: str = "",
+    previous_job_id: str = "",
+    incremental_overlap: int = 0,
+) -> tuple[list[str], dict[str, str]]:
+    """Translate the user query and retrieve the matching files, timing the parse and retrieve stages. If the job
+    is profiled, the summary of the query execution plan is added to the profile. If the job hash is given (job
+    cache enabled on the server), the watermark of the matching files is computed before retrieving them. If a
+    previous job is given, only the files added or modified since that job are retrieved.
+
+    Parameters
+    ----------
+    collection : Collection
+        MongoDB collection on which to run the query
+    sql_query : str
+        SQL query
+    query_filters : dict[str, str]
+        filters (WHERE) in MongoDB spec, if already translated by the server
+    query_fields : dict[str, str]
+        fields (SELECT) in MongoDB spec, if already translated by the server
+    explain_queries : bool
+        whether to log a summary of the query execution plan
+    profile : JobProfile
+        profile of the job
+    job_hash : str, optional
+        content hash of the job, computed by the server for the job cache
+    previous_job_id : str, optional
+        identifier of the previous job, for incremental runs
+    incremental_overlap : int, optional
+        width (in seconds) of the overlap window of the high-water mark, re-scanned by the next incremental run, 0 by
+        default
+
+    Returns
+    -------
+    tuple[list[str], dict[str, str]]
+        list containing the paths of the files matching the query, and the fields to be saved in the results entries
+        (query date and high-water mark, previous job for incremental runs, job hash and watermark for the job cache)
+    """
+
+    with profile.stage("parse"):
+        query_filters, query_fields = translate_query(
+            sql_query=sql_query,
+            query_filters=query_filters,
+            query_fields=query_fields,
+        )
+
+    metadata = {"query_date": datetime.now(timezone.utc)}
+
+    # files added after the high-water mark are processed by the next incremental run. Computed before retrieving the
+    # files: files added in between are processed by both runs, rather than by neither
+    with profile.stage("watermark"):
+        metadata.update(
+            get_high_water_mark(collection=collection, query_filters=query_filters, overlap=incremental_overlap)
+        )
+
+    if previous_job_id:
+        with profile.stage("parse"):
+            query_filters = get_incremental_filters(
+                collection=collection, query_filters=query_filters, previous_job_id=previous_job_id
+            )
+        metadata["previous_job_id"] = previous_job_id
+
+    if profile.enabled:
+        with profile.stage("explain"):
+            profile.explain = explain_query(
+                collection=collection, query_filters=query_filters, query_fields=query_fields
+            )
+
+    if job_hash:
+        with profile.stage("watermark"):
+            metadata["job_hash"] = job_hash
+            metadata["job_watermark"] = get_watermark(
+                collection=collection, query_filters=query_filters, exclude_job_id=profile.job_id
+            )
+
+    with profile.stage("retrieve"):
+        files_in = retrieve_files(
+            collection=collection,
+            query_filters=query_filters,
+            query_fields=query_fields,
+            explain=explain_queries and not profile.enabled,  # already explained for the profile
+        )
+    profile.counters["files_in"] = len(files_in)
+
+    return files_in, metadata
+
+
+def save_profile(profile: JobProfile, collection: Collection, manifest: str) -> None:
+    """Write the job profile in the output folder (so that it is uploaded with the results), save it in the MongoDB
+    documents of the job results and record in the upload manifest where to add the archive/upload stages. If
+    profiling is disabled, the stage timings are only recorded in the job metrics (see metrics.record_profile).
+
+    Parameters
+    ----------
+    profile : JobProfile
+        profile of the job
+    collection : Collection
+        MongoDB collection containing the results metadata
+    manifest : str
+        path to the upload manifest
+    """
+
+    record_profile(profile)
+
+    if not profile.enabled:
+        return
+
+    profile.write(f"{os.path.dirname(manifest)}/output/{get_profile_name(profile.job_id)}")
+    profile.save(collection)
+    update_manifest(
+        manifest_path=manifest,
+        updates={"profile": {"database": collection.database.name, "collection": collection.name}},
     )
 
 
@@ -222,12 +893,26 @@ def python_wrapper(
     s3_bucket: str,
     job_id: str,
     script: str = "",
-):
+    stage_inputs: bool = False,
+    staging_workers: int = 8,
+    staging_shard_size: int = 0,
+    upload_options: dict[str, str] = None,
+    query_filters: dict[str, str] = None,
+    query_fields: dict[str, str] = None,
+    explain_queries: bool = False,
+    profile_job: bool = False,
+    read_collection: Collection = None,
+    job_hash: str = "",
+    previous_job_id: str = "",
+    incremental_overlap: int = 0,
+) -> str:
     """Get the SQL query and script, convert them to MongoDB spec, run the process query on the DB retrieving
     matching files, run the user-provided script (if present) in a temporary directory, retrieve the output
     file list from the main function, save the files and zip them in an archive. This archive is then moved to
     the parallel filesystem at the location {pfs_prefix_path}/results_{job_id}.zip. Finally, the S3
-    bucket is synced via curl and the results are uploaded to the MongoDB database with key results_{job_id}.zip
+    bucket is synced via curl and the results are uploaded to the MongoDB database with key results_{job_id}.zip.
+    If requested, the matching files are first staged to node-local storage, optionally in shards which are fed
+    to the `main` function one at a time while the next one is being prefetched.
 
     Parameters
     ----------
@@ -245,14 +930,55 @@ def python_wrapper(
         unique job identifier, used to create the S3 object key
     script : str, optional
         content of the Python script provided by the user, to be run on the query results
+    stage_inputs : bool, optional
+        whether to copy the input files to node-local storage before running the script, False by default
+    staging_workers : int, optional
+        number of parallel copy threads used for staging, 8 by default
+    staging_shard_size : int, optional
+        if larger than 0, the `main` function is called on shards of this many staged files, 0 by default
+    upload_options : dict[str, str], optional
+        archiving/upload settings (see UPLOAD_OPTIONS in upload.py)
+    query_filters : dict[str, str], optional
+        filters (WHERE) in MongoDB spec, if already translated by the server
+    query_fields : dict[str, str], optional
+        fields (SELECT) in MongoDB spec, if already translated by the server
+    explain_queries : bool, optional
+        whether to log a summary of the query execution plan, False by default
+    profile_job : bool, optional
+        whether to save the job profile (time spent in each stage and query execution plan) with the results,
+        False by default
+    read_collection : Collection, optional
+        collection on which to run the query (e.g. routed to the replica set secondaries, see
+        mongo.get_read_collection), by default the same used to save the results metadata
+    job_hash : str, optional
+        content hash of the job computed by the server for the job cache, saved in the results entries with the
+        watermark of the matching files
+    previous_job_id : str, optional
+        if given, only the files added or modified since the previous job are processed (incremental run), and the
+        results entries are linked to those of the previous job
+    incremental_overlap : int, optional
+        width (in seconds) of the overlap window of the high-water mark of the job, re-scanned by the next
+        incremental run, 0 by default
+
+    Returns
+    -------
+    str
+        path to the upload manifest, to be passed to `dl_tui_hpc upload`
     """
 
-    query_filters, query_fields = convert_SQL_to_mongo(sql_query=sql_query)
+    profile = JobProfile(job_id=job_id, enabled=profile_job)
+    stage_inputs = str(stage_inputs).lower() in ["true", "1"]  # may be a string in custom configurations
 
-    files_in = retrieve_files(
-        collection=collection,
+    files_in, metadata = query_and_profile(
+        collection=collection if read_collection is None else read_collection,
+        sql_query=sql_query,
         query_filters=query_filters,
         query_fields=query_fields,
+        explain_queries=explain_queries,
+        profile=profile,
+        job_hash=job_hash,
+        previous_job_id=previous_job_id,
+        incremental_overlap=incremental_overlap,
     )
 
     if script:
@@ -265,28 +991,70 @@ def python_wrapper(
         # FIXME: consider working directly in the job tempdir, shouldn't be necessary to make another tmpdir
         # moving to temporary directory and working within the context manager
         with pushd(tdir):  # type: ignore
-            files_out = run_script(script=script, files_in=files_in)
-            save_python_output(
+            staging_dir = get_staging_dir(job_id)
+            try:
+                if stage_inputs and int(staging_shard_size) > 0:
+                    files_out = []
+                    shards = iter_staged_shards(
+                        files_in=files_in,
+                        staging_dir=staging_dir,
+                        shard_size=staging_shard_size,
+                        max_workers=staging_workers,
+                    )
+                    while True:
+                        with profile.stage("staging"):  # waiting for the prefetched shard
+                            shard = next(shards, None)
+                        if shard is None:
+                            break
+                        shard_dir, files_staged = shard
+                        with profile.stage("script"):
+                            files_shard = run_script(script=script, files_in=files_staged)
+                        release_shard(shard_dir=shard_dir, files_out=files_shard)
+                        files_out += files_shard
+                else:
+                    if stage_inputs:
+                        with profile.stage("staging"):
+                            files_in = stage_files(
+                                files_in=files_in, staging_dir=staging_dir, max_workers=staging_workers
+                            )
+                    with profile.stage("script"):
+                        files_out = run_script(script=script, files_in=files_in)
+                profile.counters["files_out"] = len(files_out)
+                with profile.stage("save"):
+                    manifest = save_python_output(
+                        sql_query=sql_query,
+                        script=script,
+                        files_out=files_out,
+                        pfs_prefix_path=pfs_prefix_path,
+                        s3_endpoint_url=s3_endpoint_url,
+                        s3_bucket=s3_bucket,
+                        job_id=job_id,
+                        collection=collection,
+                        upload_options=upload_options,
+                        metadata=metadata,
+                    )
+                save_profile(profile=profile, collection=collection, manifest=manifest)
+            finally:  # staged files which were not saved are removed from node-local storage
+                if stage_inputs:
+                    shutil.rmtree(staging_dir, ignore_errors=True)
+    else:  # if no script is provided, return the query matches
+        profile.counters["files_out"] = len(files_in)
+        with profile.stage("save"):
+            manifest = save_python_output(
                 sql_query=sql_query,
                 script=script,
-                files_out=files_out,
+                files_out=files_in,
                 pfs_prefix_path=pfs_prefix_path,
                 s3_endpoint_url=s3_endpoint_url,
                 s3_bucket=s3_bucket,
                 job_id=job_id,
                 collection=collection,
+                upload_options=upload_options,
+                metadata=metadata,
             )
-    else:  # if no script is provided, return the query matches
-        save_python_output(
-            sql_query=sql_query,
-            script=script,
-            files_out=files_in,
-            pfs_prefix_path=pfs_prefix_path,
-            s3_endpoint_url=s3_endpoint_url,
-            s3_bucket=s3_bucket,
-            job_id=job_id,
-            collection=collection,
-        )
+        save_profile(profile=profile, collection=collection, manifest=manifest)
+
+    return manifest
 
 
 def run_container(
@@ -303,8 +1071,10 @@ def run_container(
         path to the Singularity container provided by the user
     exec_command : str
         command to be launched within the container (with its own options and flags if needed)
+    pfs_prefix_path : str
+        folder bound to /input in the container (parallel filesystem, or node-local staging directory)
     files_in : list[str]
-        list of paths with the files on which to run the executable
+        list of paths with the files on which to run the executable, passed to the container relative to /input
 
     Returns
     -------
@@ -334,10 +1104,13 @@ def run_container(
     # Bind folders
     cmd += f"export SINGULARITY_BIND={pfs_prefix_path}:/input:ro,./output:/output; "
 
-    # Convert file paths for use in container
+    # Convert file paths for use in container (relative to the folder bound to /input)
     files_container = []
     for file in files_in:
-        files_container.append(f"/input/{os.path.basename(file)}")
+        relative_path = os.path.relpath(file, pfs_prefix_path)
+        if relative_path.startswith(".."):  # not within the bound folder
+            relative_path = os.path.basename(file)
+        files_container.append(f"/input/{relative_path}")
 
     # Launch command with srun
     # FIXME: make sure this is desired behaviour
@@ -376,10 +1149,13 @@ def save_container_output(
     s3_bucket: str,
     job_id: str,
     collection: Collection,
-):
-    """Take the content of the output folder and saves it into a zipped archive, updating the MongoDB database
-    with the relevant data for the job (path oh parallel filesystem, s3 key, job identifier), which is supposed to be
-    launched via a subsequent job on HPC with access to the S3 bucket.
+    upload_options: dict[str, str] = None,
+    metadata: dict[str, str] = None,
+) -> str:
+    """Take the content of the output folder and prepares the manifest for its upload (via `dl_tui_hpc upload`),
+    updating the MongoDB database with the relevant data for the job (path oh parallel filesystem, s3 key, job
+    identifier). The upload is supposed to be launched via a subsequent job on HPC with access to the S3 bucket, or
+    at the end of the job itself.
 
     Parameters
     ----------
@@ -399,6 +1175,15 @@ def save_container_output(
         unique job identifier, used to create the S3 object key
     collection : Collection
         MongoDB collection on which to save the results metadata
+    upload_options : dict[str, str], optional
+        archiving/upload settings (see UPLOAD_OPTIONS in upload.py)
+    metadata : dict[str, str], optional
+        additional fields saved in the results entries (see register_results)
+
+    Returns
+    -------
+    str
+        path to the upload manifest
     """
 
     logger.debug(f"Processed results: {' '.join(files_out)}")
@@ -408,27 +1193,26 @@ def save_container_output(
         f.write(f"SQL query: {sql_query}\n")
         f.write(f"Command launched within the container: {exec_command}\n")
 
-    # Write Python script for uploading to S3
-    with open(f"upload_results_{job_id}.py", "w") as f:
-        content = "import os, boto3, shutil, glob\n"
-        content += 'for match in glob.glob("../slurm-*"):\n'
-        content += ' shutil.copy(match, f"output/{os.path.basename(match)}")\n'
-        content += f'shutil.make_archive("results_{job_id}", "zip", "output")\n'
-        content += 'shutil.rmtree("output")\n'
-        content += f's3 = boto3.client(service_name="s3", endpoint_url="{s3_endpoint_url}")\n'
-        content += f's3.upload_file(Filename="results_{job_id}.zip", Bucket="{s3_bucket}", Key="results_{job_id}.zip")'
-        f.write(content)
+    # Write manifest for uploading to S3
+    manifest = write_manifest(
+        job_id=job_id,
+        s3_endpoint_url=s3_endpoint_url,
+        s3_bucket=s3_bucket,
+        upload_options=upload_options,
+        collection=collection,
+    )
 
     # Insert metadata to MongoDB
-    collection.insert_one(
-        {
-            "job_id": job_id,
-            "s3_key": f"results_{job_id}.zip",
-            "path": f"{pfs_prefix_path}/results_{job_id}.zip",
-            "upload_date": str(datetime.now()),
-        }
+    register_results(
+        collection=collection,
+        job_id=job_id,
+        pfs_prefix_path=pfs_prefix_path,
+        upload_options=upload_options,
+        metadata=metadata,
     )
 
+    return manifest
+
 
 def container_wrapper(
     collection: Collection,
@@ -439,12 +1223,23 @@ def container_wrapper(
     job_id: str,
     container_path: str,
     exec_command: str,
-):
-    """Get the SQL query and script, convert them to MongoDB spec, run the process query on the DB retrieving matching
-    files, run the user-provided Singularity container (if present) in a temporary directory, save the files and zip
-    them in an archive. This archive is then moved to the parallel filesystem at the location
-    {pfs_prefix_path}/results_{job_id}.zip. Finally, the S3 bucket is synced via curl and the results are uploaded to
-    the MongoDB database with key results_{job_id}.zip
+    stage_inputs: bool = False,
+    staging_workers: int = 8,
+    upload_options: dict[str, str] = None,
+    query_filters: dict[str, str] = None,
+    query_fields: dict[str, str] = None,
+    explain_queries: bool = False,
+    profile_job: bool = False,
+    read_collection: Collection = None,
+    job_hash: str = "",
+    previous_job_id: str = "",
+    incremental_overlap: int = 0,
+) -> str:
+    """Get the SQL query, convert it to MongoDB spec, run the query on the DB retrieving the matching files and run the
+    user-provided Singularity container on them (through srun), saving its outputs in the output folder. The results
+    metadata are registered in the MongoDB database, and an upload manifest is written, so that the output folder is
+    archived and uploaded to the S3 bucket by `dl_tui_hpc upload`. If requested, the matching files are first staged
+    to node-local storage, which is then bound to the container as /input instead of the parallel filesystem.
 
     Parameters
     ----------
@@ -464,36 +1259,86 @@ def container_wrapper(
         path to the Singularity container provided by the user
     exec_command : str
         command to be launched within the container (with its own options and flags if needed)
-    omp_num_threads : int, optional
-        will be exported as OMP_NUM_THREADS environment variable, 1 by default
-    mpi_np : int, optional, 1 by default
-        number of MPI processes which the mpirun command will use
-    modules : list[str], optional
-        list of modules to be loaded on HPC, none by default
+    stage_inputs : bool, optional
+        whether to copy the input files to node-local storage before running the container, False by default
+    staging_workers : int, optional
+        number of parallel copy threads used for staging, 8 by default
+    upload_options : dict[str, str], optional
+        archiving/upload settings (see UPLOAD_OPTIONS in upload.py)
+    query_filters : dict[str, str], optional
+        filters (WHERE) in MongoDB spec, if already translated by the server
+    query_fields : dict[str, str], optional
+        fields (SELECT) in MongoDB spec, if already translated by the server
+    explain_queries : bool, optional
+        whether to log a summary of the query execution plan, False by default
+    profile_job : bool, optional
+        whether to save the job profile (time spent in each stage and query execution plan) with the results,
+        False by default
+    read_collection : Collection, optional
+        collection on which to run the query (e.g. routed to the replica set secondaries, see
+        mongo.get_read_collection), by default the same used to save the results metadata
+    job_hash : str, optional
+        content hash of the job computed by the server for the job cache, saved in the results entries with the
+        watermark of the matching files
+    previous_job_id : str, optional
+        if given, only the files added or modified since the previous job are processed (incremental run), and the
+        results entries are linked to those of the previous job
+    incremental_overlap : int, optional
+        width (in seconds) of the overlap window of the high-water mark of the job, re-scanned by the next
+        incremental run, 0 by default
+
+    Returns
+    -------
+    str
+        path to the upload manifest, to be passed to `dl_tui_hpc upload`
     """
 
-    query_filters, query_fields = convert_SQL_to_mongo(sql_query=sql_query)
+    profile = JobProfile(job_id=job_id, enabled=profile_job)
+    stage_inputs = str(stage_inputs).lower() in ["true", "1"]  # may be a string in custom configurations
 
-    files_in = retrieve_files(
-        collection=collection,
+    files_in, metadata = query_and_profile(
+        collection=collection if read_collection is None else read_collection,
+        sql_query=sql_query,
         query_filters=query_filters,
         query_fields=query_fields,
+        explain_queries=explain_queries,
+        profile=profile,
+        job_hash=job_hash,
+        previous_job_id=previous_job_id,
+        incremental_overlap=incremental_overlap,
     )
 
-    files_out = run_container(
-        container_path=container_path,
-        exec_command=exec_command,
-        pfs_prefix_path=pfs_prefix_path,
-        files_in=files_in,
-    )
+    staging_dir = get_staging_dir(job_id)
+    try:
+        if stage_inputs:
+            with profile.stage("staging"):
+                files_in = stage_files(files_in=files_in, staging_dir=staging_dir, max_workers=staging_workers)
+
+        with profile.stage("container"):
+            files_out = run_container(
+                container_path=container_path,
+                exec_command=exec_command,
+                pfs_prefix_path=staging_dir if stage_inputs else pfs_prefix_path,  # folder bound to /input
+                files_in=files_in,
+            )
+    finally:
+        if stage_inputs:
+            shutil.rmtree(staging_dir, ignore_errors=True)
 
-    save_container_output(
-        sql_query=sql_query,
-        files_out=files_out,
-        pfs_prefix_path=pfs_prefix_path,
-        exec_command=exec_command,
-        s3_endpoint_url=s3_endpoint_url,
-        s3_bucket=s3_bucket,
-        job_id=job_id,
-        collection=collection,
-    )
+    profile.counters["files_out"] = len(files_out)
+    with profile.stage("save"):
+        manifest = save_container_output(
+            sql_query=sql_query,
+            files_out=files_out,
+            pfs_prefix_path=pfs_prefix_path,
+            exec_command=exec_command,
+            s3_endpoint_url=s3_endpoint_url,
+            s3_bucket=s3_bucket,
+            job_id=job_id,
+            collection=collection,
+            upload_options=upload_options,
+            metadata=metadata,
+        )
+    save_profile(profile=profile, collection=collection, manifest=manifest)
+
+    return manifest
@@ -0,0 +1,304 @@
+"""
+Functions for analyzing the query filters run on the metadata collection, recommending and creating indexes
+
+Author: @lbabetto
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+import ast
+from glob import glob
+from collections import Counter
+
+from pymongo.collection import Collection
+
+from dlaas.tuilib.logs import read_log
+
+# operators which select a range of values (sorted after the equality fields in a compound index)
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte", "$ne", "$nin", "$regex", "$exists"}
+
+# prefix of the log messages with the translated query (see hpc.convert_SQL_to_mongo)
+FILTER_LOG_PREFIX = "MongoDB query filter: "
+
+
+def collect_filters(log_paths: list[str]) -> list[dict[str, str]]:
+    """Collect the MongoDB query filters from the logs of previous jobs (JSON or plain text, see logs.read_log)
+
+    Parameters
+    ----------
+    log_paths : list[str]
+        paths (or glob patterns) of the log files
+
+    Returns
+    -------
+    list[dict[str, str]]
+        query filters, in the order in which they were logged
+    """
+
+    filters = []
+    for pattern in log_paths:
+        for path in sorted(glob(pattern)):
+            for record in read_log(path):
+                if not record["message"].startswith(FILTER_LOG_PREFIX):
+                    continue
+                try:
+                    filters.append(ast.literal_eval(record["message"][len(FILTER_LOG_PREFIX) :].strip()))
+                except (ValueError, SyntaxError):  # truncated or otherwise malformed message
+                    logger.debug(f"Could not read query filter from message: {record['message']}")
+
+    logger.info(f"Collected {len(filters)} query filters from {len(log_paths)} log paths")
+
+    return filters
+
+
+def extract_predicates(query_filters: dict[str, str]) -> list[dict[str, str]]:
+    """Extract the fields used by a query filter, classified as "equality" or "range" predicates. Each $or branch
+    needs its own index, hence a list of predicate sets is returned (one per branch). $nor clauses cannot make
+    efficient use of indexes and are ignored.
+
+    Parameters
+    ----------
+    query_filters : dict[str, str]
+        query filter in MongoDB spec
+
+    Returns
+    -------
+    list[dict[str, str]]
+        list of {field: "equality"/"range"} dictionaries
+    """
+
+    branches = [{}]
+
+    for key, value in query_filters.items():
+        if key == "$and":
+            for clause in value:
+                branches = [{**branch, **sub} for branch in branches for sub in extract_predicates(clause)]
+        elif key == "$or":
+            branches = [
+                {**branch, **sub} for branch in branches for clause in value for sub in extract_predicates(clause)
+            ]
+        elif key.startswith("$"):  # $nor, $expr, etc.
+            continue
+        elif isinstance(value, dict) and any(op in RANGE_OPERATORS for op in value):
+            for branch in branches:
+                branch.setdefault(key, "range")
+        else:  # plain value or $eq/$in
+            for branch in branches:
+                branch[key] = "equality"
+
+    return branches
+
+
+def get_index_keys(predicates: dict[str, str]) -> tuple[str]:
+    """Order the fields of a compound index following the Equality-Sort-Range rule: equality fields first, then
+    range fields (alphabetically within each group, so that equivalent queries share the same index)
+
+    Parameters
+    ----------
+    predicates : dict[str, str]
+        {field: "equality"/"range"} dictionary
+
+    Returns
+    -------
+    tuple[str]
+        index fields, in order
+    """
+
+    equality = sorted(field for field, kind in predicates.items() if kind == "equality")
+    ranges = sorted(field for field, kind in predicates.items() if kind == "range")
+
+    return tuple(equality + ranges)
+
+
+def is_covered(keys: tuple[str], indexes: list[tuple[str]]) -> bool:
+    """Check whether an index on the given fields is made redundant by one of the indexes (i.e. it is a prefix)
+
+    Parameters
+    ----------
+    keys : tuple[str]
+        index fields
+    indexes : list[tuple[str]]
+        fields of the other indexes
+
+    Returns
+    -------
+    bool
+        True if the index is redundant
+    """
+
+    return any(index[: len(keys)] == keys for index in indexes if index != keys)
+
+
+def recommend_indexes(
+    query_filters: list[dict[str, str]],
+    collection: Collection = None,
+    min_queries: int = 1,
+    max_fields: int = 4,
+) -> list[dict[str, str]]:
+    """Recommend compound indexes for the given query filters. Indexes which are a prefix of another recommended
+    (or existing) index are skipped, since the longer index can serve the same queries.
+
+    Parameters
+    ----------
+    query_filters : list[dict[str, str]]
+        query filters in MongoDB spec (e.g. from collect_filters)
+    collection : Collection, optional
+        if provided, the indexes already present on the collection are not recommended again
+    min_queries : int, optional
+        minimum number of queries which would use an index for it to be recommended, 1 by default
+    max_fields : int, optional
+        maximum number of fields in a compound index, 4 by default
+
+    Returns
+    -------
+    list[dict[str, str]]
+        recommended indexes, as {"keys": [(field, 1), ...], "queries": number of queries}, most used first
+    """
+
+    usage = Counter()
+    for query_filter in query_filters:
+        for predicates in extract_predicates(query_filter):
+            keys = get_index_keys(predicates)[:max_fields]
+            if keys:
+                usage[keys] += 1
+
+    existing = []
+    if collection is not None:
+        existing = [tuple(field for field, _ in index["key"]) for index in collection.index_information().values()]
+
+    recommendations = []
+    for keys in usage:
+        if keys in existing or is_covered(keys, list(usage) + existing):
+            continue
+        # queries on a prefix of the index fields can use the index as well
+        served = sum(count for other, count in usage.items() if keys[: len(other)] == other)
+        if served < min_queries:
+            continue
+        recommendations.append({"keys": [(field, 1) for field in keys], "queries": served})
+
+    recommendations.sort(key=lambda index: index["queries"], reverse=True)
+
+    for index in recommendations:
+        logger.info(f"Recommended index: {index['keys']} (used by {index['queries']} queries)")
+
+    return recommendations
+
+
+def create_indexes(collection: Collection, recommendations: list[dict[str, str]]) -> list[str]:
+    """Create the recommended indexes on the collection
+
+    Parameters
+    ----------
+    collection : Collection
+        MongoDB collection on which to create the indexes
+    recommendations : list[dict[str, str]]
+        recommended indexes (see recommend_indexes)
+
+    Returns
+    -------
+    list[str]
+        names of the created indexes
+    """
+
+    names = []
+    for index in recommendations:
+        name = collection.create_index(index["keys"])
+        logger.info(f"Created index {name} on {collection.name}")
+        names.append(name)
+
+    return names
+
+
+def summarize_explain(explain: dict[str, str]) -> dict[str, str]:
+    """Extract the relevant information from the output of the explain command (executionStats verbosity)
+
+    Parameters
+    ----------
+    explain : dict[str, str]
+        output of the explain command
+
+    Returns
+    -------
+    dict[str, str]
+        plan stages (e.g. "IXSCAN", "COLLSCAN"), index used, documents and keys examined, documents returned and
+        execution time
+    """
+
+    stages = []
+    index_name = None
+
+    def walk(plan: dict):
+        nonlocal index_name
+        if "queryPlan" in plan:  # slot-based execution engine
+            plan = plan["queryPlan"]
+        stages.append(plan.get("stage"))
+        index_name = index_name or plan.get("indexName")
+        if "inputStage" in plan:
+            walk(plan["inputStage"])
+        for stage in plan.get("inputStages", []):
+            walk(stage)
+
+    walk(explain.get("queryPlanner", {}).get("winningPlan", {}))
+    stats = explain.get("executionStats", {})
+
+    return {
+        "stages": [stage for stage in stages if stage],
+        "index": index_name,
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "returned": stats.get("nReturned"),
+        "time_ms": stats.get("executionTimeMillis"),
+    }
+
+
+def explain_query(
+    collection: Collection,
+    query_filters: dict[str, str],
+    query_fields: dict[str, str] = None,
+) -> dict[str, str]:
+    """Run the explain command on a query and log a summary. Collection scans and queries examining many more
+    documents than they return are logged as warnings. NOTE: with executionStats verbosity the query is actually
+    executed, so explaining doubles the cost of the query; the command is sent according to the read preference of
+    the collection (e.g. to the secondaries, see mongo.get_read_collection), like the query itself.
+
+    Parameters
+    ----------
+    collection : Collection
+        MongoDB collection on which to run the query
+    query_filters : dict[str, str]
+        dictionary containing the query filters in MongoDB spec
+    query_fields : dict[str, str], optional
+        dictionary containing the query fields in MongoDB spec
+
+    Returns
+    -------
+    dict[str, str]
+        explain summary (see summarize_explain), empty if explain is not available
+    """
+
+    command = {"find": collection.name, "filter": query_filters}
+    if query_fields:
+        command["projection"] = query_fields
+
+    try:
+        explain = collection.database.command(
+            {"explain": command, "verbosity": "executionStats"}, read_preference=collection.read_preference
+        )
+    except Exception as e:  # explain is only used for diagnostics, it must never make the job fail
+        logger.debug(f"Could not explain query: {e}")
+        return {}
+
+    summary = summarize_explain(explain)
+    logger.info(f"MongoDB explain: {summary}")
+
+    if "COLLSCAN" in summary["stages"]:
+        logger.warning(f"Query ran a collection scan, consider adding an index (see `dl_tui_hpc indexes`)")
+    elif summary["docs_examined"] and summary["docs_examined"] > 10 * max(summary["returned"] or 0, 1):
+        logger.warning(
+            f"Query examined {summary['docs_examined']} documents to return {summary['returned']}, "
+            f"consider adding a more selective index (see `dl_tui_hpc indexes`)"
+        )
+
+    return summary
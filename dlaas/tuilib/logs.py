@@ -0,0 +1,261 @@
+"""
+Logging setup for the executables: records are handed over to a background thread through a queue, so that writing
+the log never blocks the job, and are written as JSON lines (or plain text) to a size-rotated file
+
+Author: @lbabetto
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+import re
+import json
+import queue
+import atexit
+from glob import glob, escape
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# config keys with the logging settings (see get_log_options)
+LOG_OPTIONS = ["log_format", "log_max_bytes", "log_backup_count", "log_max_length"]
+
+# format of the plain text log lines
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+TEXT_LINE = re.compile(r"(?P<time>\d{4}-\d{2}-\d{2} [0-9:,]+) - (?P<name>\S+) - (?P<level>[A-Z]+) - (?P<message>.*)")
+
+# attributes of every LogRecord, anything else was passed via `extra` and is written as a field of the JSON record
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def truncate(message: str, max_length: int) -> str:
+    """Truncate a log message, noting how many characters were dropped
+
+    Parameters
+    ----------
+    message : str
+        log message
+    max_length : int
+        maximum number of characters kept, no truncation if 0
+
+    Returns
+    -------
+    str
+        (possibly truncated) message
+    """
+    if not max_length or len(message) <= max_length:
+        return message
+    return f"{message[:max_length]}... [{len(message) - max_length} characters truncated]"
+
+
+class Preview:
+    """Lazy, bounded representation of a (possibly huge) list for log messages: only the first items are formatted,
+    and only if the record is actually emitted, e.g. `logger.debug("Query results: %s", Preview(files))`
+
+    Attributes
+    ----------
+    items : list
+        list to be logged
+    limit : int
+        maximum number of items formatted
+    """
+
+    __slots__ = ("items", "limit")
+
+    def __init__(self, items: list, limit: int = 10) -> None:
+        self.items = items
+        self.limit = limit
+
+    def __str__(self) -> str:
+        if len(self.items) <= self.limit:
+            return str(list(self.items))
+        return f"{str(list(self.items[: self.limit]))[:-1]}, ...] ({len(self.items)} items)"
+
+
+class TruncatingQueueHandler(QueueHandler):
+    """QueueHandler truncating the messages before enqueuing them, so that huge payloads are neither kept in memory
+    by the queue nor written to the log"""
+
+    def __init__(self, queue: queue.SimpleQueue, max_length: int = 0) -> None:
+        super().__init__(queue)
+        self.max_length = max_length
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        record.msg = record.message = truncate(record.message, self.max_length)
+        return record
+
+
+class LogListener(QueueListener):
+    """QueueListener which can be stopped more than once (e.g. explicitly and then at exit)"""
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            super().stop()
+
+
+class JSONFormatter(logging.Formatter):
+    """Formatter writing each record as a JSON line, with time, logger name, level, message and any field passed via
+    `extra`"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "name": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+
+        return json.dumps(entry, default=str)
+
+
+def get_log_options(config) -> dict[str, str]:
+    """Extract the logging settings from the configuration
+
+    Parameters
+    ----------
+    config : Config
+        Config instance, possibly with custom options loaded
+
+    Returns
+    -------
+    dict[str, str]
+        keyword arguments for setup_logging
+    """
+
+    return {key[len("log_") :]: getattr(config, key) for key in LOG_OPTIONS if hasattr(config, key)}
+
+
+def setup_logging(
+    path: str,
+    mode: str = "a",
+    level: int = logging.DEBUG,
+    format: str = "json",
+    max_bytes: int = 0,
+    backup_count: int = 0,
+    max_length: int = 10000,
+    delay: bool = False,
+) -> LogListener:
+    """Attach to the root logger a handler enqueuing the records, which are written to file by a background thread.
+    The queue is flushed at exit.
+
+    Parameters
+    ----------
+    path : str
+        path of the log file
+    mode : str, optional
+        mode in which the log file is opened, "a" by default (always "a" if the file is rotated)
+    level : int, optional
+        level of the root logger, DEBUG by default
+    format : str, optional
+        "json" (one JSON record per line) or "text", "json" by default
+    max_bytes : int, optional
+        size at which the log file is rotated, no rotation if 0 (default)
+    backup_count : int, optional
+        number of rotated files kept (<path>.1, <path>.2, ...), 0 by default
+    max_length : int, optional
+        maximum length of the log messages, longer messages are truncated (no truncation if 0), 10000 by default
+    delay : bool, optional
+        if True, the log file is not opened (or truncated) until the first record is written, False by default
+
+    Returns
+    -------
+    LogListener
+        listener writing the records to file
+
+    Raises
+    ------
+    ValueError
+        if the format is not supported
+    """
+
+    if format not in ["json", "text"]:
+        raise ValueError(f"Unsupported log format: {format}. Supported formats: json, text")
+
+    if int(max_bytes):
+        handler = RotatingFileHandler(path, maxBytes=int(max_bytes), backupCount=int(backup_count), delay=delay)
+    else:
+        handler = logging.FileHandler(path, mode=mode, delay=delay)
+    handler.setFormatter(JSONFormatter() if format == "json" else logging.Formatter(TEXT_FORMAT))
+
+    records = queue.SimpleQueue()
+    listener = LogListener(records, handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(TruncatingQueueHandler(records, max_length=int(max_length)))
+
+    return listener
+
+
+def get_log_files(path: str) -> list[str]:
+    """Return the log file and its rotated copies, oldest first
+
+    Parameters
+    ----------
+    path : str
+        path of the log file
+
+    Returns
+    -------
+    list[str]
+        existing log files (<path>.N, ..., <path>.1, <path>)
+    """
+
+    rotated = [file for file in glob(f"{escape(path)}.*") if file[len(path) + 1 :].isdigit()]
+    rotated.sort(key=lambda file: int(file[len(path) + 1 :]), reverse=True)
+
+    return rotated + glob(escape(path))
+
+
+def read_log(path: str):
+    """Read the records of a log file, written either as JSON lines or as plain text. Continuation lines of multi-line
+    plain text messages are appended to the message of the previous record, malformed (e.g. truncated) JSON lines are
+    skipped.
+
+    Parameters
+    ----------
+    path : str
+        path of the log file
+
+    Yields
+    ------
+    dict[str, str]
+        log record, with time, name, level and message (and any additional field of the JSON records)
+    """
+
+    record = None
+    with open(path, "r", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\n")
+
+            entry = None
+            if line.startswith("{"):
+                try:
+                    entry = json.loads(line)
+                except ValueError:  # truncated record, or continuation line starting with a brace
+                    entry = None
+            if isinstance(entry, dict):
+                multiline = False  # newlines are escaped in JSON records
+            else:
+                match = TEXT_LINE.fullmatch(line)
+                entry = match.groupdict() if match else None
+                multiline = True
+
+            if entry is None:
+                if record is not None and record_multiline:
+                    record["message"] += f"\n{line}"
+                continue
+
+            if record is not None:
+                yield record
+            record, record_multiline = entry, multiline
+
+    if record is not None:
+        yield record
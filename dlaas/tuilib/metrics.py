@@ -0,0 +1,318 @@
+"""
+Counters and histograms of the job lifecycle (SSH/sbatch latency, queue wait, stage timings, files matched, bytes
+uploaded), exported as a JSON summary and in the Prometheus text format
+
+Author: @lbabetto
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+import os
+import json
+import fcntl
+import threading
+from time import perf_counter
+from contextlib import contextmanager
+
+# metric definitions: type, description and, for histograms, upper bounds of the buckets
+METRIC_DEFINITIONS = {
+    "dl_tui_jobs_total": ("counter", "Jobs handled by dl_tui_server, by outcome", None),
+    "dl_tui_ssh_seconds": (
+        "histogram",
+        "Latency of the SSH commands run by dl_tui_server (sbatch for launch_job/upload_results), by step",
+        (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+    ),
+    "dl_tui_queue_wait_seconds": (
+        "histogram",
+        "Time between the submission of the job and the start of dl_tui_hpc",
+        (10, 30, 60, 300, 900, 1800, 3600, 7200, 21600, 86400),
+    ),
+    "dl_tui_stage_seconds": (
+        "histogram",
+        "Time spent in each stage of the job (retrieve is the MongoDB query), by stage",
+        (0.01, 0.1, 1, 10, 60, 300, 1800, 3600, 14400),
+    ),
+    "dl_tui_files_matched": (
+        "histogram",
+        "Number of files matching the query of each job",
+        (0, 1, 10, 100, 1000, 10000, 100000, 1000000),
+    ),
+    "dl_tui_uploaded_bytes_total": ("counter", "Bytes of results uploaded to S3", None),
+    "dl_tui_upload_throughput_mbps": (
+        "histogram",
+        "Throughput of the results upload, in MB/s",
+        (1, 10, 50, 100, 250, 500, 1000),
+    ),
+}
+
+
+class Metrics:
+    """Registry of the counters and histograms recorded by the current process. Each metric can have labels (e.g.
+    step, stage), every combination of label values is a separate series.
+
+    Attributes
+    ----------
+    counters : dict[tuple, float]
+        counter values, keyed by (name, labels)
+    histograms : dict[tuple, dict[str, str]]
+        histogram bucket counts (non-cumulative), sum and count of the observations, keyed by (name, labels)
+    """
+
+    def __init__(self) -> None:
+        """Initialization for Metrics class"""
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_definition(name: str, kind: str) -> tuple:
+        """Return the definition of a metric, checking its type
+
+        Raises
+        ------
+        KeyError
+            if the metric is not defined in METRIC_DEFINITIONS, or is not of the expected type
+        """
+        definition = METRIC_DEFINITIONS.get(name)
+        if definition is None or definition[0] != kind:
+            raise KeyError(f"Unknown {kind}: {name}")
+        return definition
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """Increment a counter
+
+        Parameters
+        ----------
+        name : str
+            counter name
+        value : float, optional
+            increment, 1 by default
+        **labels
+            label values of the series
+        """
+        self.get_definition(name, "counter")
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Record an observation in a histogram
+
+        Parameters
+        ----------
+        name : str
+            histogram name
+        value : float
+            observed value
+        **labels
+            label values of the series
+        """
+        _, _, buckets = self.get_definition(name, "histogram")
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            series = self.histograms.setdefault(key, {"buckets": [0] * (len(buckets) + 1), "sum": 0, "count": 0})
+            series["buckets"][next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Context manager recording the time spent in the enclosed code in a histogram
+
+        Parameters
+        ----------
+        name : str
+            histogram name
+        **labels
+            label values of the series
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start, **labels)
+
+    def to_dict(self) -> dict[str, str]:
+        """Return the metrics in JSON-serializable form
+
+        Returns
+        -------
+        dict[str, str]
+            lists of counters and histograms, with name, labels and values
+        """
+        with self.lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), **series, "buckets": list(series["buckets"])}
+                    for (name, labels), series in sorted(self.histograms.items(), key=lambda item: item[0])
+                ],
+            }
+
+    def merge(self, data: dict[str, str]) -> None:
+        """Add the metrics recorded by another process (see to_dict). Series of metrics which are no longer defined,
+        or whose buckets changed, are dropped.
+
+        Parameters
+        ----------
+        data : dict[str, str]
+            metrics in JSON-serializable form
+        """
+        for counter in data.get("counters", []):
+            if METRIC_DEFINITIONS.get(counter["name"], ("",))[0] == "counter":
+                self.inc(counter["name"], counter["value"], **counter["labels"])
+
+        for histogram in data.get("histograms", []):
+            definition = METRIC_DEFINITIONS.get(histogram["name"], ("", "", ()))
+            if definition[0] != "histogram" or len(histogram["buckets"]) != len(definition[2]) + 1:
+                continue
+            key = (histogram["name"], tuple(sorted(histogram["labels"].items())))
+            with self.lock:
+                series = self.histograms.setdefault(
+                    key, {"buckets": [0] * len(histogram["buckets"]), "sum": 0, "count": 0}
+                )
+                series["buckets"] = [a + b for a, b in zip(series["buckets"], histogram["buckets"])]
+                series["sum"] += histogram["sum"]
+                series["count"] += histogram["count"]
+
+    def to_prometheus(self) -> str:
+        """Return the metrics in the Prometheus text exposition format
+
+        Returns
+        -------
+        str
+            metrics, with HELP and TYPE lines for each metric
+        """
+
+        def format_labels(labels: tuple, extra: str = "") -> str:
+            pairs = [f'{key}="{escape(str(value))}"' for key, value in labels]
+            if extra:
+                pairs.append(extra)
+            return f"{{{','.join(pairs)}}}" if pairs else ""
+
+        def escape(value: str) -> str:
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        lines = []
+        with self.lock:
+            for name, (kind, description, buckets) in METRIC_DEFINITIONS.items():
+                values = self.counters if kind == "counter" else self.histograms
+                series = sorted(
+                    ((labels, value) for (key, labels), value in values.items() if key == name), key=lambda s: s[0]
+                )
+                if not series:
+                    continue
+
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in series:
+                    if kind == "counter":
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(buckets) + ["+Inf"], value["buckets"]):
+                        cumulative += count
+                        le = f'le="{bound}"'
+                        lines.append(f"{name}_bucket{format_labels(labels, le)} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {value['sum']}")
+                    lines.append(f"{name}_count{format_labels(labels)} {value['count']}")
+
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """Forget all the recorded metrics"""
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+# metrics recorded by the current process
+METRICS = Metrics()
+
+
+def record_profile(profile, metrics: Metrics = METRICS) -> None:
+    """Record the stage timings and the number of matching files of a job (see profiling.JobProfile)
+
+    Parameters
+    ----------
+    profile : JobProfile
+        profile of the job
+    metrics : Metrics, optional
+        registry in which the metrics are recorded, METRICS by default
+    """
+
+    for stage, seconds in profile.stages.items():
+        metrics.observe("dl_tui_stage_seconds", seconds, stage=stage)
+    if "files_in" in profile.counters:
+        metrics.observe("dl_tui_files_matched", profile.counters["files_in"])
+
+
+def record_upload(summary: dict[str, str], metrics: Metrics = METRICS) -> None:
+    """Record the archive/upload timings, the uploaded bytes and the throughput of an upload
+
+    Parameters
+    ----------
+    summary : dict[str, str]
+        upload summary returned by upload.run_upload
+    metrics : Metrics, optional
+        registry in which the metrics are recorded, METRICS by default
+    """
+
+    for stage, seconds in summary.get("stages", {}).items():
+        metrics.observe("dl_tui_stage_seconds", seconds, stage=stage)
+    metrics.inc("dl_tui_uploaded_bytes_total", summary["bytes"])
+    metrics.observe("dl_tui_upload_throughput_mbps", summary["throughput_MBps"])
+
+
+def write_atomic(path: str, content: str) -> None:
+    """Write a file atomically (readers, e.g. the Prometheus node exporter, never see a partial file)"""
+    with open(f"{path}.tmp", "w") as f:
+        f.write(content)
+    os.replace(f"{path}.tmp", path)
+
+
+def save_metrics(path: str, metrics: Metrics = METRICS, prometheus_path: str = "") -> Metrics:
+    """Add the metrics recorded by the current process to those saved in a JSON file (created if missing), so that
+    they accumulate over the jobs, and optionally write the accumulated metrics in the Prometheus text format (e.g. for
+    the textfile collector of the node exporter). The files are locked while they are updated, since several
+    processes can share them.
+
+    Parameters
+    ----------
+    path : str
+        path of the JSON file
+    metrics : Metrics, optional
+        metrics recorded by the current process, METRICS by default
+    prometheus_path : str, optional
+        if provided, path of the Prometheus text file (e.g. /var/lib/node_exporter/textfile/dl_tui.prom)
+
+    Returns
+    -------
+    Metrics
+        accumulated metrics
+    """
+
+    total = Metrics()
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(path, "r") as f:
+                total.merge(json.load(f))
+        except FileNotFoundError:
+            pass
+        except ValueError:  # corrupted file, metrics are restarted
+            logger.warning(f"Could not read metrics from {path}, starting from scratch")
+        total.merge(metrics.to_dict())
+
+        write_atomic(path, json.dumps(total.to_dict(), indent=2))
+        if prometheus_path:
+            write_atomic(prometheus_path, total.to_prometheus())
+
+    logger.info(f"Saved metrics to {path}")
+
+    return total
@@ -0,0 +1,246 @@
+"""
+Connection factory for the MongoDB server containing the Data Lake metadata
+
+Author: @lbabetto
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+import os
+import threading
+
+from pymongo import MongoClient
+from pymongo.collection import Collection
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+
+try:
+    import zstandard
+except ImportError:  # zstd wire compression is optional, install with `pip install dl_tui[zstd]`
+    zstandard = None
+
+try:
+    import snappy
+except ImportError:  # snappy wire compression is optional, install with `pip install dl_tui[snappy]`
+    snappy = None
+
+# config_hpc keys and the corresponding MongoClient options
+MONGO_OPTIONS = {
+    "mongo_max_pool_size": "maxPoolSize",
+    "mongo_min_pool_size": "minPoolSize",
+    "mongo_max_idle_time_ms": "maxIdleTimeMS",
+    "mongo_server_selection_timeout_ms": "serverSelectionTimeoutMS",
+    "mongo_connect_timeout_ms": "connectTimeoutMS",
+    "mongo_socket_timeout_ms": "socketTimeoutMS",
+    "mongo_compressors": "compressors",
+    "mongo_read_preference": "readPreference",
+}
+
+# read preference modes, by name
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+# clients shared within the process, keyed by URI and options
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def _reset_clients() -> None:
+    """Forget the clients inherited from the parent process: MongoClient is not fork-safe, the child process needs
+    its own connections. The inherited clients are not closed, since their sockets are still used by the parent."""
+    global _CLIENTS_LOCK
+    _CLIENTS.clear()
+    _CLIENTS_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_clients)
+
+
+def get_compressors(compressors: str) -> str:
+    """Filter the requested wire compressors, removing those whose library is not installed (zlib is always
+    available)
+
+    Parameters
+    ----------
+    compressors : str
+        comma-separated list of compressors, in order of preference (e.g. "zstd,snappy,zlib")
+
+    Returns
+    -------
+    str
+        comma-separated list of the available compressors
+    """
+
+    available = {"zlib": True, "zstd": zstandard is not None, "snappy": snappy is not None}
+
+    selected = []
+    for compressor in [c.strip() for c in compressors.split(",") if c.strip()]:
+        if available.get(compressor):
+            selected.append(compressor)
+        else:
+            logger.debug(f"MongoDB compressor {compressor} not available, skipping")
+
+    return ",".join(selected)
+
+
+def get_client_options(config) -> dict[str, str]:
+    """Read the MongoClient options (pool size, timeouts, compression, read preference) from the configuration.
+    Options set to 0 (or empty) are left to the pymongo defaults.
+
+    Parameters
+    ----------
+    config : Config
+        hpc configuration
+
+    Returns
+    -------
+    dict[str, str]
+        keyword arguments for MongoClient
+    """
+
+    options = {}
+    for key, option in MONGO_OPTIONS.items():
+        value = getattr(config, key, None)
+        if value in [None, "", 0, "0"]:
+            continue
+        if key == "mongo_compressors":
+            value = get_compressors(value)
+            if not value:
+                continue
+        elif key != "mongo_read_preference":
+            value = int(value)
+        options[option] = value
+
+    return options
+
+
+def get_client(uri: str, **client_options) -> MongoClient:
+    """Return the MongoClient for the given URI and options, creating it on first use. Clients are shared within
+    the process (each one maintains its own connection pool) and re-created after a fork.
+
+    Parameters
+    ----------
+    uri : str
+        MongoDB connection string
+    **client_options
+        options passed to MongoClient
+
+    Returns
+    -------
+    MongoClient
+        client connected to the MongoDB server
+    """
+
+    key = (uri, tuple(sorted((option, str(value)) for option, value in client_options.items())))
+
+    with _CLIENTS_LOCK:
+        if key not in _CLIENTS:
+            logger.debug(f"Creating MongoDB client with options {client_options}")
+            _CLIENTS[key] = MongoClient(uri, **client_options)
+        return _CLIENTS[key]
+
+
+def close_clients() -> None:
+    """Close all the clients created by the current process"""
+
+    with _CLIENTS_LOCK:
+        for client in _CLIENTS.values():
+            client.close()
+        _CLIENTS.clear()
+
+
+def get_collection(config, **client_options) -> Collection:
+    """Connect to the MongoDB server and access the collection with the Data Lake metadata
+
+    Parameters
+    ----------
+    config : Config
+        hpc configuration, containing the MongoDB server address, credentials, database, collection and client
+        options
+    **client_options
+        additional options passed to MongoClient (e.g. serverSelectionTimeoutMS), overriding the configuration
+
+    Returns
+    -------
+    Collection
+        MongoDB collection with the Data Lake metadata
+    """
+
+    # setting up MongoDB URI
+    mongodb_uri = f"mongodb://{config.user}:{config.password}@{config.ip}:{config.port}/"
+
+    # connecting to MongoDB server
+    logger.info(f"Connecting to MongoDB client: {mongodb_uri.split('@')[-1]}")  # without credentials
+    client = get_client(mongodb_uri, **{**get_client_options(config), **client_options})
+
+    # accessing collection
+    logger.info(f"Loading database {config.database}, collection {config.collection}")
+    return client[config.database][config.collection]
+
+
+def get_read_preference(name: str):
+    """Return the read preference corresponding to the given mode name
+
+    Parameters
+    ----------
+    name : str
+        read preference mode (primary, primaryPreferred, secondary, secondaryPreferred, nearest)
+
+    Returns
+    -------
+    _ServerMode
+        pymongo read preference
+
+    Raises
+    ------
+    ValueError
+        if the mode is not supported
+    """
+
+    try:
+        return READ_PREFERENCES[name]()
+    except KeyError:
+        raise ValueError(f"Unsupported read preference: {name}. Supported modes: {', '.join(READ_PREFERENCES)}")
+
+
+def get_read_collection(config, **client_options) -> Collection:
+    """Access the collection with the Data Lake metadata for running the user queries. Queries are routed to the
+    read-only URI (e.g. a replica set connection string with a read-only user), if configured, and use the query
+    read preference, so that they can be served by the secondaries instead of competing with the ingest writes on
+    the primary. Results metadata must still be written through get_collection.
+
+    Parameters
+    ----------
+    config : Config
+        hpc configuration, containing the MongoDB server address, credentials, database, collection and client
+        options
+    **client_options
+        additional options passed to MongoClient (e.g. serverSelectionTimeoutMS), overriding the configuration
+
+    Returns
+    -------
+    Collection
+        MongoDB collection with the Data Lake metadata, for read-only use
+    """
+
+    read_uri = getattr(config, "mongo_read_uri", "")
+    if read_uri:
+        logger.info(f"Connecting to read-only MongoDB client: {read_uri.split('@')[-1]}")  # without credentials
+        client = get_client(read_uri, **{**get_client_options(config), **client_options})
+        collection = client[config.database][config.collection]
+    else:
+        collection = get_collection(config, **client_options)
+
+    read_preference = getattr(config, "query_read_preference", "")
+    if read_preference:
+        collection = collection.with_options(read_preference=get_read_preference(read_preference))
+    logger.info(f"Query read preference: {collection.read_preference.mongos_mode}")
+
+    return collection
@@ -0,0 +1,167 @@
+"""
+Per-job profiling: time spent in each stage of the job and execution plan of the query
+
+Author: @lbabetto
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+import json
+from time import perf_counter
+from datetime import datetime
+from contextlib import contextmanager
+
+from pymongo.collection import Collection
+
+from dlaas.tuilib.tracing import TRACER
+
+
+def get_profile_name(job_id: str) -> str:
+    """Return the name of the profile file of a job
+
+    Parameters
+    ----------
+    job_id : str
+        unique job identifier
+
+    Returns
+    -------
+    str
+        profile file name (profile_<job_id>.json)
+    """
+    return f"profile_{job_id}.json"
+
+
+class JobProfile:
+    """Class collecting the time spent in each stage of a job (parse, retrieve, staging, script/container, save,
+    archive, upload) and the summary of the query execution plan. Stages are always timed, the profile is only
+    written/saved if enabled.
+
+    Attributes
+    ----------
+    job_id : str
+        unique job identifier
+    enabled : bool
+        whether the profile is written to the results and saved to MongoDB
+    stages : dict[str, float]
+        time spent in each stage, in seconds
+    explain : dict[str, str]
+        summary of the query execution plan (see indexes.explain_query)
+    counters : dict[str, int]
+        additional figures (e.g. number of input/output files)
+    """
+
+    def __init__(self, job_id: str, enabled: bool = False) -> None:
+        """Initialization for JobProfile class
+
+        Parameters
+        ----------
+        job_id : str
+            unique job identifier
+        enabled : bool, optional
+            whether the profile is written to the results and saved to MongoDB, False by default
+        """
+        self.job_id = job_id
+        self.enabled = str(enabled).lower() in ["true", "1"]
+        self.start_date = str(datetime.now())
+        self.stages = {}
+        self.explain = {}
+        self.counters = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        """Add time to a stage (stages can be run multiple times, e.g. once per shard)
+
+        Parameters
+        ----------
+        stage : str
+            stage name
+        seconds : float
+            elapsed time
+        """
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, stage: str):
+        """Context manager timing the enclosed code as the given stage (and recording it as a span, if the job is
+        traced)
+
+        Parameters
+        ----------
+        stage : str
+            stage name
+        """
+        start = perf_counter()
+        try:
+            with TRACER.span(stage):
+                yield
+        finally:
+            self.add(stage, perf_counter() - start)
+
+    def to_dict(self) -> dict[str, str]:
+        """Return the profile in JSON-serializable form
+
+        Returns
+        -------
+        dict[str, str]
+            job_id, start date, stages (in seconds, rounded to the ms), explain summary and counters
+        """
+        return {
+            "job_id": self.job_id,
+            "start_date": self.start_date,
+            "stages": {stage: round(seconds, 3) for stage, seconds in self.stages.items()},
+            "explain": self.explain,
+            "counters": self.counters,
+        }
+
+    def write(self, path: str) -> None:
+        """Write the profile to a JSON file (if enabled)
+
+        Parameters
+        ----------
+        path : str
+            path of the JSON file
+        """
+        if not self.enabled:
+            return
+
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+
+        logger.info(f"Job profile: {self.to_dict()}")
+
+    def save(self, collection: Collection) -> None:
+        """Save the profile in the MongoDB documents of the job results (if enabled)
+
+        Parameters
+        ----------
+        collection : Collection
+            MongoDB collection containing the results metadata
+        """
+        if not self.enabled:
+            return
+
+        collection.update_many({"job_id": self.job_id}, {"$set": {"profile": self.to_dict()}})
+
+
+def save_upload_profile(collection: Collection, job_id: str, summary: dict[str, str]) -> None:
+    """Add the archive/upload stages (timed by upload.run_upload, possibly in a separate job) to the profile saved
+    in the MongoDB documents of the job results
+
+    Parameters
+    ----------
+    collection : Collection
+        MongoDB collection containing the results metadata
+    job_id : str
+        unique job identifier
+    summary : dict[str, str]
+        upload summary returned by upload.run_upload
+    """
+
+    updates = {f"profile.stages.{stage}": seconds for stage, seconds in summary["stages"].items()}
+    updates["profile.counters.upload_bytes"] = summary["bytes"]
+    updates["profile.counters.upload_throughput_MBps"] = summary["throughput_MBps"]
+
+    collection.update_many({"job_id": job_id}, {"$set": updates})
+    logger.info(f"Saved upload profile for job {job_id}: {updates}")
@@ -0,0 +1,421 @@
+"""
+Cache for the translation of SQL queries to MongoDB spec
+
+Author: @lbabetto
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+import os
+import re
+import json
+import fcntl
+import threading
+from tempfile import mkstemp
+from functools import lru_cache
+from collections import OrderedDict
+from typing import Callable
+
+SQL_KEYWORDS = {"select", "from", "where", "and", "or", "not", "in", "like", "between", "is", "null"}
+
+PARAM_MARKER = "__dlaas_param_{}__"
+
+# tokens of an SQL query: single-quoted literals, double-quoted identifiers/literals, whitespace, anything else
+SQL_TOKENS = re.compile(r"('(?:[^']|'')*')|(\"[^\"]*\")|(\s+)|([^\s'\"]+)")
+PARAM_PATTERN = re.compile(r"__dlaas_param_([0-9]+)__")
+
+# statement structure expected by the parser
+SQL_STATEMENT = re.compile(r"\s*SELECT\s+.+?\s+FROM\s+\S+.*", flags=re.IGNORECASE | re.DOTALL)
+
+# MongoDB operators running server-side JavaScript, never produced by the SQL translation
+UNSAFE_OPERATORS = {"$where", "$function", "$accumulator"}
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql_query: str) -> str:
+    """Normalize an SQL query, so that equivalent queries share the same cache key: whitespace sequences are
+    collapsed to a single space and SQL keywords are uppercased. Quoted text is left untouched.
+
+    Parameters
+    ----------
+    sql_query : str
+        SQL query
+
+    Returns
+    -------
+    str
+        normalized SQL query
+    """
+
+    tokens = []
+    for single_quoted, double_quoted, whitespace, word in SQL_TOKENS.findall(sql_query.strip()):
+        if whitespace:
+            tokens.append(" ")
+        elif word:
+            tokens.append(word.upper() if word.lower() in SQL_KEYWORDS else word)
+        else:
+            tokens.append(single_quoted or double_quoted)
+
+    return "".join(tokens)
+
+
+def parameterize_sql(sql_query: str) -> tuple[str, list[str]]:
+    """Replace the single-quoted string literals of an SQL query with numbered markers, so that queries built
+    from the same template share the same cache entry. LIKE patterns are left in place, since the parser
+    translates them to regular expressions.
+
+    Parameters
+    ----------
+    sql_query : str
+        SQL query (preferably normalized)
+
+    Returns
+    -------
+    tuple[str, list[str]]
+        query template and list of the literal values, in order of appearance
+    """
+
+    params = []
+
+    def replace(match: re.Match) -> str:
+        if match.group(1):  # LIKE pattern
+            return match.group(0)
+        params.append(match.group(2)[1:-1].replace("''", "'"))
+        return f"'{PARAM_MARKER.format(len(params) - 1)}'"
+
+    template = re.sub(r"(LIKE\s+)?('(?:[^']|'')*')", replace, sql_query)
+
+    return template, params
+
+
+def bind_params(mongo_query, params: list[str], used: set[int] = None):
+    """Substitute the markers in a translated query template with the literal values. Only strings consisting of a
+    single marker are substituted: markers which ended up within other strings (e.g. in a regular expression) raise an
+    exception, so that the query can be translated without parameterization.
+
+    Parameters
+    ----------
+    mongo_query : Any
+        translated query template (nested dictionaries/lists)
+    params : list[str]
+        literal values, indexed by marker number
+    used : set[int], optional
+        if provided, filled with the numbers of the substituted markers
+
+    Returns
+    -------
+    Any
+        translated query with the literal values
+
+    Raises
+    ------
+    ValueError
+        if a marker is found within a longer string
+    """
+
+    if used is None:
+        used = set()
+
+    if isinstance(mongo_query, dict):
+        return {bind_params(key, params, used): bind_params(value, params, used) for key, value in mongo_query.items()}
+    elif isinstance(mongo_query, (list, tuple)):
+        return type(mongo_query)(bind_params(value, params, used) for value in mongo_query)
+    elif isinstance(mongo_query, str) and PARAM_PATTERN.search(mongo_query):
+        match = PARAM_PATTERN.fullmatch(mongo_query)
+        if not match:
+            raise ValueError(f"Query parameter cannot be bound in: {mongo_query}")
+        used.add(int(match.group(1)))
+        return params[int(match.group(1))]
+    else:
+        return mongo_query
+
+
+def check_query_filters(mongo_query) -> None:
+    """Make sure a translated query received from outside (e.g. in the job JSON) does not contain operators which
+    cannot result from the SQL translation and would run arbitrary code on the MongoDB server.
+
+    Parameters
+    ----------
+    mongo_query : Any
+        translated query (nested dictionaries/lists)
+
+    Raises
+    ------
+    ValueError
+        if an unsafe operator is found
+    """
+
+    if isinstance(mongo_query, dict):
+        for key, value in mongo_query.items():
+            if key in UNSAFE_OPERATORS:
+                raise ValueError(f"Operator not allowed in MongoDB query: {key}")
+            check_query_filters(value)
+    elif isinstance(mongo_query, list):
+        for value in mongo_query:
+            check_query_filters(value)
+
+
+def copy_query(mongo_query):
+    """Copy a translated query (nested dictionaries/lists), faster than copy.deepcopy for this kind of data
+
+    Parameters
+    ----------
+    mongo_query : Any
+        translated query
+
+    Returns
+    -------
+    Any
+        independent copy of the translated query
+    """
+
+    if isinstance(mongo_query, dict):
+        return {key: copy_query(value) for key, value in mongo_query.items()}
+    elif isinstance(mongo_query, list):
+        return [copy_query(value) for value in mongo_query]
+    else:
+        return mongo_query
+
+
+class QueryCache:
+    """LRU cache for the translation of SQL queries to MongoDB spec, keyed by normalized SQL text. Optionally,
+    string literals are parameterized (so that templated queries share the same entry) and entries are persisted
+    in a JSON file, shared between jobs.
+
+    Attributes
+    ----------
+    maxsize : int
+        maximum number of entries kept in memory, 0 disables the cache
+    path : str
+        path to the JSON file used as persistent tier, disabled if empty
+    parameterize : bool
+        whether to parameterize the string literals of the queries
+    hits : int
+        number of translations served from memory
+    disk_hits : int
+        number of translations served from the persistent tier
+    misses : int
+        number of translations which required parsing the query
+    """
+
+    UNPARAMETERIZABLE = "unparameterizable"  # cached for templates which cannot be bound back to their values
+
+    def __init__(self, maxsize: int = 256, path: str = "", parameterize: bool = False) -> None:
+        """Initialization for QueryCache class
+
+        Parameters
+        ----------
+        maxsize : int, optional
+            maximum number of entries kept in memory, 256 by default. 0 disables the cache
+        path : str, optional
+            path to the JSON file used as persistent tier, disabled by default
+        parameterize : bool, optional
+            whether to parameterize the string literals of the queries, False by default
+        """
+        self.maxsize = int(maxsize)
+        self.path = path
+        self.parameterize = parameterize
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._disk_entries = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Empty the in-memory tier and reset the statistics"""
+        with self._lock:
+            self._entries.clear()
+            self._disk_entries = None
+            self.hits = self.disk_hits = self.misses = 0
+
+    def _load_disk(self) -> dict:
+        """Load the persistent tier (once)"""
+        if self._disk_entries is None:
+            self._disk_entries = {}
+            if self.path and os.path.exists(self.path):
+                try:
+                    with open(self.path, "r") as f:
+                        self._disk_entries = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Could not read query cache {self.path}: {e}")
+        return self._disk_entries
+
+    def _save_disk(self, key: str, entry) -> None:
+        """Add an entry to the persistent tier. The file is re-read before writing, to keep the entries saved
+        by concurrent jobs, and atomically replaced; the whole update holds an exclusive lock on {path}.lock, so
+        that concurrent jobs do not lose each other's entries."""
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(f"{self.path}.lock", "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                entries = {}
+                if os.path.exists(self.path):
+                    with open(self.path, "r") as f:
+                        entries = json.load(f)
+                entries[key] = entry
+                content = json.dumps(entries)
+                fd, tmp_path = mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    f.write(content)
+                os.replace(tmp_path, self.path)
+            self._disk_entries = entries
+        except (OSError, TypeError, ValueError) as e:  # TypeError: entry cannot be serialized to JSON
+            logger.warning(f"Could not save query cache entry to {self.path}: {e}")
+
+    def _check_disk_entry(self, key: str, entry) -> bool:
+        """Validate an entry of the persistent tier, which can be modified outside of the process: it must be a
+        translated query ([filters, fields]) without unsafe operators (see check_query_filters), or the marker of
+        unparameterizable templates"""
+        if entry == self.UNPARAMETERIZABLE and PARAM_PATTERN.search(key):
+            return True
+        try:
+            query_filters, query_fields = entry
+            if not isinstance(query_filters, dict) or not isinstance(query_fields, dict):
+                raise ValueError("filters and fields must be dictionaries")
+            check_query_filters(query_filters)
+            check_query_filters(query_fields)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Ignoring invalid query cache entry for '{key}' in {self.path}: {e}")
+            return False
+        return True
+
+    def get(self, key: str):
+        """Retrieve an entry from the cache, looking in memory first and then in the persistent tier
+
+        Parameters
+        ----------
+        key : str
+            normalized SQL query (or template)
+
+        Returns
+        -------
+        Any
+            cached entry, None if not found
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+            if self.path and key in self._load_disk() and self._check_disk_entry(key, self._disk_entries[key]):
+                entry = self._disk_entries[key]
+                self._store(key, entry)
+                self.disk_hits += 1
+                return entry
+
+        return None
+
+    def put(self, key: str, entry) -> None:
+        """Store an entry in the cache (and in the persistent tier, if enabled)
+
+        Parameters
+        ----------
+        key : str
+            normalized SQL query (or template)
+        entry : Any
+            JSON-serializable value to be cached
+        """
+        with self._lock:
+            self._store(key, entry)
+            if self.path:
+                self._save_disk(key, entry)
+
+    def _store(self, key: str, entry) -> None:
+        """Store an entry in memory, evicting the least recently used ones"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def translate(self, sql_query: str, parse: Callable[[str], tuple[dict, dict]]) -> tuple[dict, dict]:
+        """Translate an SQL query to MongoDB spec, parsing it only if no equivalent query is found in the cache
+
+        Parameters
+        ----------
+        sql_query : str
+            SQL query
+        parse : Callable[[str], tuple[dict, dict]]
+            function translating an SQL query to the MongoDB filters and fields
+
+        Returns
+        -------
+        tuple[dict, dict]
+            dictionaries containing the filters (WHERE) and fields (SELECT) in MongoDB spec
+        """
+
+        if self.maxsize <= 0 and not self.path:
+            return parse(sql_query)
+
+        normalized = normalize_sql(sql_query)
+
+        if self.parameterize and "'" in normalized:
+            template, params = parameterize_sql(normalized)
+            entry = self.get(template)
+
+            if entry is None:
+                with self._lock:
+                    self.misses += 1
+                entry = list(parse(template))
+                try:
+                    used = set()
+                    translated = bind_params(entry, params, used)
+                    if used != set(range(len(params))):
+                        raise ValueError("Not all query parameters were bound")
+                except ValueError as e:
+                    logger.debug(f"Query cannot be parameterized ({e}), caching it as is")
+                    self.put(template, self.UNPARAMETERIZABLE)
+                else:
+                    self.put(template, entry)
+                    return tuple(translated)
+
+            elif entry != self.UNPARAMETERIZABLE:
+                logger.debug(f"Query cache hit for template: {template}")
+                return tuple(bind_params(entry, params))
+
+        entry = self.get(normalized)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            entry = list(parse(normalized))
+            self.put(normalized, entry)
+        else:
+            logger.debug(f"Query cache hit for query: {normalized}")
+
+        return tuple(copy_query(entry))
+
+
+QUERY_CACHE = QueryCache()
+
+
+def configure_query_cache(maxsize: int = 256, path: str = "", parameterize: bool = False) -> QueryCache:
+    """Set up the cache used by convert_SQL_to_mongo, discarding the current entries
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        maximum number of entries kept in memory, 256 by default. 0 disables the in-memory tier
+    path : str, optional
+        path to the JSON file used as persistent tier, disabled by default
+    parameterize : bool, optional
+        whether to parameterize the string literals of the queries, False by default
+
+    Returns
+    -------
+    QueryCache
+        the configured cache
+    """
+
+    QUERY_CACHE.clear()
+    QUERY_CACHE.maxsize = int(maxsize)
+    QUERY_CACHE.path = os.path.expanduser(path) if path else ""
+    QUERY_CACHE.parameterize = str(parameterize).lower() in ["true", "1"]
+    logger.debug(f"Query cache: maxsize {QUERY_CACHE.maxsize}, path '{QUERY_CACHE.path}', parameterize {parameterize}")
+
+    return QUERY_CACHE
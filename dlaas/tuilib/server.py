@@ -10,9 +10,368 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-from os.path import basename, exists
+import os
+import sys
+from os.path import basename
+import json
+import math
+import signal
+import shutil
+import hashlib
 import subprocess
+from tempfile import gettempdir
+from datetime import datetime, timezone
+from pymongo.errors import PyMongoError
+from dlaas.tuilib.backends import LocalWorkerPool, get_backend, sandbox_command
 from dlaas.tuilib.common import Config, UserInput
+from dlaas.tuilib.hpc import convert_SQL_to_mongo, preflight_query, get_watermark
+from dlaas.tuilib.logs import get_log_files, read_log
+from dlaas.tuilib.metrics import METRICS
+from dlaas.tuilib.mongo import get_collection, get_read_collection
+from dlaas.tuilib.query import SQL_STATEMENT, normalize_sql
+
+from dlaas.tuilib.upload import get_archive_name, get_objects_prefix
+
+WALLTIME_OVERHEAD = 600  # seconds added to the estimated walltime (environment setup, archiving, etc.)
+WALLTIME_MARGIN = 1.5  # safety factor applied to the estimated processing time
+
+
+def validate_query(json_path: str) -> tuple[dict[str, str], dict[str, str]]:
+    """Translate the SQL query to MongoDB spec before submitting the job, so that invalid queries are rejected
+    without waiting in the Slurm queue. The translation is added to the JSON file with the user input
+    (`query_filters` and `query_fields` keys), so that the HPC version does not need to parse the query again.
+    Internal keys provided by the user (see UserInput.INTERNAL) are always replaced or removed, since the HPC
+    version trusts them.
+
+    Parameters
+    ----------
+    json_path : str
+        Path to the JSON file with the user input
+
+    Returns
+    -------
+    tuple[dict[str, str], dict[str, str]]
+        dictionaries containing the filters (WHERE) and fields (SELECT) in MongoDB spec
+
+    Raises
+    ------
+    SyntaxError
+        if the SQL query cannot be translated
+    ValueError
+        if the translation cannot be saved in JSON format
+    """
+
+    user_input = UserInput.from_json(json_path=json_path)
+    logger.info(f"Validating SQL query: {user_input.sql_query}")
+
+    provided = [key for key in UserInput.INTERNAL if getattr(user_input, key) is not None]
+    if provided:
+        logger.warning(f"Ignoring internal keys provided in the user input: {provided}")
+
+    if not SQL_STATEMENT.fullmatch(user_input.sql_query):
+        raise SyntaxError(f"Invalid SQL query, expected 'SELECT ... FROM ...': {user_input.sql_query}")
+
+    try:
+        query_filters, query_fields = convert_SQL_to_mongo(sql_query=user_input.sql_query)
+    except Exception as e:  # parser errors are not limited to a specific exception type
+        raise SyntaxError(f"Invalid SQL query: {user_input.sql_query} ({type(e).__name__}: {e})")
+
+    try:
+        update_json_input(
+            json_path=json_path,
+            updates={"query_filters": query_filters, "query_fields": query_fields},
+            remove=UserInput.INTERNAL,
+        )
+    except TypeError as e:  # the JSON would keep the keys provided by the user, if any
+        raise ValueError(f"MongoDB query cannot be saved to {json_path}, job rejected ({e})")
+
+    return query_filters, query_fields
+
+
+def update_json_input(json_path: str, updates: dict[str, str], remove: tuple[str] = ()) -> None:
+    """Add, overwrite or remove keys in the JSON file with the user input. The file is left untouched if the updated
+    content cannot be serialized.
+
+    Parameters
+    ----------
+    json_path : str
+        Path to the JSON file with the user input
+    updates : dict[str, str]
+        keys to be added/overwritten
+    remove : tuple[str], optional
+        keys to be removed (before adding the updates), none by default
+
+    Raises
+    ------
+    TypeError
+        if the updated content cannot be serialized to JSON
+    """
+
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    for key in remove:
+        data.pop(key, None)
+    data.update(updates)
+
+    content = json.dumps(data)
+    with open(f"{json_path}.tmp", "w") as f:
+        f.write(content)
+    os.replace(f"{json_path}.tmp", json_path)  # new inode, the cached input (see UserInput.from_json) is discarded
+
+
+def walltime_to_seconds(walltime: str) -> int:
+    """Convert a Slurm walltime (DD-HH:MM:SS, HH:MM:SS, MM:SS or SS) to seconds
+
+    Parameters
+    ----------
+    walltime : str
+        Slurm walltime
+
+    Returns
+    -------
+    int
+        walltime in seconds
+    """
+
+    days, _, time = str(walltime).rpartition("-")
+    seconds = 0
+    for value in time.split(":"):
+        seconds = seconds * 60 + int(value)
+
+    return int(days or 0) * 86400 + seconds
+
+
+def estimate_resources(matches: int, config: Config) -> dict[str, str]:
+    """Estimate the number of nodes and the walltime needed for processing the files matching a query, based on the
+    expected throughput of the analysis (files_per_node, seconds_per_file) and within the configured limits
+    (max_nodes, max_walltime).
+
+    Parameters
+    ----------
+    matches : int
+        number of files matching the query
+    config : Config
+        server configuration
+
+    Returns
+    -------
+    dict[str, str]
+        number of nodes ("nodes") and walltime in HH:MM:SS format ("walltime")
+    """
+
+    nodes = min(max(1, math.ceil(matches / int(config.files_per_node))), int(config.max_nodes))
+    files_per_node = math.ceil(matches / nodes)
+
+    seconds = WALLTIME_OVERHEAD + math.ceil(WALLTIME_MARGIN * float(config.seconds_per_file) * files_per_node)
+    seconds = min(seconds, walltime_to_seconds(config.max_walltime))
+
+    walltime = f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    logger.info(f"Estimated resources for {matches} files: {nodes} nodes, walltime {walltime}")
+
+    return {"nodes": nodes, "walltime": walltime}
+
+
+def preflight_job(json_path: str) -> dict[str, int]:
+    """Run the query on the metadata before submitting the job, counting the matching files and their total size.
+    Queries exceeding the configured limits (max_matches, max_result_size) are refused. If auto_resources is
+    enabled, the number of nodes and the walltime of the job are chosen based on the number of matches, and
+    saved in the config_server options of the JSON file with the user input.
+    If the MongoDB server cannot be reached, the job is submitted without the pre-flight check.
+
+    Parameters
+    ----------
+    json_path : str
+        Path to the JSON file with the user input
+
+    Returns
+    -------
+    dict[str, int]
+        number of matching files ("matches") and their total size in bytes ("size"), empty if the pre-flight check
+        was not run
+
+    Raises
+    ------
+    RuntimeError
+        if the query exceeds the configured limits
+    """
+
+    user_input = UserInput.from_json(json_path=json_path)
+
+    # loading server config
+    config = Config("server")
+    if user_input.config_server:
+        config.load_custom_config(user_input.config_server)
+
+    if str(config.preflight).lower() not in ["true", "1"]:
+        return {}
+
+    # loading hpc config, for accessing the metadata
+    config_hpc = Config("hpc")
+    if user_input.config_hpc:
+        config_hpc.load_custom_config(user_input.config_hpc)
+
+    if user_input.query_filters is not None:
+        query_filters = user_input.query_filters
+    else:
+        query_filters, _ = convert_SQL_to_mongo(sql_query=user_input.sql_query)
+
+    try:
+        collection = get_read_collection(config_hpc, serverSelectionTimeoutMS=5000)
+        result = preflight_query(collection=collection, query_filters=query_filters, size_field=config_hpc.size_field)
+    except PyMongoError as e:
+        logger.warning(f"Pre-flight check failed, submitting job without it: {e}")
+        return {}
+
+    if int(config.max_matches) and result["matches"] > int(config.max_matches):
+        raise RuntimeError(f"Query matches {result['matches']} files, above the limit of {config.max_matches}")
+
+    if float(config.max_result_size) and result["size"] > float(config.max_result_size) * 1e9:
+        raise RuntimeError(
+            f"Query matches {result['size'] / 1e9:.1f} GB of files, above the limit of {config.max_result_size} GB"
+        )
+
+    if str(config.auto_resources).lower() in ["true", "1"]:
+        resources = estimate_resources(matches=result["matches"], config=config)
+        update_json_input(
+            json_path=json_path, updates={"config_server": {**(user_input.config_server or {}), **resources}}
+        )
+
+    return result
+
+
+def get_job_hash(user_input: UserInput, query_filters: dict[str, str], query_fields: dict[str, str]) -> str:
+    """Compute the content hash of a job: normalized SQL query, its MongoDB translation, user script (content),
+    container (URL and command) and custom HPC configuration. Jobs running containers from a local path or from a
+    URL which is not pinned to a digest (e.g. docker://image@sha256:...) cannot be cached, since the container
+    content may change under the same name.
+
+    Parameters
+    ----------
+    user_input : UserInput
+        user input of the job
+    query_filters : dict[str, str]
+        filters (WHERE) in MongoDB spec
+    query_fields : dict[str, str]
+        fields (SELECT) in MongoDB spec
+
+    Returns
+    -------
+    str
+        hexadecimal SHA-256 digest, empty if the job cannot be cached
+    """
+
+    if user_input.container_path or (user_input.container_url and "@sha256:" not in user_input.container_url):
+        logger.info("Container is not pinned to a digest, job cannot be cached")
+        return ""
+
+    script = ""
+    if user_input.script_path:
+        with open(user_input.script_path, "rb") as f:
+            script = hashlib.sha256(f.read()).hexdigest()
+
+    content = {
+        "sql_query": normalize_sql(user_input.sql_query),
+        "query_filters": query_filters,
+        "query_fields": query_fields,
+        "script": script,
+        "container_url": user_input.container_url,
+        "exec_command": user_input.exec_command,
+        "config_hpc": user_input.config_hpc,
+    }
+
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def lookup_job_cache(json_path: str, max_candidates: int = 5) -> dict[str, str]:
+    """Look for a previous job with the same content hash (see get_job_hash) whose matching files have not changed
+    since it was run (same watermark, see hpc.get_watermark) and whose results were uploaded (entries flagged by
+    upload.mark_uploaded, since the entries are registered before the upload). On a cache hit, the results entries of
+    the previous job are registered again under the new job identifier (with a "cached_from" field), so that the
+    results can be retrieved as for any other job, and the job does not need to be submitted. On a cache miss, the
+    job hash is added to the JSON file with the user input, so that the HPC version saves it with the results.
+    If the job cache is disabled, the job cannot be cached or the MongoDB server cannot be reached, nothing is done.
+
+    Parameters
+    ----------
+    json_path : str
+        Path to the JSON file with the user input
+    max_candidates : int, optional
+        maximum number of previous jobs (most recent first) whose watermark is checked, 5 by default
+
+    Returns
+    -------
+    dict[str, str]
+        on a cache hit, identifier ("job_id") and S3 keys ("s3_keys") of the previous job, empty otherwise
+    """
+
+    user_input = UserInput.from_json(json_path=json_path)
+
+    # loading server config
+    config = Config("server")
+    if user_input.config_server:
+        config.load_custom_config(user_input.config_server)
+
+    if str(config.job_cache).lower() not in ["true", "1"]:
+        return {}
+
+    # loading hpc config, for accessing the metadata
+    config_hpc = Config("hpc")
+    if user_input.config_hpc:
+        config_hpc.load_custom_config(user_input.config_hpc)
+
+    if user_input.query_filters is not None:
+        query_filters, query_fields = user_input.query_filters, user_input.query_fields
+    else:
+        query_filters, query_fields = convert_SQL_to_mongo(sql_query=user_input.sql_query)
+
+    job_hash = get_job_hash(user_input=user_input, query_filters=query_filters, query_fields=query_fields)
+    if not job_hash:
+        return {}
+    logger.info(f"Job hash: {job_hash}")
+
+    try:
+        collection = get_read_collection(config_hpc, serverSelectionTimeoutMS=5000)
+
+        candidates = []
+        for entry in collection.find(
+            {"job_hash": job_hash, "cached_from": {"$exists": False}, "uploaded": True},
+            projection={"job_id": 1, "job_watermark": 1},
+            sort=[("upload_date", -1)],
+        ):
+            if entry["job_id"] not in [job_id for job_id, _ in candidates]:
+                candidates.append((entry["job_id"], entry["job_watermark"]))
+            if len(candidates) >= max_candidates:
+                break
+
+        for job_id, watermark in candidates:
+            if get_watermark(collection=collection, query_filters=query_filters, exclude_job_id=job_id) != watermark:
+                logger.debug(f"Data matching the query changed since job {job_id}")
+                continue
+
+            # cache hit: the results of the previous job are registered for the new one
+            results = get_collection(config_hpc, serverSelectionTimeoutMS=5000)
+            entries = [entry for entry in results.find({"job_id": job_id, "job_hash": job_hash, "uploaded": True})]
+            if not entries:  # results of the previous job were removed in the meantime
+                continue
+            for entry in entries:
+                entry.pop("_id")
+                entry.update(
+                    {"job_id": user_input.id, "cached_from": job_id, "upload_date": datetime.now(timezone.utc)}
+                )
+            results.insert_many(entries, ordered=False)
+
+            cached = {"job_id": job_id, "s3_keys": [entry["s3_key"] for entry in entries]}
+            logger.info(f"Job cache hit, results of job {user_input.id} are those of job {job_id}: {cached}")
+            return cached
+
+    except PyMongoError as e:
+        logger.warning(f"Job cache lookup failed, submitting job: {e}")
+        return {}
+
+    logger.info("Job cache miss")
+    update_json_input(json_path=json_path, updates={"job_hash": job_hash})
+
+    return {}
 
 
 def create_remote_directory(json_path: str) -> tuple[str, str]:
@@ -31,23 +390,15 @@ def create_remote_directory(json_path: str) -> tuple[str, str]:
 
     user_input = UserInput.from_json(json_path=json_path)
     logger.info(f"Creating remote directory: {user_input.id}")
-    logger.debug(f"Full user input: {user_input.__dict__}")
+    logger.debug("Full user input: %r", user_input)
 
     # loading server config
     config = Config("server")
     if user_input.config_server:
         config.load_custom_config(user_input.config_server)
 
-    ssh_cmd = f"ssh -i {config.ssh_key} {config.user}@{config.host} 'mkdir $SCRATCH/{user_input.id}'"
-    logger.debug(f"launching command: {ssh_cmd}")
-    stdout, stderr = subprocess.Popen(
-        ssh_cmd,
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    ).communicate()
-    stdout = str(stdout, encoding="utf-8")
-    stderr = str(stderr, encoding="utf-8")
+    with METRICS.timer("dl_tui_ssh_seconds", step="create_remote_directory"):
+        stdout, stderr = get_backend(config).run(f"mkdir $SCRATCH/{user_input.id}")
     logger.debug(f"mkdir stdout: {stdout}")
     logger.debug(f"mkdir stderr: {stderr}")
 
@@ -73,7 +424,7 @@ def copy_json_input(json_path: str) -> tuple[str, str]:
 
     user_input = UserInput.from_json(json_path=json_path)
     logger.info(f"Copying user input in JSON form to HPC")
-    logger.debug(f"Full user input: {user_input.__dict__}")
+    logger.debug("Full user input: %r", user_input)
 
     # loading server config
     config = Config("server")
@@ -81,16 +432,8 @@ def copy_json_input(json_path: str) -> tuple[str, str]:
         config.load_custom_config(user_input.config_server)
 
     # copying input JSON
-    ssh_cmd = f"scp -i {config.ssh_key} {json_path} {config.user}@{config.host}:\$SCRATCH/{user_input.id}/{basename(json_path)}"
-    logger.debug(f"launching command: {ssh_cmd}")
-    stdout, stderr = subprocess.Popen(
-        ssh_cmd,
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    ).communicate()
-    stdout = str(stdout, encoding="utf-8")
-    stderr = str(stderr, encoding="utf-8")
+    with METRICS.timer("dl_tui_ssh_seconds", step="copy_json_input"):
+        stdout, stderr = get_backend(config).copy(json_path, f"$SCRATCH/{user_input.id}/{basename(json_path)}")
     logger.debug(f"scp json input stdout: {stdout}")
     logger.debug(f"scp json input stderr: {stderr}")
 
@@ -114,7 +457,7 @@ def copy_user_executable(json_path: str) -> tuple[str, str, int]:
 
     user_input = UserInput.from_json(json_path=json_path)
     logger.info(f"Copying user script/container to remote directory")
-    logger.debug(f"Full user input: {user_input.__dict__}")
+    logger.debug("Full user input: %r", user_input)
 
     # loading server config
     config = Config("server")
@@ -122,20 +465,20 @@ def copy_user_executable(json_path: str) -> tuple[str, str, int]:
         config.load_custom_config(user_input.config_server)
 
     # SLURM parameters
-    user = config.user
-    host = config.host
-    ssh_key = config.ssh_key
     partition = config.upload_partition
     account = config.account
     mail = config.mail
 
+    backend = get_backend(config)
+    ssh_cmd = ""
+
     if user_input.script_path:
         logger.debug(f"Python script: \n{user_input.script_path}")
-        full_ssh_cmd = f"scp -i {ssh_key} {user_input.script_path} {user}@{host}:\$SCRATCH/{user_input.id}/{basename(user_input.script_path)}"
+        source = user_input.script_path
 
     elif user_input.container_path:
         logger.debug(f"Container path: \n{user_input.container_path}")
-        full_ssh_cmd = f"scp -i {ssh_key} {user_input.container_path} {user}@{host}:\$SCRATCH/{user_input.id}/{basename(user_input.container_path)}"
+        source = user_input.container_path
 
     elif user_input.container_url:
         logger.debug(f"Container URL: \n{user_input.container_url}")
@@ -143,33 +486,25 @@ def copy_user_executable(json_path: str) -> tuple[str, str, int]:
         wrap_cmd = "module load singularity; "  # FIXME: necessary for G100
         wrap_cmd += f"singularity build container_{user_input.id}.sif {user_input.container_url}"
 
-        ssh_cmd = f"cd \$SCRATCH/{user_input.id}; "
+        ssh_cmd = f"cd $SCRATCH/{user_input.id}; "
         ssh_cmd += f"sbatch -p {partition} -A {account} "
         ssh_cmd += f"--mail-type ALL --mail-user {mail} "
         ssh_cmd += f"-t 01:00:00 "
         ssh_cmd += f"--wrap '{wrap_cmd}'"
 
-        # Generate full SSH command
-        full_ssh_cmd = rf'ssh -i {ssh_key} {config.user}@{config.host} "{ssh_cmd}"'
-
     else:
         return "", "", None
 
-    logger.debug(f"launching command: {full_ssh_cmd}")
-
-    stdout, stderr = subprocess.Popen(
-        full_ssh_cmd,
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    ).communicate()
+    with METRICS.timer("dl_tui_ssh_seconds", step="copy_user_executable"):
+        if ssh_cmd:
+            stdout, stderr = backend.run(ssh_cmd)
+        else:
+            stdout, stderr = backend.copy(source, f"$SCRATCH/{user_input.id}/{basename(source)}")
 
-    stdout = str(stdout, encoding="utf-8")
-    stderr = str(stderr, encoding="utf-8")
     logger.debug(f"stdout: {stdout}")
     logger.debug(f"stderr: {stderr}")
 
-    if user_input.container_url:
+    if ssh_cmd:
         try:
             slurm_job_id = int(stdout.lstrip("Submitted batch job "))
             logger.info(f"Building container on HPC. Job ID | Slurm ID: {user_input.id} | {slurm_job_id}")
@@ -207,7 +542,7 @@ def launch_job(json_path: str, build_job_id: int = 0) -> tuple[str, str, int]:
 
     user_input = UserInput.from_json(json_path=json_path)
     logger.info(f"Launching job on HPC")
-    logger.debug(f"Full user input: {user_input.__dict__}")
+    logger.debug("Full user input: %r", user_input)
 
     logger.info(f"Running SQL query: {user_input.sql_query}")
 
@@ -216,7 +551,7 @@ def launch_job(json_path: str, build_job_id: int = 0) -> tuple[str, str, int]:
     if user_input.config_server:
         config.load_custom_config(user_input.config_server)
 
-    logger.debug(f"Server config: {config.__dict__}")
+    logger.debug("Server config: %s", config)
 
     # SLURM parameters
     partition = config.compute_partition
@@ -228,7 +563,7 @@ def launch_job(json_path: str, build_job_id: int = 0) -> tuple[str, str, int]:
     tasks_per_node = config.tasks_per_node
     cpus_per_task = config.cpus_per_task
     gpus = config.gpus
-    ssh_key = config.ssh_key
+    inline_upload = str(config.inline_upload).lower() in ["true", "1"]
 
     # Creating wrap command to be passed to sbatch
     # NOTE: it is probably not necessary to source the environment as the executable can be ran safely via the
@@ -236,11 +571,18 @@ def launch_job(json_path: str, build_job_id: int = 0) -> tuple[str, str, int]:
     # since we are sure the correct libraries will be available to the executable
     wrap_cmd = f"module load python; "
     wrap_cmd += f"source {config.venv_path}/bin/activate; "
-    wrap_cmd += f"dl_tui_hpc {basename(json_path)}; "
-    wrap_cmd += "touch JOB_DONE"
+    if inline_upload:  # results are uploaded at the end of the run, no separate upload job is needed
+        wrap_cmd += f"dl_tui_hpc run --upload {basename(json_path)} && "
+        wrap_cmd += "touch RESULTS_UPLOADED; "  # only if the upload succeeded
+        wrap_cmd += "touch JOB_DONE"
+        if not config.debug:
+            wrap_cmd += f"; rm -rf ../{user_input.id}"
+    else:
+        wrap_cmd += f"dl_tui_hpc run {basename(json_path)}; "
+        wrap_cmd += "touch JOB_DONE"
 
     # Generating SSH command
-    ssh_cmd = f"cd \$SCRATCH/{user_input.id}; "
+    ssh_cmd = f"cd $SCRATCH/{user_input.id}; "
     ssh_cmd += f"sbatch -p {partition} -A {account} --qos {qos} "
     ssh_cmd += f"--mail-type ALL --mail-user {mail} "
     ssh_cmd += f"-t {walltime} -N {nodes} "
@@ -252,20 +594,11 @@ def launch_job(json_path: str, build_job_id: int = 0) -> tuple[str, str, int]:
         ssh_cmd += f"-d afterok:{build_job_id} "
     ssh_cmd += f"--wrap '{wrap_cmd}'"
 
-    full_ssh_cmd = rf'ssh -i {ssh_key} {config.user}@{config.host} "{ssh_cmd}"'
-
-    logger.debug(f"Launching command via ssh:\n{ssh_cmd}")
-    logger.debug(f"Full ssh command:\n{full_ssh_cmd}")
+    logger.debug(f"Launching command on HPC:\n{ssh_cmd}")
 
-    stdout, stderr = subprocess.Popen(
-        full_ssh_cmd,
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    ).communicate()
+    with METRICS.timer("dl_tui_ssh_seconds", step="launch_job"):
+        stdout, stderr = get_backend(config).run(ssh_cmd)
 
-    stdout = str(stdout, encoding="utf-8")
-    stderr = str(stderr, encoding="utf-8")
     logger.debug(f"stdout: {stdout}")
     logger.debug(f"stderr: {stderr}")
 
@@ -279,7 +612,9 @@ def launch_job(json_path: str, build_job_id: int = 0) -> tuple[str, str, int]:
 
 
 def upload_results(json_path: str, slurm_job_id: int) -> tuple[str, str]:
-    """Upload results of completed job to S3 via the Python script created by the HPC version.
+    """Upload results of completed job to S3 via the `dl_tui_hpc upload` command, using the manifest written by the
+    HPC version. If the `inline_upload` option is enabled, the results are uploaded by the compute job itself and no
+    upload job is submitted.
 
     Parameters
     ----------
@@ -302,53 +637,47 @@ def upload_results(json_path: str, slurm_job_id: int) -> tuple[str, str]:
 
     user_input = UserInput.from_json(json_path=json_path)
     logger.info(f"Uploading results to S3 and MongoDB")
-    logger.debug(f"Full user input: {user_input.__dict__}")
+    logger.debug("Full user input: %r", user_input)
 
     # loading server config
     config = Config("server")
     if user_input.config_server:
         config.load_custom_config(user_input.config_server)
 
-    logger.debug(f"Server config: {config.__dict__}")
+    logger.debug("Server config: %s", config)
+
+    if str(config.inline_upload).lower() in ["true", "1"]:
+        logger.info(f"Inline upload enabled, results will be uploaded by the compute job {slurm_job_id}")
+        return "", ""
 
     # SLURM parameters
     partition = config.upload_partition
     account = config.account
     mail = config.mail
-    ssh_key = config.ssh_key
 
     # Creating wrap command to be passed to sbatch
     wrap_cmd = f"module load python; "  # TODO: placeholder for G100, as Python is not available by default.
     wrap_cmd += f"source {config.venv_path}/bin/activate; "
     wrap_cmd += f"cd run_job_*; "  # if a script/container was also provided
-    wrap_cmd += f"python upload_results_{user_input.id}.py; "
-    wrap_cmd += "touch RESULTS_UPLOADED; "
+    wrap_cmd += f"dl_tui_hpc upload upload_manifest_{user_input.id}.json && "
+    wrap_cmd += "touch RESULTS_UPLOADED; "  # only if the upload succeeded
     if not config.debug:
         wrap_cmd += f"rm -rf ../{user_input.id}; "
         wrap_cmd += f"rm -rf ../../{user_input.id}"
 
     # Generating SSH command
-    ssh_cmd = f"cd \$SCRATCH/{user_input.id}; "
+    ssh_cmd = f"cd $SCRATCH/{user_input.id}; "
     ssh_cmd += f"sbatch -p {partition} -A {account} "
     ssh_cmd += f"--mail-type ALL --mail-user {mail} "
     ssh_cmd += f"-t 00:10:00 "
     ssh_cmd += f"-d afterok:{slurm_job_id} "
     ssh_cmd += f"--wrap '{wrap_cmd}'"
 
-    full_ssh_cmd = rf'ssh -i {ssh_key} {config.user}@{config.host} "{ssh_cmd}"'
+    logger.debug(f"Launching command on HPC:\n{ssh_cmd}")
 
-    logger.debug(f"Launching command via ssh:\n{ssh_cmd}")
-    logger.debug(f"Full ssh command:\n{full_ssh_cmd}")
+    with METRICS.timer("dl_tui_ssh_seconds", step="upload_results"):
+        stdout, stderr = get_backend(config).run(ssh_cmd)
 
-    stdout, stderr = subprocess.Popen(
-        full_ssh_cmd,
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    ).communicate()
-
-    stdout = str(stdout, encoding="utf-8")
-    stderr = str(stderr, encoding="utf-8")
     logger.debug(f"stdout: {stdout}")
     logger.debug(f"stderr: {stderr}")
 
@@ -358,8 +687,7 @@ def upload_results(json_path: str, slurm_job_id: int) -> tuple[str, str]:
     except ValueError:  # exception is raised during conversion of empty string to int
         raise RuntimeError(f"Something gone wrong, job was not launched.\nstdout: {stdout}\nstderr: {stderr}")
 
-    logger.info(f"Results are available on S3 with the key: results_{user_input.id}.zip")
-    logger.info(f'Results are available on MongoDB with the key: "job_id": {user_input.id}')
+    log_results_location(user_input)
 
     if "Submitted batch job" not in stdout:
         raise RuntimeError(f"Something gone wrong, job was not launched.\nstdout: {stdout}\nstderr: {stderr}")
@@ -367,6 +695,189 @@ def upload_results(json_path: str, slurm_job_id: int) -> tuple[str, str]:
     return stdout, stderr
 
 
+def log_results_location(user_input: UserInput) -> None:
+    """Log the S3 key (or prefix) and the MongoDB key under which the results of a job are saved
+
+    Parameters
+    ----------
+    user_input : UserInput
+        user input of the job
+    """
+
+    config_hpc = user_input.config_hpc or {}
+    if config_hpc.get("output_layout") == "objects":
+        logger.info(f"Results are available on S3 with the prefix: {get_objects_prefix(user_input.id)}")
+    else:
+        archive = get_archive_name(user_input.id, config_hpc.get("archive_format", "zip"))
+        logger.info(f"Results are available on S3 with the key: {archive}")
+    logger.info(f'Results are available on MongoDB with the key: "job_id": {user_input.id}')
+
+
+def get_local_dir(config: Config) -> str:
+    """Return the folder in which the local jobs are run (local_dir option, by default dlaas_local in the temporary
+    folder)
+
+    Parameters
+    ----------
+    config : Config
+        server configuration
+
+    Returns
+    -------
+    str
+        path of the folder
+    """
+    return os.path.expanduser(config.local_dir) if config.local_dir else os.path.join(gettempdir(), "dlaas_local")
+
+
+def is_local_job(json_path: str, preflight: dict[str, int]) -> bool:
+    """Check whether a job is small enough to be run on the server node instead of being submitted to Slurm, i.e.
+    whether the pre-flight check found at most local_max_matches matching files. The local_* options are read from
+    the server configuration only (they cannot be set per job), and local execution requires a separate user to run
+    the jobs (local_user) and the parallel filesystem (pfs_prefix_path) to be mounted on the server node. Jobs running
+    a container (from a URL or a local path) are always submitted, since containers are run through srun on the
+    compute nodes.
+
+    Parameters
+    ----------
+    json_path : str
+        Path to the JSON file with the user input
+    preflight : dict[str, int]
+        result of the pre-flight check (see preflight_job), empty if it was not run
+
+    Returns
+    -------
+    bool
+        True if the job can be run locally
+    """
+
+    user_input = UserInput.from_json(json_path=json_path)
+
+    # loading server config, without the custom options of the job
+    config = Config("server")
+
+    if not int(config.local_max_matches) or "matches" not in preflight:
+        return False
+
+    if user_input.container_url or user_input.container_path:
+        return False
+
+    if not config.local_user:
+        logger.warning("Local execution requires a separate user to run the jobs (local_user), submitting job to HPC")
+        return False
+
+    config_hpc = Config("hpc")
+    if user_input.config_hpc:
+        config_hpc.load_custom_config(user_input.config_hpc)
+    if not os.path.isdir(config_hpc.pfs_prefix_path):
+        logger.warning(f"{config_hpc.pfs_prefix_path} is not mounted on the server node, submitting job to HPC")
+        return False
+
+    return preflight["matches"] <= int(config.local_max_matches)
+
+
+def run_local_job(json_path: str) -> tuple[str, str]:
+    """Run a job on the server node, if a local worker is free (see local_workers), in a sandboxed `dl_tui_hpc run
+    --upload` process: the job runs in its own folder, as a separate user (local_user, if set), with limited CPU time
+    (local_timeout) and memory (local_memory), at low priority, and is killed if it does not complete within
+    local_timeout. The local_* options are read from the server configuration only. The results are
+    uploaded to S3 at the end of the job, as with the inline_upload option. If the job fails, its log is kept in
+    the logs subfolder of local_dir (<job_id>.log), since the job folder is removed.
+
+    Parameters
+    ----------
+    json_path : str
+        Path to the JSON file with the user input
+
+    Returns
+    -------
+    tuple[str, str]
+        stdout and stderr of the job, None if all the local workers are busy (the job must be submitted to Slurm)
+
+    Raises
+    ------
+    RuntimeError
+        if the job folder already exists, or the job fails or times out
+    """
+
+    user_input = UserInput.from_json(json_path=json_path)
+    logger.info(f"Running job locally")
+    logger.debug("Full user input: %r", user_input)
+
+    # loading server config, without the custom options of the job
+    config = Config("server")
+
+    local_dir = get_local_dir(config)
+    timeout = int(config.local_timeout)
+
+    with LocalWorkerPool(os.path.join(local_dir, "workers"), workers=config.local_workers).worker() as worker:
+        if worker is None:
+            logger.info(f"All {config.local_workers} local workers are busy, submitting job to HPC")
+            return None
+
+        workdir = os.path.join(local_dir, user_input.id)
+        try:
+            os.makedirs(workdir)
+        except FileExistsError:
+            raise RuntimeError("Directory already present, cannot continue.")
+        if config.local_user:  # the job writes its outputs and log in the folder
+            os.chmod(workdir, 0o777)
+
+        failed = True
+        try:
+            shutil.copy(json_path, workdir)
+            if user_input.script_path:
+                shutil.copy(user_input.script_path, workdir)
+
+            command = sandbox_command(
+                [sys.executable, "-m", "dlaas.bin.dl_tui_hpc", "run", "--upload", basename(json_path)],
+                cpu_seconds=timeout,
+                memory_mb=config.local_memory,
+                user=config.local_user,
+            )
+            process = subprocess.Popen(
+                command,
+                cwd=workdir,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=True,  # the job and its children are killed together on timeout
+            )
+            logger.info(f"Launched local job. Job ID | worker: {user_input.id} | {worker}")
+
+            try:
+                stdout, stderr = process.communicate(timeout=timeout or None)
+            except subprocess.TimeoutExpired:
+                os.killpg(process.pid, signal.SIGKILL)
+                process.communicate()
+                raise RuntimeError(f"Local job {user_input.id} did not complete within {timeout} s")
+            failed = process.returncode != 0
+        finally:
+            # keeping the job log, which is lost with the job folder
+            if failed and os.path.isfile(os.path.join(workdir, "dl-tui.log")):
+                os.makedirs(os.path.join(local_dir, "logs"), exist_ok=True)
+                shutil.copy(
+                    os.path.join(workdir, "dl-tui.log"), os.path.join(local_dir, "logs", f"{user_input.id}.log")
+                )
+                logger.info(f"Job log saved to {os.path.join(local_dir, 'logs', f'{user_input.id}.log')}")
+            if not config.debug:
+                if config.local_user:  # files created by the job can only be removed by its user
+                    subprocess.run(sandbox_command(["rm", "-rf", workdir], user=config.local_user))
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    stdout = str(stdout, encoding="utf-8")
+    stderr = str(stderr, encoding="utf-8")
+    logger.debug(f"stdout: {stdout}")
+    logger.debug(f"stderr: {stderr}")
+
+    if process.returncode != 0:
+        raise RuntimeError(f"Local job {user_input.id} failed (exit code {process.returncode}).\nstderr: {stderr}")
+
+    logger.info(f"Completed local job {user_input.id}")
+    log_results_location(user_input)
+
+    return stdout, stderr
+
+
 def check_jobs_status(hpc_ip: str) -> dict[str, dict[str, str]]:
     """Check jobs status on HPC. Returns a list of dictionaries with the job info:
     - ACCOUNT
@@ -421,8 +932,8 @@ def check_jobs_status(hpc_ip: str) -> dict[str, dict[str, str]]:
     - SCHEDNODES
     - WORK_DIR
 
-    If a dl-tui.log logfile is found in /var/log/datalake, associates the Slurm JOBID with the Data Lake JOBID under
-    the key DATA_LAKE_JOBID
+    If a dl-tui.log logfile (or its rotated copies) is found in /var/log/datalake, associates the Slurm JOBID with the
+    Data Lake JOBID under the key DATA_LAKE_JOBID
 
     Parameters
     ----------
@@ -437,27 +948,18 @@ def check_jobs_status(hpc_ip: str) -> dict[str, dict[str, str]]:
 
     # loading default server config
     config = Config("server")
-    logger.debug(f"Server config: {config.__dict__}")
+    logger.debug("Server config: %s", config)
 
     if not hpc_ip:
         hpc_ip = config.host
 
     logger.debug(f"Checking jobs on {hpc_ip}")
 
-    # 1. First, populate completed jobs with sacct
-    ssh_cmd = rf'ssh -i {config.ssh_key} {config.user}@{hpc_ip} "sacct -P -l"'
-
-    logger.debug(f"Launching command via ssh:\n{ssh_cmd}")
+    backend = get_backend(config)
 
-    stdout, stderr = subprocess.Popen(
-        ssh_cmd,
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    ).communicate()
+    # 1. First, populate completed jobs with sacct
+    stdout, stderr = backend.run("sacct -P -l", host=hpc_ip)
 
-    stdout = str(stdout, encoding="utf-8")
-    stderr = str(stderr, encoding="utf-8")
     logger.debug(f"stdout: {stdout}")
     logger.debug(f"stderr: {stderr}")
 
@@ -481,19 +983,8 @@ def check_jobs_status(hpc_ip: str) -> dict[str, dict[str, str]]:
         jobs[job_info["JOBID"]] = job_info
 
     # 2. Then, populate pending jobs with squeue
-    ssh_cmd = rf'ssh -i {config.ssh_key} {config.user}@{hpc_ip} "squeue --format=%all -u {config.user}"'
-
-    logger.debug(f"Launching command via ssh:\n{ssh_cmd}")
+    stdout, stderr = backend.run(f"squeue --format=%all -u {config.user}", host=hpc_ip)
 
-    stdout, stderr = subprocess.Popen(
-        ssh_cmd,
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    ).communicate()
-
-    stdout = str(stdout, encoding="utf-8")
-    stderr = str(stderr, encoding="utf-8")
     logger.debug(f"stdout: {stdout}")
     logger.debug(f"stderr: {stderr}")
 
@@ -513,15 +1004,14 @@ def check_jobs_status(hpc_ip: str) -> dict[str, dict[str, str]]:
         jobs[job_info["JOBID"]] = job_info
 
     # 3. Last, add Data Lake job_id to job info
-    if exists("/var/log/datalake/dl-tui.log"):
-        with open("/var/log/datalake/dl-tui.log") as f:
-            for line in f:
-                if "Launched job on HPC" in line:
-                    data = line.split()
-                    try:
-                        jobs[data[-1]]["DATA_LAKE_JOBID"] = data[-3]
-                    except Exception as e:
-                        logger.debug(repr(e))
-                        continue
+    for log_path in get_log_files("/var/log/datalake/dl-tui.log"):
+        for record in read_log(log_path):
+            if "Launched job on HPC" in record["message"]:
+                data = record["message"].split()
+                try:
+                    jobs[data[-1]]["DATA_LAKE_JOBID"] = data[-3]
+                except Exception as e:
+                    logger.debug(repr(e))
+                    continue
 
     return jobs
@@ -0,0 +1,312 @@
+"""
+End-to-end tracing of a job: each stage (submission steps, queue wait, retrieve, script, archive, upload) is recorded
+as a span, following the OpenTelemetry (OTLP/JSON) span format. All the spans of a job belong to the same trace,
+whose ID is derived from the job ID, so that the spans exported by dl_tui_server and dl_tui_hpc can be aggregated in
+a single timeline (see `dl_tui --trace <job_id>`).
+
+Author: @lbabetto
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+import os
+import re
+import json
+import hashlib
+from time import time_ns
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+def get_trace_id(job_id: str) -> str:
+    """Return the trace ID of a job: the job ID itself if it is a UUID.hex string (128 bits, as OpenTelemetry trace
+    IDs), otherwise a hash of it
+
+    Parameters
+    ----------
+    job_id : str
+        unique job identifier
+
+    Returns
+    -------
+    str
+        trace ID (32 hexadecimal characters)
+    """
+    if re.fullmatch(r"[0-9a-f]{32}", str(job_id)):
+        return str(job_id)
+    return hashlib.sha256(str(job_id).encode()).hexdigest()[:32]
+
+
+def get_root_span_id(job_id: str) -> str:
+    """Return the ID of the root span of a job, which is the parent of the top-level span of each process (the root
+    span itself is not exported, it covers the whole timeline)
+
+    Parameters
+    ----------
+    job_id : str
+        unique job identifier
+
+    Returns
+    -------
+    str
+        span ID (16 hexadecimal characters)
+    """
+    return hashlib.sha256(f"{job_id}:root".encode()).hexdigest()[:16]
+
+
+def get_trace_path(trace_dir: str, job_id: str) -> str:
+    """Return the path of the file with the spans of a job
+
+    Parameters
+    ----------
+    trace_dir : str
+        folder containing the trace files
+    job_id : str
+        unique job identifier
+
+    Returns
+    -------
+    str
+        path of the trace file (<trace_dir>/trace_<job_id>.jsonl)
+    """
+    return os.path.join(trace_dir, f"trace_{job_id}.jsonl")
+
+
+class Tracer:
+    """Class recording the spans of the current process and appending them, one JSON line per span, to the trace file
+    of the job. Spans are only recorded after configure is called, otherwise they cost nothing.
+
+    Attributes
+    ----------
+    job_id : str
+        unique job identifier
+    service : str
+        name of the executable recording the spans (e.g. dl_tui_server, dl_tui_hpc)
+    path : str
+        path of the trace file
+    """
+
+    def __init__(self) -> None:
+        """Initialization for Tracer class"""
+        self.job_id = None
+        self.service = None
+        self.path = None
+        self.current = ContextVar("current_span", default=None)
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def configure(self, job_id: str, trace_dir: str, service: str) -> None:
+        """Start recording the spans of a job
+
+        Parameters
+        ----------
+        job_id : str
+            unique job identifier
+        trace_dir : str
+            folder in which the trace file is written, created if missing
+        service : str
+            name of the executable recording the spans
+        """
+        try:
+            os.makedirs(trace_dir, exist_ok=True)
+        except OSError as e:  # tracing must never make the job fail
+            logger.warning(f"Could not create trace folder {trace_dir}, tracing disabled: {e}")
+            return
+        self.job_id = job_id
+        self.service = service
+        self.path = get_trace_path(trace_dir, job_id)
+        logger.info(f"Tracing job {job_id} to {self.path}")
+
+    def disable(self) -> None:
+        """Stop recording spans"""
+        self.job_id = self.service = self.path = None
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Context manager recording the enclosed code as a span, child of the span in which it is opened (or of the
+        root span). Spans ended by an exception have an error status.
+
+        Parameters
+        ----------
+        name : str
+            span name
+        **attributes
+            span attributes
+        """
+        if not self.enabled:
+            yield
+            return
+
+        span_id = os.urandom(8).hex()
+        parent_id = self.current.get() or get_root_span_id(self.job_id)
+        token = self.current.set(span_id)
+        start = time_ns()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.current.reset(token)
+            self.export(name, start, time_ns(), span_id=span_id, parent_id=parent_id, error=error, **attributes)
+
+    def record(self, name: str, start: int, end: int, parent_id: str = None, **attributes) -> str:
+        """Record a span which was timed elsewhere (e.g. the queue wait), as child of the given span or, by default,
+        of the current span (or of the root span)
+
+        Parameters
+        ----------
+        name : str
+            span name
+        start : int
+            start time, in nanoseconds since the epoch
+        end : int
+            end time, in nanoseconds since the epoch
+        parent_id : str, optional
+            ID of the parent span
+        **attributes
+            span attributes
+
+        Returns
+        -------
+        str
+            span ID, None if tracing is disabled
+        """
+        if not self.enabled:
+            return None
+
+        span_id = os.urandom(8).hex()
+        parent_id = parent_id or self.current.get() or get_root_span_id(self.job_id)
+        self.export(name, start, end, span_id=span_id, parent_id=parent_id, **attributes)
+
+        return span_id
+
+    def export(
+        self, name: str, start: int, end: int, span_id: str, parent_id: str, error: str = None, **attributes
+    ) -> None:
+        """Append a span to the trace file
+
+        Parameters
+        ----------
+        name : str
+            span name
+        start : int
+            start time, in nanoseconds since the epoch
+        end : int
+            end time, in nanoseconds since the epoch
+        span_id : str
+            span ID
+        parent_id : str
+            ID of the parent span
+        error : str, optional
+            error message, if the span ended with an exception
+        **attributes
+            span attributes
+        """
+        span = {
+            "traceId": get_trace_id(self.job_id),
+            "spanId": span_id,
+            "parentSpanId": parent_id,
+            "name": name,
+            "startTimeUnixNano": int(start),
+            "endTimeUnixNano": int(end),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}}
+                for key, value in {"service.name": self.service, "job_id": self.job_id, **attributes}.items()
+            ],
+            "status": {"code": "STATUS_CODE_ERROR", "message": error} if error else {"code": "STATUS_CODE_OK"},
+        }
+
+        try:
+            with open(self.path, "a") as f:  # a single write per span, appends do not interleave
+                f.write(json.dumps(span) + "\n")
+        except OSError as e:  # tracing must never make the job fail
+            logger.warning(f"Could not export span {name} to {self.path}: {e}")
+
+
+# tracer of the current process
+TRACER = Tracer()
+
+
+def load_spans(paths: list[str]) -> list[dict[str, str]]:
+    """Load the spans of a job from the trace files (missing files and malformed lines are skipped)
+
+    Parameters
+    ----------
+    paths : list[str]
+        paths of the trace files (e.g. written on the server and on HPC)
+
+    Returns
+    -------
+    list[dict[str, str]]
+        spans, with the attributes as a dictionary
+    """
+
+    spans = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    span = json.loads(line)
+                except ValueError:  # truncated line
+                    continue
+                span["attributes"] = {item["key"]: item["value"]["stringValue"] for item in span["attributes"]}
+                spans.append(span)
+
+    return spans
+
+
+def format_timeline(spans: list[dict[str, str]]) -> str:
+    """Format the spans of a job as a timeline: each span with its start (relative to the first span), duration and
+    service, indented below its parent
+
+    Parameters
+    ----------
+    spans : list[dict[str, str]]
+        spans of the job (see load_spans)
+
+    Returns
+    -------
+    str
+        timeline
+    """
+
+    if not spans:
+        return "No spans found"
+
+    start = min(span["startTimeUnixNano"] for span in spans)
+    end = max(span["endTimeUnixNano"] for span in spans)
+
+    ids = {span["spanId"] for span in spans}
+    children = {}
+    for span in sorted(spans, key=lambda span: span["startTimeUnixNano"]):
+        parent = span["parentSpanId"] if span["parentSpanId"] in ids else None  # top-level spans are under the root
+        children.setdefault(parent, []).append(span)
+
+    lines = [
+        f"Trace {spans[0]['traceId']} (job {spans[0]['attributes'].get('job_id')}): "
+        f"{len(spans)} spans, {(end - start) / 1e9:.3f} s",
+        f"{'START':>12} {'DURATION':>12}  {'SERVICE':<14} SPAN",
+    ]
+
+    def walk(parent: str, depth: int):
+        for span in children.get(parent, []):
+            offset = (span["startTimeUnixNano"] - start) / 1e9
+            duration = (span["endTimeUnixNano"] - span["startTimeUnixNano"]) / 1e9
+            status = " [ERROR]" if span["status"]["code"] == "STATUS_CODE_ERROR" else ""
+            lines.append(
+                f"{offset:>10.3f} s {duration:>10.3f} s  {span['attributes'].get('service.name', ''):<14} "
+                f"{'  ' * depth}{span['name']}{status}"
+            )
+            walk(span["spanId"], depth + 1)
+
+    walk(None, 0)
+
+    return "\n".join(lines)
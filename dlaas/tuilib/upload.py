@@ -0,0 +1,957 @@
+"""
+Functions for archiving the job results on HPC and uploading them to the S3 bucket
+
+Author: @lbabetto
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+import os
+import io
+import hashlib
+import json
+import glob
+import shutil
+import tarfile
+import threading
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+from time import perf_counter, sleep
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import BotoCoreError, ClientError
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, only needed for the tar.zst archive format
+    zstandard = None
+
+ARCHIVE_EXTENSIONS = {
+    "zip": "zip",
+    "store": "zip",
+    "tar.zst": "tar.zst",
+}
+
+UPLOAD_OPTIONS = {  # archiving/upload settings in config_hpc, with their defaults
+    "output_layout": "archive",
+    "archive_format": "zip",
+    "archive_streaming": False,
+    "compress_level": 6,
+    "archive_threads": 0,
+    "s3_multipart_threshold": 64,
+    "s3_multipart_chunksize": 64,
+    "s3_max_concurrency": 10,
+    "s3_use_threads": True,
+    "s3_max_attempts": 5,
+}
+
+MB = 1024 * 1024
+
+
+def get_upload_options(config) -> dict[str, str]:
+    """Extract the archiving/upload settings from the hpc configuration
+
+    Parameters
+    ----------
+    config : Config
+        Config("hpc") instance, possibly with custom options loaded
+
+    Returns
+    -------
+    dict[str, str]
+        dictionary with the archiving/upload settings
+    """
+
+    return {key: getattr(config, key) for key in UPLOAD_OPTIONS if hasattr(config, key)}
+
+
+def get_archive_name(job_id: str, archive_format: str = "zip") -> str:
+    """Return the file name (and S3 key) of the results archive for a given job
+
+    Parameters
+    ----------
+    job_id : str
+        unique job identifier
+    archive_format : str, optional
+        format of the archive ("zip", "store" or "tar.zst"), "zip" by default
+
+    Returns
+    -------
+    str
+        name of the results archive
+
+    Raises
+    ------
+    ValueError
+        if the archive format is not supported
+    """
+
+    try:
+        return f"results_{job_id}.{ARCHIVE_EXTENSIONS[archive_format]}"
+    except KeyError:
+        raise ValueError(f"Unsupported archive format: '{archive_format}'")
+
+
+def get_s3_client(s3_endpoint_url: str, max_attempts: int = 5):
+    """Create a boto3 S3 client which retries failed requests (including the single parts of multipart uploads)
+    with exponential backoff.
+
+    Parameters
+    ----------
+    s3_endpoint_url : str
+        endpoint url at which the S3 bucket can be found
+    max_attempts : int, optional
+        maximum number of attempts for each request, 5 by default
+
+    Returns
+    -------
+    botocore.client.S3
+        boto3 S3 client
+    """
+
+    return boto3.client(
+        service_name="s3",
+        endpoint_url=s3_endpoint_url,
+        config=BotoConfig(retries={"max_attempts": int(max_attempts), "mode": "standard"}),
+    )
+
+
+def get_transfer_config(
+    multipart_threshold: int = 64,
+    multipart_chunksize: int = 64,
+    max_concurrency: int = 10,
+    use_threads: bool = True,
+) -> TransferConfig:
+    """Create the transfer configuration for multipart uploads to the S3 bucket
+
+    Parameters
+    ----------
+    multipart_threshold : int, optional
+        size (in MB) above which files are uploaded in multiple parts, 64 by default
+    multipart_chunksize : int, optional
+        size (in MB) of each part, 64 by default
+    max_concurrency : int, optional
+        number of parts uploaded concurrently, 10 by default
+    use_threads : bool, optional
+        whether to upload the parts in parallel threads, True by default
+
+    Returns
+    -------
+    TransferConfig
+        boto3 transfer configuration
+    """
+
+    return TransferConfig(
+        multipart_threshold=int(multipart_threshold) * MB,
+        multipart_chunksize=int(multipart_chunksize) * MB,
+        max_concurrency=int(max_concurrency),
+        use_threads=str(use_threads).lower() in ["true", "1"],
+    )
+
+
+def retry(function, attempts: int = 3, *args, **kwargs):
+    """Call a function, retrying with exponential backoff (2, 4, 8... seconds) if an S3 error is raised. Single
+    requests are already retried by the S3 client (see get_s3_client), this is intended for whole transfers.
+
+    Parameters
+    ----------
+    function : Callable
+        function to be called
+    attempts : int, optional
+        maximum number of attempts, 3 by default
+    *args, **kwargs
+        arguments passed to the function
+
+    Returns
+    -------
+    Any
+        return value of the function
+    """
+
+    for attempt in range(1, int(attempts) + 1):
+        try:
+            return function(*args, **kwargs)
+        except (BotoCoreError, ClientError, S3UploadFailedError) as e:
+            if attempt == int(attempts):
+                raise
+            logger.warning(f"Attempt {attempt}/{attempts} of {function.__name__} failed, retrying: {repr(e)}")
+            sleep(2**attempt)
+
+
+class ProgressLogger:
+    """Callback for boto3 transfers, logging the upload progress every 10% of the total size. It is thread-safe, so
+    that the same instance can be shared by concurrent transfers.
+    """
+
+    def __init__(self, name: str, size: int) -> None:
+        """Initialization for ProgressLogger class
+
+        Parameters
+        ----------
+        name : str
+            name of the transfer, used for logging
+        size : int
+            total size of the transfer in bytes
+        """
+        self.name = name
+        self.size = size
+        self.transferred = 0
+        self.logged = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, bytes_amount: int) -> None:
+        with self.lock:
+            self.transferred += bytes_amount
+            percentage = int(100 * self.transferred / max(self.size, 1)) // 10 * 10
+            if percentage > self.logged:
+                self.logged = percentage
+                logger.info(f"Uploading {self.name}: {percentage}% ({self.transferred / 1e6:.1f} MB)")
+
+
+def upload_archive(
+    s3_client,
+    filename: str,
+    bucket: str,
+    key: str,
+    transfer_config: TransferConfig = None,
+    attempts: int = 3,
+) -> int:
+    """Upload a file to the S3 bucket with the given transfer configuration, logging the upload throughput.
+
+    Parameters
+    ----------
+    s3_client : botocore.client.S3
+        boto3 S3 client
+    filename : str
+        path of the file to be uploaded
+    bucket : str
+        name of the S3 bucket
+    key : str
+        S3 key of the uploaded object
+    transfer_config : TransferConfig, optional
+        transfer configuration (see get_transfer_config), boto3 defaults if not provided
+    attempts : int, optional
+        maximum number of attempts for the whole transfer, 3 by default
+
+    Returns
+    -------
+    int
+        size in bytes of the uploaded file
+    """
+
+    size = os.path.getsize(filename)
+
+    start = perf_counter()
+    retry(
+        s3_client.upload_file,
+        attempts,
+        Filename=filename,
+        Bucket=bucket,
+        Key=key,
+        Config=transfer_config,
+        Callback=ProgressLogger(name=key, size=size),
+    )
+    elapsed = perf_counter() - start
+
+    logger.info(
+        f"Uploaded {filename} to s3://{bucket}/{key} ({size / 1e6:.1f} MB) in {elapsed:.2f} s "
+        f"({size / 1e6 / max(elapsed, 1e-9):.1f} MB/s)"
+    )
+
+    return size
+
+
+def get_objects_prefix(job_id: str) -> str:
+    """Return the S3 key prefix under which the output files of a job are saved when the "objects" output layout is
+    used (i.e., each file is uploaded as a separate object instead of being archived)
+
+    Parameters
+    ----------
+    job_id : str
+        unique job identifier
+
+    Returns
+    -------
+    str
+        S3 key prefix for the job output files
+    """
+
+    return f"results/{job_id}/"
+
+
+def upload_objects(
+    s3_client,
+    source_dir: str,
+    bucket: str,
+    prefix: str,
+    transfer_config: TransferConfig = None,
+    attempts: int = 3,
+) -> list[str]:
+    """Upload each file within source_dir as a separate S3 object under the given key prefix. Files are uploaded
+    concurrently, with transfer_config.max_concurrency parallel uploads.
+
+    Parameters
+    ----------
+    s3_client : botocore.client.S3
+        boto3 S3 client
+    source_dir : str
+        path to the folder containing the files to be uploaded
+    bucket : str
+        name of the S3 bucket
+    prefix : str
+        S3 key prefix of the uploaded objects (see get_objects_prefix)
+    transfer_config : TransferConfig, optional
+        transfer configuration (see get_transfer_config), used for each file and for the number of parallel uploads
+    attempts : int, optional
+        maximum number of attempts for the transfer of each file, 3 by default
+
+    Returns
+    -------
+    list[str]
+        list of the S3 keys of the uploaded objects
+    """
+
+    transfer_config = transfer_config or get_transfer_config()
+    files = list_output_files(source_dir)
+    size = sum(os.path.getsize(path) for path, _ in files)
+    progress = ProgressLogger(name=prefix, size=size)
+
+    def upload(path: str, arcname: str) -> str:
+        retry(
+            s3_client.upload_file,
+            attempts,
+            Filename=path,
+            Bucket=bucket,
+            Key=f"{prefix}{arcname}",
+            Config=transfer_config,
+            Callback=progress,
+        )
+        return f"{prefix}{arcname}"
+
+    start = perf_counter()
+    max_workers = transfer_config.max_concurrency if transfer_config.use_threads else 1
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        keys = list(pool.map(upload, *zip(*files))) if files else []
+    elapsed = perf_counter() - start
+
+    logger.info(
+        f"Uploaded {len(keys)} files to s3://{bucket}/{prefix} ({size / 1e6:.1f} MB) in {elapsed:.2f} s "
+        f"({size / 1e6 / max(elapsed, 1e-9):.1f} MB/s)"
+    )
+
+    return keys
+
+
+def list_output_files(source_dir: str) -> list[tuple[str, str]]:
+    """List the files within source_dir (recursively), sorted by name
+
+    Parameters
+    ----------
+    source_dir : str
+        path to the folder containing the files
+
+    Returns
+    -------
+    list[tuple[str, str]]
+        list of (path, path relative to source_dir) tuples
+    """
+
+    files = []
+    for root, _, names in os.walk(source_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            files.append((path, os.path.relpath(path, source_dir)))
+    files.sort(key=lambda item: item[1])
+    return files
+
+
+def checksum(path: str) -> str:
+    """Compute the SHA-256 checksum of a file, reading it in chunks
+
+    Parameters
+    ----------
+    path : str
+        path of the file
+
+    Returns
+    -------
+    str
+        hexadecimal SHA-256 digest
+    """
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def describe_files(files: list[tuple[str, str]], max_workers: int = 8) -> list[dict[str, str]]:
+    """Compute size and checksum of the given files, in parallel (hashing releases the GIL)
+
+    Parameters
+    ----------
+    files : list[tuple[str, str]]
+        list of (path, name) tuples (see list_output_files)
+    max_workers : int, optional
+        number of parallel hashing threads, 8 by default
+
+    Returns
+    -------
+    list[dict[str, str]]
+        list of {"name", "size", "checksum"} dictionaries, in the same order as files
+    """
+
+    def describe(item: tuple[str, str]) -> dict[str, str]:
+        path, name = item
+        return {"name": name, "size": os.path.getsize(path), "checksum": checksum(path)}
+
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+        return list(executor.map(describe, files))
+
+
+def write_archive(
+    fileobj,
+    source_dir: str,
+    archive_format: str = "zip",
+    compress_level: int = 6,
+    archive_threads: int = 0,
+) -> int:
+    """Write the content of source_dir as an archive into a (possibly non-seekable) file object.
+
+    Parameters
+    ----------
+    fileobj : file object
+        binary file object in which the archive is written
+    source_dir : str
+        path to the folder to be archived
+    archive_format : str, optional
+        "zip" (deflate), "store" (no compression, for already-compressed data) or "tar.zst" (multithreaded zstd
+        compression, requires the zstandard package), "zip" by default
+    compress_level : int, optional
+        compression level (0-9 for zip, 1-22 for zstd), 6 by default
+    archive_threads : int, optional
+        number of compression threads for zstd, 0 uses all available cores
+
+    Returns
+    -------
+    int
+        total size of the archived files (uncompressed)
+
+    Raises
+    ------
+    ValueError
+        if the archive format is not supported
+    ImportError
+        if the tar.zst format is requested but the zstandard package is not installed
+    """
+
+    files = list_output_files(source_dir)
+    size = sum(os.path.getsize(path) for path, _ in files)
+
+    if archive_format in ["zip", "store"]:
+        compression = ZIP_DEFLATED if archive_format == "zip" else ZIP_STORED
+        with ZipFile(fileobj, "w", compression=compression, compresslevel=int(compress_level)) as archive:
+            for path, arcname in files:
+                archive.write(path, arcname=arcname)
+
+    elif archive_format == "tar.zst":
+        if zstandard is None:
+            raise ImportError("The zstandard package is required for the 'tar.zst' archive format")
+        threads = int(archive_threads) or -1  # -1: use all available cores
+        compressor = zstandard.ZstdCompressor(level=int(compress_level), threads=threads)
+        with compressor.stream_writer(fileobj, closefd=False) as writer:
+            with tarfile.open(fileobj=writer, mode="w|") as archive:
+                for path, arcname in files:
+                    archive.add(path, arcname=arcname)
+
+    else:
+        raise ValueError(f"Unsupported archive format: '{archive_format}'")
+
+    return size
+
+
+def archive_results(
+    source_dir: str,
+    archive_path: str,
+    archive_format: str = "zip",
+    compress_level: int = 6,
+    archive_threads: int = 0,
+) -> str:
+    """Save the content of source_dir in an archive on disk, logging the archiving throughput.
+
+    Parameters
+    ----------
+    source_dir : str
+        path to the folder to be archived
+    archive_path : str
+        path of the archive to be created
+    archive_format : str, optional
+        "zip", "store" or "tar.zst" (see write_archive), "zip" by default
+    compress_level : int, optional
+        compression level (0-9 for zip, 1-22 for zstd), 6 by default
+    archive_threads : int, optional
+        number of compression threads for zstd, 0 uses all available cores
+
+    Returns
+    -------
+    str
+        path of the archive
+    """
+
+    start = perf_counter()
+    with open(archive_path, "wb") as f:
+        size = write_archive(
+            fileobj=f,
+            source_dir=source_dir,
+            archive_format=archive_format,
+            compress_level=compress_level,
+            archive_threads=archive_threads,
+        )
+    elapsed = perf_counter() - start
+
+    logger.info(
+        f"Archived {size / 1e6:.1f} MB into {archive_path} ({os.path.getsize(archive_path) / 1e6:.1f} MB) "
+        f"in {elapsed:.2f} s ({size / 1e6 / max(elapsed, 1e-9):.1f} MB/s)"
+    )
+
+    return archive_path
+
+
+class S3MultipartWriter(io.RawIOBase):
+    """Non-seekable binary file object which writes its content to an S3 object via a multipart upload, so that
+    archives can be streamed to the bucket without being materialized on disk. Parts are uploaded in background
+    threads as soon as part_size bytes have been buffered (at most max_concurrency parts are held in memory);
+    the upload is completed on close, or aborted if an exception is raised within the context manager or if the
+    upload cannot be completed.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        bucket: str,
+        key: str,
+        part_size: int = 64 * MB,
+        max_concurrency: int = 4,
+    ) -> None:
+        """Initialization for S3MultipartWriter class
+
+        Parameters
+        ----------
+        s3_client : botocore.client.S3
+            boto3 S3 client
+        bucket : str
+            name of the S3 bucket
+        key : str
+            key of the S3 object to be written
+        part_size : int, optional
+            size of each part in bytes (S3 requires at least 5 MB), 64 MB by default
+        max_concurrency : int, optional
+            number of parts uploaded concurrently, 4 by default
+        """
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(int(part_size), 5 * MB)
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.buffer = bytearray()
+        self.parts = []
+        self.pending = []
+        self.pool = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        self.bytes_written = 0
+        self.upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        self.bytes_written += len(data)
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[: self.part_size]))
+            del self.buffer[: self.part_size]
+        return len(data)
+
+    def _upload_part(self, data: bytes) -> None:
+        part_number = len(self.parts) + len(self.pending) + 1
+        if len(self.pending) >= self.max_concurrency:  # limiting the number of parts held in memory
+            self.parts.append(self.pending.pop(0).result())
+        self.pending.append(self.pool.submit(self._send_part, data, part_number))
+
+    def _send_part(self, data: bytes, part_number: int) -> dict[str, str]:
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        logger.debug(f"Uploaded part {part_number} of s3://{self.bucket}/{self.key}")
+        return {"ETag": response["ETag"], "PartNumber": part_number}
+
+    def close(self) -> None:
+        if not self.closed:
+            try:
+                if self.buffer or not (self.parts or self.pending):  # the last part can be smaller than part_size
+                    self._upload_part(bytes(self.buffer))
+                    self.buffer.clear()
+                self.parts += [future.result() for future in self.pending]
+                self.pending.clear()
+                self.pool.shutdown()
+                self.s3_client.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self.upload_id,
+                    MultipartUpload={"Parts": self.parts},
+                )
+            except Exception:  # the parts uploaded so far would be left (and billed) in the bucket
+                logger.warning(f"Could not complete the upload of s3://{self.bucket}/{self.key}, aborting it")
+                self.abort()
+                raise
+        super().close()
+
+    def abort(self) -> None:
+        """Abort the multipart upload, discarding the parts uploaded so far"""
+        self.pool.shutdown(cancel_futures=True)
+        self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def stream_results(
+    s3_client,
+    source_dir: str,
+    bucket: str,
+    key: str,
+    archive_format: str = "zip",
+    compress_level: int = 6,
+    archive_threads: int = 0,
+    transfer_config: TransferConfig = None,
+) -> int:
+    """Archive the content of source_dir and stream it directly into a multipart upload to the S3 bucket, so that the
+    archive never fully materializes on disk.
+
+    Parameters
+    ----------
+    s3_client : botocore.client.S3
+        boto3 S3 client
+    source_dir : str
+        path to the folder to be archived
+    bucket : str
+        name of the S3 bucket in which the archive is saved
+    key : str
+        S3 key of the archive
+    archive_format : str, optional
+        "zip", "store" or "tar.zst" (see write_archive), "zip" by default
+    compress_level : int, optional
+        compression level (0-9 for zip, 1-22 for zstd), 6 by default
+    archive_threads : int, optional
+        number of compression threads for zstd, 0 uses all available cores
+    transfer_config : TransferConfig, optional
+        transfer configuration (see get_transfer_config), used for the part size and concurrency
+
+    Returns
+    -------
+    int
+        size in bytes of the uploaded archive
+    """
+
+    transfer_config = transfer_config or get_transfer_config()
+
+    start = perf_counter()
+    with S3MultipartWriter(
+        s3_client=s3_client,
+        bucket=bucket,
+        key=key,
+        part_size=transfer_config.multipart_chunksize,
+        max_concurrency=transfer_config.max_concurrency if transfer_config.use_threads else 1,
+    ) as writer:
+        size = write_archive(
+            fileobj=writer,
+            source_dir=source_dir,
+            archive_format=archive_format,
+            compress_level=compress_level,
+            archive_threads=archive_threads,
+        )
+    elapsed = perf_counter() - start
+
+    logger.info(
+        f"Streamed {size / 1e6:.1f} MB to s3://{bucket}/{key} ({writer.bytes_written / 1e6:.1f} MB) "
+        f"in {elapsed:.2f} s ({writer.bytes_written / 1e6 / max(elapsed, 1e-9):.1f} MB/s)"
+    )
+
+    return writer.bytes_written
+
+
+def write_manifest(
+    job_id: str,
+    s3_endpoint_url: str,
+    s3_bucket: str,
+    upload_options: dict[str, str] = None,
+    collection=None,
+) -> str:
+    """Write the job manifest read by the `dl_tui_hpc upload` command, containing all the information needed to
+    archive the output folder and upload the results to the S3 bucket.
+
+    Parameters
+    ----------
+    job_id : str
+        unique job identifier, used to create the S3 object key
+    s3_endpoint_url : str
+        endpoint url at which the S3 bucket can be found
+    s3_bucket : str
+        name of the S3 bucket in which the results need to be saved
+    upload_options : dict[str, str], optional
+        archiving/upload settings (see UPLOAD_OPTIONS), defaults are used for missing keys
+    collection : Collection, optional
+        MongoDB collection on which the results metadata are saved, recorded in the manifest so that the files added
+        to the output folder afterwards (e.g. Slurm logs) are registered at upload time (see register_late_files)
+
+    Returns
+    -------
+    str
+        absolute path of the manifest (upload_manifest_<job_id>.json)
+    """
+
+    manifest = {
+        "job_id": job_id,
+        "s3_endpoint_url": s3_endpoint_url,
+        "s3_bucket": s3_bucket,
+        "output_dir": "output",
+        **UPLOAD_OPTIONS,
+        **(upload_options or {}),
+    }
+    if collection is not None:
+        manifest["results"] = {"database": collection.database.name, "collection": collection.name}
+
+    with open(f"upload_manifest_{job_id}.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    return os.path.abspath(f"upload_manifest_{job_id}.json")
+
+
+def update_manifest(manifest_path: str, updates: dict[str, str]) -> None:
+    """Add entries to an existing job manifest (e.g. information gathered after the job output was saved)
+
+    Parameters
+    ----------
+    manifest_path : str
+        path to the job manifest
+    updates : dict[str, str]
+        entries to be added (or replaced) in the manifest
+    """
+
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+
+    manifest.update(updates)
+
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def register_late_files(collection, manifest: dict[str, str], output_dir: str) -> list[str]:
+    """Register the files added to the output folder after the job results were registered (Slurm logs, job
+    profile), so that the results metadata describe everything which is uploaded: with the "archive" layout they are
+    added to the file list of the archive entry, with the "objects" layout an entry is created for each of them, with
+    the same fields of the other entries of the job.
+
+    Parameters
+    ----------
+    collection : Collection
+        MongoDB collection containing the results metadata
+    manifest : dict[str, str]
+        content of the job manifest
+    output_dir : str
+        path to the output folder
+
+    Returns
+    -------
+    list[str]
+        names of the registered files
+    """
+
+    job_id = manifest["job_id"]
+    entries = list(collection.find({"job_id": job_id, "cached_from": {"$exists": False}}))
+    if not entries:
+        logger.warning(f"No results entries found for job {job_id}, files added at upload time are not registered")
+        return []
+
+    if manifest["output_layout"] == "objects":
+        prefix = get_objects_prefix(job_id=job_id)
+        registered = {entry["s3_key"][len(prefix) :] for entry in entries}
+    else:
+        archive = get_archive_name(job_id=job_id, archive_format=manifest["archive_format"])
+        entries = [entry for entry in entries if entry["s3_key"] == archive] or entries
+        registered = {file["name"] for file in entries[0].get("files", [])}
+
+    files = describe_files([item for item in list_output_files(output_dir) if item[1] not in registered])
+    if not files:
+        return []
+
+    if manifest["output_layout"] == "objects":
+        template = {key: value for key, value in entries[0].items() if key not in ["_id", "size", "checksum"]}
+        pfs_prefix_path = template["path"][: -len(template["s3_key"])]  # path is {pfs_prefix_path}{s3_key}
+        collection.insert_many(
+            [
+                {
+                    **template,
+                    "s3_key": f"{prefix}{file['name']}",
+                    "path": f"{pfs_prefix_path}{prefix}{file['name']}",
+                    "size": file["size"],
+                    "checksum": file["checksum"],
+                }
+                for file in files
+            ],
+            ordered=False,
+        )
+    else:
+        collection.update_one(
+            {"_id": entries[0]["_id"]},
+            {"$push": {"files": {"$each": files}}, "$inc": {"file_count": len(files)}},
+        )
+
+    names = [file["name"] for file in files]
+    logger.info(f"Registered {len(names)} files added at upload time for job {job_id}: {names}")
+
+    return names
+
+
+def mark_uploaded(collection, job_id: str) -> None:
+    """Flag the results entries of a job as uploaded, once its results are on S3: only flagged entries can be
+    returned by the job cache (see server.lookup_job_cache), since the entries are registered before the upload
+
+    Parameters
+    ----------
+    collection : Collection
+        MongoDB collection containing the results metadata
+    job_id : str
+        unique job identifier
+    """
+
+    result = collection.update_many({"job_id": job_id, "cached_from": {"$exists": False}}, {"$set": {"uploaded": True}})
+    logger.info(f"Flagged {result.modified_count} results entries of job {job_id} as uploaded")
+
+
+def run_upload(manifest_path: str, collection=None) -> dict[str, str]:
+    """Archive the job output folder and upload the results to the S3 bucket, according to the job manifest (see
+    write_manifest). Slurm logs found in the job folder are added to the results, and the output folder is removed
+    after the upload. Paths in the manifest are relative to the folder containing it.
+
+    Parameters
+    ----------
+    manifest_path : str
+        path to the job manifest
+    collection : Collection, optional
+        MongoDB collection containing the results metadata, if given the files added to the output folder after the
+        results were registered (Slurm logs, job profile) are registered before the upload (see register_late_files),
+        and the results entries are flagged as uploaded after it (see mark_uploaded)
+
+    Returns
+    -------
+    dict[str, str]
+        upload summary: S3 keys, uploaded bytes, elapsed time, throughput and time spent archiving/uploading (if
+        the archive is streamed, archiving overlaps with the upload and is included in the upload stage). If the job
+        was profiled, the "profile" entry of the manifest is included as well.
+    """
+
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    logger.debug(f"Upload manifest: {manifest}")
+
+    job_dir = os.path.dirname(os.path.abspath(manifest_path))
+    job_id = manifest["job_id"]
+    output_dir = os.path.join(job_dir, manifest["output_dir"])
+    bucket = manifest["s3_bucket"]
+    attempts = int(manifest["s3_max_attempts"])
+
+    # Slurm logs are written in the job folder, which is the parent folder if a Python script was run
+    for match in glob.glob(f"{job_dir}/slurm-*") + glob.glob(f"{job_dir}/../slurm-*"):
+        shutil.copy(match, f"{output_dir}/{os.path.basename(match)}")
+
+    if collection is not None:
+        register_late_files(collection=collection, manifest=manifest, output_dir=output_dir)
+
+    s3_client = get_s3_client(manifest["s3_endpoint_url"], attempts)
+    transfer_config = get_transfer_config(
+        multipart_threshold=manifest["s3_multipart_threshold"],
+        multipart_chunksize=manifest["s3_multipart_chunksize"],
+        max_concurrency=manifest["s3_max_concurrency"],
+        use_threads=manifest["s3_use_threads"],
+    )
+    archive_options = {
+        "archive_format": manifest["archive_format"],
+        "compress_level": manifest["compress_level"],
+        "archive_threads": manifest["archive_threads"],
+    }
+
+    stages = {}
+    start = perf_counter()
+    if manifest["output_layout"] == "objects":
+        size = sum(os.path.getsize(path) for path, _ in list_output_files(output_dir))
+        keys = upload_objects(
+            s3_client=s3_client,
+            source_dir=output_dir,
+            bucket=bucket,
+            prefix=get_objects_prefix(job_id=job_id),
+            transfer_config=transfer_config,
+            attempts=attempts,
+        )
+    elif str(manifest["archive_streaming"]).lower() in ["true", "1"]:
+        key = get_archive_name(job_id=job_id, archive_format=manifest["archive_format"])
+        size = retry(
+            stream_results,
+            attempts,
+            s3_client=s3_client,
+            source_dir=output_dir,
+            bucket=bucket,
+            key=key,
+            transfer_config=transfer_config,
+            **archive_options,
+        )
+        keys = [key]
+    else:
+        key = get_archive_name(job_id=job_id, archive_format=manifest["archive_format"])
+        archive = archive_results(source_dir=output_dir, archive_path=f"{job_dir}/{key}", **archive_options)
+        stages["archive"] = perf_counter() - start
+        size = upload_archive(
+            s3_client=s3_client,
+            filename=archive,
+            bucket=bucket,
+            key=key,
+            transfer_config=transfer_config,
+            attempts=attempts,
+        )
+        keys = [key]
+    elapsed = perf_counter() - start
+    stages["upload"] = elapsed - stages.get("archive", 0.0)
+
+    if collection is not None:
+        mark_uploaded(collection=collection, job_id=job_id)
+
+    shutil.rmtree(output_dir)
+
+    summary = {
+        "job_id": job_id,
+        "s3_keys": keys,
+        "bytes": size,
+        "seconds": round(elapsed, 3),
+        "throughput_MBps": round(size / 1e6 / max(elapsed, 1e-9), 3),
+        "stages": {stage: round(seconds, 3) for stage, seconds in stages.items()},
+    }
+    if "profile" in manifest:
+        summary["profile"] = manifest["profile"]
+    logger.info(f"Upload summary: {summary}")
+
+    return summary
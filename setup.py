@@ -29,6 +29,11 @@ setup(
         "sqlparse @ git+https://github.com/lbabetto/sqlparse",
         "requests",
     ],
+    extras_require={
+        "zstd": ["zstandard"],
+        "snappy": ["python-snappy"],
+        "orjson": ["orjson"],
+    },
     author="Luca Babetto",
     author_email="l.babetto@cineca.it",
 )
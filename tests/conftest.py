@@ -67,7 +67,7 @@ def cleanup(config_server):
         os.remove(match)
     if os.path.exists("results"):
         shutil.rmtree("results")
-    for match in glob("upload_results_*.py"):
+    for match in glob("upload_manifest_*.json"):
         os.remove(match)
     if os.path.exists("user_script.py"):
         os.remove("user_script.py")
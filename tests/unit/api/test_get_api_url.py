@@ -0,0 +1,27 @@
+import pytest
+
+#
+# Testing get_api_url function in api.py library
+#
+
+from dlaas.tuilib.api import get_api_url
+
+
+def test_default_url(monkeypatch):
+    """
+    Without DLAAS_API_URL, the URL is built from the IP address
+    """
+
+    monkeypatch.delenv("DLAAS_API_URL", raising=False)
+
+    assert get_api_url("1.2.3.4") == "https://1.2.3.4.nip.io"
+
+
+def test_env_override(monkeypatch):
+    """
+    DLAAS_API_URL takes precedence over the IP address
+    """
+
+    monkeypatch.setenv("DLAAS_API_URL", "http://localhost:8080/")
+
+    assert get_api_url("1.2.3.4") == "http://localhost:8080"
@@ -0,0 +1,209 @@
+import pytest
+
+#
+# Testing the execution backends in backends.py library
+#
+
+import os
+import sys
+import json
+import resource
+import subprocess
+
+from dlaas.tuilib.common import Config
+from dlaas.tuilib.backends import (
+    SIMULATED_SLURM,
+    Backend,
+    LocalBackend,
+    LocalWorkerPool,
+    SSHBackend,
+    get_backend,
+    sandbox_command,
+)
+from dlaas.tuilib.server import copy_json_input, create_remote_directory, launch_job
+
+
+@pytest.fixture(scope="function")
+def simulated():
+    """Reset the simulated cluster before and after each test"""
+    SIMULATED_SLURM.configure(seed=0)
+    yield SIMULATED_SLURM
+    SIMULATED_SLURM.configure()
+
+
+def test_get_backend():
+    """
+    The backend is selected by the `backend` option of the server configuration
+    """
+
+    config = Config("server")
+    assert isinstance(get_backend(config), SSHBackend)
+
+    config.backend = "local"
+    assert isinstance(get_backend(config), LocalBackend)
+
+    config.backend = "simulated"
+    assert get_backend(config) is SIMULATED_SLURM
+
+    with pytest.raises(KeyError):
+        config.load_custom_config({"backend": "local"})
+
+
+def test_ssh_commands(monkeypatch):
+    """
+    Commands are quoted, so that environment variables are expanded on HPC
+    """
+
+    commands = []
+    monkeypatch.setattr(Backend, "shell", staticmethod(lambda command: commands.append(command) or ("", "")))
+
+    backend = SSHBackend(user="user", host="login.hpc", ssh_key="~/.ssh/key")
+    backend.run("cd $SCRATCH/JOB; sbatch --wrap 'touch JOB_DONE'")
+    backend.run("sacct -P -l", host="other.hpc")
+    backend.copy("input.json", "$SCRATCH/JOB/input.json")
+
+    assert commands == [
+        "ssh -i ~/.ssh/key user@login.hpc 'cd $SCRATCH/JOB; sbatch --wrap '\"'\"'touch JOB_DONE'\"'\"''",
+        "ssh -i ~/.ssh/key user@other.hpc 'sacct -P -l'",
+        "scp -i ~/.ssh/key input.json user@login.hpc:'$SCRATCH/JOB/input.json'",
+    ]
+
+
+def test_local_backend(tmp_path, monkeypatch):
+    """
+    Commands run in the local shell, environment variables in the destination of copies are expanded
+    """
+
+    monkeypatch.setenv("SCRATCH", str(tmp_path))
+    backend = LocalBackend()
+
+    stdout, stderr = backend.run("mkdir $SCRATCH/JOB && echo done")
+    assert (stdout, stderr) == ("done\n", "")
+
+    (tmp_path / "input.json").write_text("{}")
+    assert backend.copy(str(tmp_path / "input.json"), "$SCRATCH/JOB/input.json") == ("", "")
+    assert (tmp_path / "JOB" / "input.json").read_text() == "{}"
+
+    _, stderr = backend.copy(str(tmp_path / "input.json"), "$SCRATCH/MISSING/input.json")
+    assert stderr.startswith("cp: ")
+
+
+def test_simulated_directories(simulated):
+    """
+    Directories cannot be created twice, files can only be copied to existing directories
+    """
+
+    assert simulated.run("mkdir $SCRATCH/JOB") == ("", "")
+    _, stderr = simulated.run("mkdir $SCRATCH/JOB")
+    assert "mkdir: cannot create directory" in stderr
+
+    assert simulated.copy("input.json", "$SCRATCH/JOB/input.json") == ("", "")
+    _, stderr = simulated.copy("input.json", "$SCRATCH/OTHER/input.json")
+    assert "No such file or directory" in stderr
+
+
+def test_simulated_sbatch(simulated):
+    """
+    Jobs get incremental IDs, dependent jobs wait for their dependency
+    """
+
+    simulated.configure(queue_delay=3600, run_time=60, seed=0)
+
+    assert simulated.run("cd $SCRATCH/JOB; sbatch --wrap 'true'") == ("Submitted batch job 1\n", "")
+    assert simulated.run("cd $SCRATCH/JOB; sbatch -d afterok:1 --wrap 'true'") == ("Submitted batch job 2\n", "")
+
+    stdout, _ = simulated.run("squeue --format=%all -u user")
+    assert stdout.splitlines() == [
+        "JobID|State|Submit|Start|End|Dependency",
+        f"1|PENDING|{simulated.jobs[1]['submit']:.0f}|0|0|",
+        f"2|PENDING|{simulated.jobs[2]['submit']:.0f}|0|0|afterok:1",
+    ]
+    assert simulated.run("sacct -P -l")[0] == "JobID|State|Submit|Start|End|Dependency\n"
+
+
+def test_simulated_completed(simulated):
+    """
+    Jobs without queue delay and run time are reported as completed by sacct
+    """
+
+    simulated.run("sbatch --wrap 'true'")
+
+    stdout, _ = simulated.run("sacct -P -l")
+    assert stdout.splitlines()[1].startswith("1|COMPLETED|")
+    assert simulated.run("squeue --format=%all -u user")[0] == "JobID|State|Submit|Start|End|Dependency\n"
+
+
+def test_simulated_failure(simulated):
+    """
+    sbatch fails with the configured probability
+    """
+
+    simulated.configure(failure_rate=1)
+
+    stdout, stderr = simulated.run("sbatch --wrap 'true'")
+    assert stdout == ""
+    assert stderr == simulated.SBATCH_ERROR
+
+
+def test_server_submission(simulated, tmp_path, monkeypatch):
+    """
+    The submission steps of dl_tui_server run against the simulated cluster
+    """
+
+    monkeypatch.setenv("HOME", str(tmp_path))
+    os.makedirs(tmp_path / ".config" / "dlaas")
+    with open(tmp_path / ".config" / "dlaas" / "config_server.json", "w") as f:
+        json.dump({"backend": "simulated"}, f)
+
+    json_path = str(tmp_path / "input.json")
+    with open(json_path, "w") as f:
+        json.dump({"id": "JOB", "sql_query": "SELECT * FROM metadata"}, f)
+
+    create_remote_directory(json_path=json_path)
+    copy_json_input(json_path=json_path)
+    stdout, stderr, slurm_job_id = launch_job(json_path=json_path)
+
+    assert (stdout, stderr, slurm_job_id) == ("Submitted batch job 1\n", "", 1)
+    assert simulated.files == {"$SCRATCH/JOB/input.json"}
+
+    with pytest.raises(RuntimeError):
+        create_remote_directory(json_path=json_path)
+
+    simulated.configure(failure_rate=1)
+    simulated.directories.add("$SCRATCH/JOB")
+    with pytest.raises(RuntimeError):
+        launch_job(json_path=json_path)
+
+
+def test_local_worker_pool(tmp_path):
+    """
+    A worker is given only if one is free, and released at the end of the job
+    """
+
+    pool = LocalWorkerPool(str(tmp_path / "workers"), workers=2)
+
+    with pool.worker() as first:
+        with pool.worker() as second:
+            with pool.worker() as third:
+                assert (first, second, third) == (0, 1, None)
+        with pool.worker() as again:
+            assert again == 1
+
+
+def test_sandbox_command():
+    """
+    The resource limits are applied by the wrapper to the job only, optionally run as another user
+    """
+
+    stdout = subprocess.check_output(
+        sandbox_command(
+            [sys.executable, "-c", "import resource; print(resource.getrlimit(resource.RLIMIT_CPU))"],
+            cpu_seconds=42,
+            memory_mb=4096,
+        )
+    )
+
+    assert stdout.decode().strip() == "(42, 42)"
+    assert resource.getrlimit(resource.RLIMIT_CPU)[0] != 42
+
+    assert sandbox_command(["ls"], user="nobody")[:6] == ["sudo", "-n", "-H", "-u", "nobody", "--"]
@@ -119,3 +119,47 @@ def test_wrong_key():
     with pytest.raises(KeyError):
         config_test = Config(version="hpc")
         config_test.load_custom_config({"account": "EUCC_staff"})
+
+
+def test_file_cache(tmp_path, monkeypatch):
+    """
+    Test that the user configuration file is re-read when it changes, and that changes to a Config object do not
+    affect the others.
+    """
+    monkeypatch.setenv("HOME", str(tmp_path))
+    os.makedirs(f"{tmp_path}/.config/dlaas")
+
+    with open(f"{tmp_path}/.config/dlaas/config_hpc.json", "w") as f:
+        json.dump({"ip": "localhost"}, f)
+    config_test = Config(version="hpc")
+    assert config_test.ip == "localhost"
+
+    config_test.modules.append("python")
+    config_test.load_custom_config({"ip": "127.0.0.1"})
+    assert Config(version="hpc").ip == "localhost"
+    assert "python" not in Config(version="hpc").modules
+
+    with open(f"{tmp_path}/.config/dlaas/config_hpc.json", "w") as f:
+        json.dump({"ip": "example.com"}, f)
+    os.utime(f"{tmp_path}/.config/dlaas/config_hpc.json", ns=(0, 0))  # make sure the modification time changes
+    assert Config(version="hpc").ip == "example.com"
+
+    os.remove(f"{tmp_path}/.config/dlaas/config_hpc.json")
+    assert Config(version="hpc").ip != "example.com"
+
+
+def test_operator_only():
+    """
+    Test that operator-only options are refused in a custom configuration
+    """
+
+    config_test = Config(version="server")
+
+    with pytest.raises(KeyError):
+        config_test.load_custom_config({"local_max_matches": "10"})
+    assert config_test.local_max_matches == 0
+
+    config_test = Config(version="hpc")
+    for key in ["query_cache_path", "metrics_dir", "trace_dir"]:
+        with pytest.raises(KeyError):
+            config_test.load_custom_config({key: "/home/user/.bashrc"})
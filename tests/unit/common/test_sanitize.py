@@ -5,7 +5,7 @@ import pytest
 #
 
 from dlaas.tuilib.common import Config
-from dlaas.tuilib.common import sanitize_dictionary
+from dlaas.tuilib.common import sanitize_dictionary, check_format
 
 
 def test_server_illegal_characters():
@@ -315,3 +315,30 @@ def test_hpc_pfs_prefix_path():
         with pytest.raises(SyntaxError):
             config.__dict__["pfs_prefix_path"] = key
             sanitize_dictionary(config.__dict__)
+
+
+def test_integer_coercion():
+    """Test that integer keywords given as strings (e.g. in custom configurations) are converted to int"""
+    config = Config("server")
+    config.load_custom_config({"nodes": "2", "gpus": "1", "walltime": "01:00:00"})
+
+    assert config.nodes == 2
+    assert config.gpus == 1
+    assert config.walltime == "01:00:00"
+
+    config.load_custom_config({"nodes": "2k"})
+
+    assert config.nodes == "2k"
+
+
+def test_memoized_check():
+    """Test that a value which passed validation is not accepted for another keyword, and that failed
+    validations are not memoized"""
+    check_format("port", "27017")
+
+    with pytest.raises(SyntaxError):
+        check_format("walltime", "27017 `curl abc.def.com`")
+    with pytest.raises(SyntaxError):
+        check_format("walltime", "27017 `curl abc.def.com`")
+    with pytest.raises(SyntaxError):
+        check_format("s3_bucket", "27017.")
@@ -5,6 +5,7 @@ import pytest
 #
 
 import os, json
+from dlaas.tuilib import common
 from dlaas.tuilib.common import UserInput
 
 
@@ -46,6 +47,23 @@ def test_sql_and_script():
         assert f.read() == "def main(files_in):\n files_out=files_in.copy()\n files_out.reverse()\n return files_out"
 
 
+def test_server_translation():
+    """
+    Test initialization of UserInput class with the query already translated by the server
+    """
+
+    data = {
+        "id": "42",
+        "sql_query": "SELECT * FROM metadata WHERE category = 'motorcycle'",
+        "query_filters": {"category": "motorcycle"},
+        "query_fields": {},
+    }
+    user_input = UserInput(data)
+
+    assert user_input.query_filters == {"category": "motorcycle"}
+    assert user_input.query_fields == {}
+
+
 def test_missing_query():
     """
     Test that the initialization fails if query is not provided
@@ -421,3 +439,139 @@ def test_not_a_json():
 
     with pytest.raises(TypeError):
         UserInput(version="hpc").from_json("test.notajson")
+
+
+def test_unknown_key():
+    """
+    Test that the initialization fails if an unknown key is provided
+    """
+    with pytest.raises(KeyError):
+        data = {"id": "42", "sql_query": "SELECT * FROM metadata", "script": "user_script.py"}
+        UserInput(data)
+
+
+def test_slots():
+    """
+    Test that attributes outside of the schema cannot be set
+    """
+
+    user_input = UserInput({"id": "42", "sql_query": "SELECT * FROM metadata"})
+
+    with pytest.raises(AttributeError):
+        user_input.walltime = "01:00:00"
+
+
+def test_config_string():
+    """
+    Test decoding of custom config passed as JSON-formatted string, with double or single quotes
+    """
+
+    user_input = UserInput(
+        {
+            "id": "42",
+            "sql_query": "SELECT * FROM metadata",
+            "config_hpc": '{"ip": "localhost"}',
+            "config_server": "{'walltime': '01:00:00'}",
+        }
+    )
+
+    assert user_input.config_hpc == {"ip": "localhost"}
+    assert user_input.config_server == {"walltime": "01:00:00"}
+
+    with pytest.raises(TypeError):
+        UserInput({"id": "42", "sql_query": "SELECT * FROM metadata", "config_hpc": "[1, 2]"})
+
+
+def test_config_string_apostrophe():
+    """
+    Test that values containing apostrophes are preserved when decoding a single-quoted custom config
+    """
+
+    user_input = UserInput(
+        {
+            "id": "42",
+            "sql_query": "SELECT * FROM metadata",
+            "config_server": """{'mail': "o'brien@example.com", 'walltime': '01:00:00'}""",
+        }
+    )
+
+    assert user_input.config_server == {"mail": "o'brien@example.com", "walltime": "01:00:00"}
+
+    with pytest.raises(ValueError):
+        UserInput({"id": "42", "sql_query": "SELECT * FROM metadata", "config_server": "{'walltime': "})
+
+
+def test_json_cache_bounded(tmp_path):
+    """
+    Test that the cache of decoded JSON files does not grow beyond its maximum size
+    """
+
+    for i in range(common._INPUT_FILES_MAXSIZE + 10):
+        json_path = f"{tmp_path}/input_{i}.json"
+        with open(json_path, "w") as f:
+            json.dump({"id": str(i), "sql_query": "SELECT * FROM metadata"}, f)
+        assert UserInput.from_json(json_path=json_path).id == str(i)
+
+    assert len(common._INPUT_FILES) == common._INPUT_FILES_MAXSIZE
+    assert f"{tmp_path}/input_0.json" not in common._INPUT_FILES
+
+
+def test_to_json():
+    """
+    Test that the serialized user input can be loaded back
+    """
+
+    user_input = UserInput(
+        {
+            "id": "42",
+            "sql_query": "SELECT * FROM metadata WHERE category = 'motorcycle'",
+            "config_server": {"walltime": "01:00:00"},
+            "query_filters": {"category": "motorcycle"},
+        }
+    )
+
+    assert user_input.to_dict() == {
+        "id": "42",
+        "sql_query": "SELECT * FROM metadata WHERE category = 'motorcycle'",
+        "config_server": {"walltime": "01:00:00"},
+        "query_filters": {"category": "motorcycle"},
+    }
+    assert UserInput.from_dict(user_input.to_json()) == user_input
+
+
+def test_json_modified():
+    """
+    Test that the JSON file is decoded again if modified
+    """
+
+    with open("input.json", "w") as f:
+        json.dump({"id": "42", "sql_query": "SELECT * FROM metadata"}, f)
+
+    assert UserInput.from_json(json_path="input.json").query_filters == None
+
+    with open("input.json", "w") as f:
+        json.dump({"id": "42", "sql_query": "SELECT * FROM metadata", "query_filters": {}}, f)
+
+    assert UserInput.from_json(json_path="input.json").query_filters == {}
+
+
+def test_jsonl():
+    """
+    Test loading of a batch of jobs from a JSONL spool file
+    """
+
+    with open("input.jsonl", "w") as f:
+        f.write('{"id": "1", "sql_query": "SELECT * FROM metadata"}\n')
+        f.write("\n")
+        f.write('{"id": "2", "sql_query": "SELECT * FROM metadata", "script_path": "user_script.py"}\n')
+
+    user_inputs = UserInput.from_jsonl(jsonl_path="input.jsonl")
+
+    assert [user_input.id for user_input in user_inputs] == ["1", "2"]
+    assert user_inputs[1].script_path == "user_script.py"
+
+    with open("input.jsonl", "a") as f:
+        f.write('{"id": "3"}\n')
+
+    with pytest.raises(KeyError):
+        UserInput.from_jsonl(jsonl_path="input.jsonl")
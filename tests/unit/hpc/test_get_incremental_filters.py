@@ -0,0 +1,168 @@
+import pytest
+
+#
+# Testing get_incremental_filters and get_high_water_mark functions in hpc.py library
+#
+
+from dlaas.tuilib.hpc import get_incremental_filters, get_high_water_mark, retrieve_files
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+
+import mongomock
+
+
+@pytest.fixture(scope="function")
+def collection():
+    """Collection with two files added before the previous job, and the results entry of the previous job"""
+    collection = mongomock.MongoClient().db.collection
+
+    before = datetime.now(timezone.utc) - timedelta(hours=2)
+    collection.insert_many(
+        [
+            {"_id": ObjectId.from_datetime(before), "id": "1", "path": "old1.txt"},
+            {"_id": ObjectId.from_datetime(before + timedelta(seconds=1)), "id": "2", "path": "old2.txt"},
+            {
+                "job_id": "PREVIOUS",
+                "s3_key": "results_PREVIOUS.zip",
+                "path": "results_PREVIOUS.zip",
+                "query_date": datetime.now(timezone.utc) - timedelta(hours=1),
+                "upload_date": datetime.now(timezone.utc) - timedelta(hours=1),
+            },
+        ]
+    )
+
+    yield collection
+
+
+def test_new_files(collection):
+    """
+    Only files inserted after the previous job are retrieved
+    """
+
+    collection.insert_one({"id": "1", "path": "new1.txt"})
+
+    query_filters = get_incremental_filters(collection, query_filters={"id": "1"}, previous_job_id="PREVIOUS")
+
+    assert retrieve_files(collection, query_filters=query_filters, query_fields={}) == ["new1.txt"]
+
+
+def test_modified_files(collection):
+    """
+    Files whose upload date was updated after the previous job are retrieved
+    """
+
+    collection.update_one({"id": "2"}, {"$set": {"upload_date": datetime.now(timezone.utc)}})
+
+    query_filters = get_incremental_filters(collection, query_filters={}, previous_job_id="PREVIOUS")
+
+    assert retrieve_files(collection, query_filters=query_filters, query_fields={}) == ["old2.txt"]
+
+
+def test_no_new_files(collection):
+    """
+    Nothing is retrieved if no files were added
+    """
+
+    query_filters = get_incremental_filters(collection, query_filters={"id": "1"}, previous_job_id="PREVIOUS")
+
+    assert retrieve_files(collection, query_filters=query_filters, query_fields={}) == []
+
+
+def test_missing_previous_job(collection):
+    """
+    Incremental runs need the results of the previous job
+    """
+
+    with pytest.raises(ValueError):
+        get_incremental_filters(collection, query_filters={}, previous_job_id="MISSING")
+
+
+def test_high_water_mark(collection):
+    """
+    The high-water mark is taken from the matching files, ignoring the results entries
+    """
+
+    last = collection.find_one({"id": "2"})["_id"]
+
+    assert get_high_water_mark(collection, query_filters={}) == {
+        "query_last_id": last,
+        "query_last_date": None,
+        "query_overlap": 0,
+        "query_window": [{"_id": last, "upload_date": None}],
+    }
+    assert get_high_water_mark(collection, query_filters={"id": "3"}) == {
+        "query_last_id": None,
+        "query_last_date": None,
+        "query_overlap": 0,
+        "query_window": [],
+    }
+
+
+def test_high_water_mark_skewed_clock(collection):
+    """
+    With a high-water mark, files are selected by comparison with the data matched by the previous job, regardless
+    of the clock of the node which ran it
+    """
+
+    collection.update_one(
+        {"job_id": "PREVIOUS"},
+        {
+            "$set": {
+                "query_date": datetime.now(timezone.utc) + timedelta(days=1),  # HPC node clock ahead
+                **get_high_water_mark(collection, query_filters={}),
+            }
+        },
+    )
+    collection.insert_one({"id": "1", "path": "new1.txt"})
+
+    query_filters = get_incremental_filters(collection, query_filters={"id": "1"}, previous_job_id="PREVIOUS")
+
+    assert retrieve_files(collection, query_filters=query_filters, query_fields={}) == ["new1.txt"]
+
+
+def test_high_water_mark_no_matches(collection):
+    """
+    If the previous job matched no files, all the matching files are new
+    """
+
+    collection.update_one({"job_id": "PREVIOUS"}, {"$set": get_high_water_mark(collection, query_filters={"id": "3"})})
+
+    query_filters = get_incremental_filters(collection, query_filters={"id": "1"}, previous_job_id="PREVIOUS")
+
+    assert retrieve_files(collection, query_filters=query_filters, query_fields={}) == ["old1.txt"]
+
+
+def test_late_insert(collection):
+    """
+    Files inserted after the previous job with an older ObjectId than its high-water mark (e.g. by a client with a
+    lagging clock) are retrieved if they fall within the overlap window, while the files already found there are not
+    """
+
+    collection.update_one(
+        {"job_id": "PREVIOUS"}, {"$set": get_high_water_mark(collection, query_filters={}, overlap=60)}
+    )
+    old1 = collection.find_one({"id": "1"})["_id"]
+    late = ObjectId(old1.binary[:11] + b"\x01")  # between the ids of old1 and old2 (the high-water mark)
+    collection.insert_one({"_id": late, "id": "1", "path": "late1.txt"})
+
+    query_filters = get_incremental_filters(collection, query_filters={}, previous_job_id="PREVIOUS")
+
+    assert retrieve_files(collection, query_filters=query_filters, query_fields={}) == ["late1.txt"]
+
+
+def test_modified_in_window(collection):
+    """
+    Files of the overlap window whose upload date was updated after the previous job are retrieved again
+    """
+
+    collection.update_one({"id": "2"}, {"$set": {"upload_date": datetime.now(timezone.utc) - timedelta(hours=2)}})
+    collection.update_one(
+        {"job_id": "PREVIOUS"}, {"$set": get_high_water_mark(collection, query_filters={}, overlap=60)}
+    )
+    collection.update_one(
+        {"id": "2"}, {"$set": {"upload_date": datetime.now(timezone.utc) - timedelta(hours=2, seconds=-1)}}
+    )
+
+    query_filters = get_incremental_filters(collection, query_filters={}, previous_job_id="PREVIOUS")
+
+    assert retrieve_files(collection, query_filters=query_filters, query_fields={}) == ["old2.txt"]
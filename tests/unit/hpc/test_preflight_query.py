@@ -0,0 +1,49 @@
+import pytest
+
+#
+# Testing preflight_query function in hpc.py library
+#
+
+from dlaas.tuilib.hpc import preflight_query
+
+
+def test_preflight_filter(mock_mongodb):
+    """
+    Count the files matching a filter and sum their size
+    """
+    mock_mongodb.update_one({"id": "1"}, {"$set": {"size": 100}})
+    mock_mongodb.update_one({"id": "2"}, {"$set": {"size": 50}})
+
+    result = preflight_query(collection=mock_mongodb, query_filters={"id": "1"})
+
+    assert result == {"matches": 1, "size": 100}
+
+
+def test_preflight_everything(mock_mongodb):
+    """
+    Count all files, when no filter is given
+    """
+    mock_mongodb.update_one({"id": "1"}, {"$set": {"size": 100}})
+    mock_mongodb.update_one({"id": "2"}, {"$set": {"size": 50}})
+
+    result = preflight_query(collection=mock_mongodb, query_filters={})
+
+    assert result == {"matches": 2, "size": 150}
+
+
+def test_preflight_no_size(mock_mongodb):
+    """
+    Size is 0 if the size field is not present in the metadata
+    """
+    result = preflight_query(collection=mock_mongodb, query_filters={"$or": [{"id": "1"}, {"id": "2"}]})
+
+    assert result == {"matches": 2, "size": 0}
+
+
+def test_preflight_no_matches(mock_mongodb):
+    """
+    No matches for a filter
+    """
+    result = preflight_query(collection=mock_mongodb, query_filters={"id": "3"})
+
+    assert result == {"matches": 0, "size": 0}
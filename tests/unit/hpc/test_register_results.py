@@ -0,0 +1,78 @@
+import pytest
+
+#
+# Testing register_results function in hpc.py library
+#
+
+from dlaas.tuilib.hpc import register_results
+import os
+import shutil
+import hashlib
+from datetime import datetime, timedelta
+
+from conftest import ROOT_DIR
+
+
+@pytest.fixture(scope="function")
+def output_dir():
+    os.makedirs("output", exist_ok=True)
+    shutil.copy(f"{ROOT_DIR}/tests/utils/sample_files/test1.txt", "output/test1.txt")
+    shutil.copy(f"{ROOT_DIR}/tests/utils/sample_files/test2.txt", "output/test2.txt")
+    yield "output"
+    shutil.rmtree("output")
+
+
+def test_register_archive(mock_mongodb, output_dir):
+    """
+    Test that a single entry is created for the results archive
+    """
+
+    register_results(collection=mock_mongodb, job_id=1, pfs_prefix_path=ROOT_DIR)
+
+    assert len([_ for _ in mock_mongodb.find({"job_id": 1})]) == 1
+    assert mock_mongodb.find_one({"job_id": 1})["path"] == f"{ROOT_DIR}/results_1.zip"
+    assert mock_mongodb.find_one({"job_id": 1})["s3_key"] == "results_1.zip"
+    assert mock_mongodb.find_one({"job_id": 1})["file_count"] == 2
+    assert [file["name"] for file in mock_mongodb.find_one({"job_id": 1})["files"]] == ["test1.txt", "test2.txt"]
+
+
+def test_register_objects(mock_mongodb, output_dir):
+    """
+    Test that an entry is created for each output file with the "objects" layout
+    """
+
+    register_results(
+        collection=mock_mongodb,
+        job_id=2,
+        pfs_prefix_path=ROOT_DIR,
+        upload_options={"output_layout": "objects"},
+    )
+
+    entries = [entry for entry in mock_mongodb.find({"job_id": 2}).sort("s3_key")]
+    assert [entry["s3_key"] for entry in entries] == ["results/2/test1.txt", "results/2/test2.txt"]
+    assert entries[0]["path"] == f"{ROOT_DIR}/results/2/test1.txt"
+
+    with open(f"{ROOT_DIR}/tests/utils/sample_files/test1.txt", "rb") as f:
+        content = f.read()
+    assert entries[0]["size"] == len(content)
+    assert entries[0]["checksum"] == hashlib.sha256(content).hexdigest()
+
+
+def test_upload_date(mock_mongodb, output_dir):
+    """
+    Test that the upload date is stored as a datetime, so that results can be queried by date range
+    """
+
+    register_results(
+        collection=mock_mongodb,
+        job_id=3,
+        pfs_prefix_path=ROOT_DIR,
+        upload_options={"output_layout": "objects"},
+        max_workers=1,
+    )
+
+    entry = mock_mongodb.find_one({"job_id": 3})
+    assert isinstance(entry["upload_date"], datetime)
+
+    since = datetime.utcnow() - timedelta(minutes=1)
+    assert mock_mongodb.count_documents({"job_id": 3, "upload_date": {"$gte": since}}) == 2
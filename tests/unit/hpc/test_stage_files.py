@@ -0,0 +1,103 @@
+import pytest
+
+#
+# Testing stage_files, iter_staged_shards and release_shard functions in hpc.py library
+#
+
+from dlaas.tuilib.hpc import stage_files, iter_staged_shards, release_shard
+import os
+import shutil
+
+from conftest import ROOT_DIR
+
+
+@pytest.fixture(scope="function")
+def staging_dir():
+    staging_dir = "stage_files_test"
+    yield staging_dir
+    shutil.rmtree(staging_dir)
+
+
+def test_stage_files(staging_dir):
+    """
+    Stage two files and check that they are copied and returned in the same order
+    """
+
+    files_in = [
+        f"{ROOT_DIR}/tests/utils/sample_files/test2.txt",
+        f"{ROOT_DIR}/tests/utils/sample_files/test1.txt",
+    ]
+
+    files_staged = stage_files(files_in=files_in, staging_dir=staging_dir, max_workers=2)
+
+    assert files_staged == [
+        f"{staging_dir}/test2.txt",
+        f"{staging_dir}/test1.txt",
+    ], "Staged file list not matching"
+
+    for file_in, file_staged in zip(files_in, files_staged):
+        with open(file_in, "r") as f_in, open(file_staged, "r") as f_staged:
+            assert f_in.read() == f_staged.read(), "Staged file content not matching"
+
+
+def test_stage_duplicate_names(staging_dir):
+    """
+    Test that files sharing the same name are staged to distinct paths
+    """
+
+    files_in = [
+        f"{ROOT_DIR}/tests/utils/sample_files/test1.txt",
+        f"{ROOT_DIR}/tests/utils/sample_files/test1.txt",
+    ]
+
+    files_staged = stage_files(files_in=files_in, staging_dir=staging_dir)
+
+    assert files_staged == [f"{staging_dir}/test1.txt", f"{staging_dir}/1/test1.txt"]
+    assert all(os.path.isfile(file) for file in files_staged)
+
+
+def test_stage_missing_file(staging_dir):
+    """
+    Test that if a file cannot be staged, staging fails
+    """
+
+    files_in = [f"{ROOT_DIR}/tests/utils/sample_files/notafile.txt"]
+
+    with pytest.raises(OSError):
+        stage_files(files_in=files_in, staging_dir=staging_dir)
+
+
+def test_iter_staged_shards(staging_dir):
+    """
+    Stage two files in shards of one file each, each in its own folder
+    """
+
+    files_in = [
+        f"{ROOT_DIR}/tests/utils/sample_files/test1.txt",
+        f"{ROOT_DIR}/tests/utils/sample_files/test2.txt",
+    ]
+
+    shards = [shard for shard in iter_staged_shards(files_in=files_in, staging_dir=staging_dir, shard_size=1)]
+
+    assert shards == [
+        (f"{staging_dir}/shard_0", [f"{staging_dir}/shard_0/test1.txt"]),
+        (f"{staging_dir}/shard_1", [f"{staging_dir}/shard_1/test2.txt"]),
+    ], "Staged shards not matching"
+
+
+def test_release_shard(staging_dir):
+    """
+    Test that a processed shard is removed, except for the staged files returned by the user script
+    """
+
+    files_in = [
+        f"{ROOT_DIR}/tests/utils/sample_files/test1.txt",
+        f"{ROOT_DIR}/tests/utils/sample_files/test2.txt",
+    ]
+
+    files_staged = stage_files(files_in=files_in, staging_dir=f"{staging_dir}/shard_0")
+    release_shard(shard_dir=f"{staging_dir}/shard_0", files_out=files_staged[:1])
+    assert os.listdir(f"{staging_dir}/shard_0") == ["test1.txt"]
+
+    release_shard(shard_dir=f"{staging_dir}/shard_0", files_out=[])
+    assert not os.path.exists(f"{staging_dir}/shard_0")
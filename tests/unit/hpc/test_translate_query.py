@@ -0,0 +1,40 @@
+import pytest
+
+#
+# Testing translate_query function in hpc.py library
+#
+
+from dlaas.tuilib.hpc import translate_query
+
+
+def test_server_translation():
+    """
+    Use the translation shipped by the server without parsing the query
+    """
+    query_filters, query_fields = translate_query(
+        sql_query="not parsed",
+        query_filters={"$or": [{"category": "motorcycle"}, {"category": "bicycle"}]},
+        query_fields=None,
+    )
+    assert query_filters == {"$or": [{"category": "motorcycle"}, {"category": "bicycle"}]}
+    assert query_fields == {}
+
+
+def test_no_server_translation():
+    """
+    Parse the query if no translation is available
+    """
+    query_filters, query_fields = translate_query(sql_query="SELECT * FROM metadata WHERE category = motorcycle")
+    assert query_filters == {"category": "motorcycle"}
+    assert query_fields == {}
+
+
+def test_unsafe_operator():
+    """
+    Make sure exception is raised if the translation contains server-side JavaScript
+    """
+    with pytest.raises(ValueError):
+        translate_query(
+            sql_query="SELECT * FROM metadata",
+            query_filters={"$and": [{"$where": "sleep(100000)"}]},
+        )
@@ -0,0 +1,65 @@
+import pytest
+
+#
+# Testing collect_filters and summarize_explain functions in indexes.py library
+#
+
+from dlaas.tuilib.indexes import collect_filters, summarize_explain
+
+
+def test_collect_filters(tmp_path):
+    """
+    Read the query filters from the job logs, skipping malformed lines
+    """
+    with open(f"{tmp_path}/dl-tui.log", "w") as f:
+        f.write("2024-01-01 00:00:00,000 - dlaas.tuilib.hpc - INFO - User query: SELECT * FROM metadata\n")
+        f.write("2024-01-01 00:00:00,000 - dlaas.tuilib.hpc - INFO - MongoDB query filter: {'category': 'dog'}\n")
+        f.write("2024-01-01 00:00:00,000 - dlaas.tuilib.hpc - INFO - MongoDB query filter: {'width': {'$gt': 6\n")
+        f.write("2024-01-01 00:00:00,000 - dlaas.tuilib.hpc - INFO - MongoDB query filter: {'id': '1'}\n")
+
+    assert collect_filters([f"{tmp_path}/*.log"]) == [{"category": "dog"}, {"id": "1"}]
+
+
+def test_collect_filters_json(tmp_path):
+    """
+    Read the query filters from job logs written as JSON lines
+    """
+    with open(f"{tmp_path}/dl-tui.log", "w") as f:
+        f.write('{"name": "dlaas.tuilib.hpc", "level": "INFO", "message": "User query: SELECT * FROM metadata"}\n')
+        f.write(
+            '{"name": "dlaas.tuilib.hpc", "level": "INFO", "message": "MongoDB query filter: {\'category\': \'dog\'}"}\n'
+        )
+        f.write(
+            '{"name": "dlaas.tuilib.hpc", "level": "INFO", "message": "MongoDB query filter: {\'width\': {\'$gt\': 6'
+        )
+
+    assert collect_filters([f"{tmp_path}/*.log"]) == [{"category": "dog"}]
+
+
+def test_summarize_explain():
+    """
+    Extract plan stages and execution statistics
+    """
+    explain = {
+        "queryPlanner": {
+            "winningPlan": {
+                "stage": "FETCH",
+                "inputStage": {"stage": "IXSCAN", "indexName": "category_1"},
+            }
+        },
+        "executionStats": {
+            "nReturned": 10,
+            "totalDocsExamined": 10,
+            "totalKeysExamined": 10,
+            "executionTimeMillis": 2,
+        },
+    }
+
+    assert summarize_explain(explain) == {
+        "stages": ["FETCH", "IXSCAN"],
+        "index": "category_1",
+        "docs_examined": 10,
+        "keys_examined": 10,
+        "returned": 10,
+        "time_ms": 2,
+    }
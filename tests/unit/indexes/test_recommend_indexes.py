@@ -0,0 +1,68 @@
+import pytest
+
+#
+# Testing recommend_indexes and create_indexes functions in indexes.py library
+#
+
+from dlaas.tuilib.indexes import extract_predicates, recommend_indexes, create_indexes
+
+
+def test_extract_predicates():
+    """
+    Split $or branches, merge $and clauses and classify equality and range predicates
+    """
+    query_filters = {
+        "$and": [
+            {"category": "motorcycle"},
+            {"$or": [{"width": {"$gt": 600}}, {"height": {"$in": [100, 200]}}]},
+        ]
+    }
+
+    assert extract_predicates(query_filters) == [
+        {"category": "equality", "width": "range"},
+        {"category": "equality", "height": "equality"},
+    ]
+
+
+def test_recommend_esr_order():
+    """
+    Equality fields come before range fields
+    """
+    query_filters = [{"$and": [{"width": {"$gt": 600}}, {"category": "motorcycle"}]}]
+
+    assert recommend_indexes(query_filters) == [{"keys": [("category", 1), ("width", 1)], "queries": 1}]
+
+
+def test_recommend_prefix():
+    """
+    An index which is a prefix of another one is not recommended, its queries are counted for the longer one
+    """
+    query_filters = [
+        {"category": "motorcycle"},
+        {"category": "bicycle"},
+        {"$and": [{"category": "motorcycle"}, {"width": {"$gt": 600}}]},
+        {"id": "1"},
+    ]
+
+    assert recommend_indexes(query_filters) == [
+        {"keys": [("category", 1), ("width", 1)], "queries": 3},
+        {"keys": [("id", 1)], "queries": 1},
+    ]
+
+    assert recommend_indexes(query_filters, min_queries=2) == [
+        {"keys": [("category", 1), ("width", 1)], "queries": 3},
+    ]
+
+
+def test_recommend_existing(mock_mongodb):
+    """
+    Indexes already present on the collection are not recommended, and recommended ones are created
+    """
+    query_filters = [{"category": "motorcycle"}, {"id": "1"}]
+
+    recommendations = recommend_indexes(query_filters, collection=mock_mongodb)
+    assert recommendations == [{"keys": [("category", 1)], "queries": 1}, {"keys": [("id", 1)], "queries": 1}]
+
+    assert create_indexes(mock_mongodb, recommendations[:1]) == ["category_1"]
+
+    assert recommend_indexes(query_filters, collection=mock_mongodb) == [{"keys": [("id", 1)], "queries": 1}]
@@ -0,0 +1,41 @@
+import pytest
+
+#
+# Testing read_log function in logs.py library
+#
+
+from dlaas.tuilib.logs import read_log
+
+
+def test_json(tmp_path):
+    """
+    Read JSON records, with multi-line messages
+    """
+
+    with open(f"{tmp_path}/dl-tui.log", "w") as f:
+        f.write('{"time": "2024-01-01 00:00:00,000", "name": "dlaas", "level": "INFO", "message": "first"}\n')
+        f.write('{"time": "2024-01-01 00:00:01,000", "name": "dlaas", "level": "DEBUG", "message": "second\\nline"}\n')
+
+    records = list(read_log(f"{tmp_path}/dl-tui.log"))
+
+    assert [record["message"] for record in records] == ["first", "second\nline"]
+    assert records[1]["level"] == "DEBUG"
+
+
+def test_text(tmp_path):
+    """
+    Read plain text records, appending continuation lines to the previous message
+    """
+
+    with open(f"{tmp_path}/dl-tui.log", "w") as f:
+        f.write("2024-01-01 00:00:00,000 - dlaas.tuilib.hpc - INFO - User script:\n")
+        f.write("def main(files_in):\n")
+        f.write("    return files_in\n")
+        f.write("2024-01-01 00:00:01,000 - dlaas.tuilib.hpc - DEBUG - Query results: []\n")
+
+    records = list(read_log(f"{tmp_path}/dl-tui.log"))
+
+    assert len(records) == 2
+    assert records[0]["name"] == "dlaas.tuilib.hpc"
+    assert records[0]["message"] == "User script:\ndef main(files_in):\n    return files_in"
+    assert records[1]["level"] == "DEBUG"
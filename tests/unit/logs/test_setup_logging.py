@@ -0,0 +1,111 @@
+import pytest
+
+#
+# Testing setup_logging function in logs.py library
+#
+
+from dlaas.tuilib.logs import setup_logging, get_log_options, get_log_files, Preview
+from dlaas.tuilib.common import Config
+import os
+import json
+import logging
+
+
+@pytest.fixture(scope="function")
+def root_logger():
+    """Restore the handlers and level of the root logger after the test"""
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    root.handlers, root.level = handlers, level
+
+
+def test_json(root_logger, tmp_path):
+    """
+    Records are written as JSON lines by the listener thread, with the fields passed via `extra`
+    """
+
+    listener = setup_logging(f"{tmp_path}/dl-tui.log")
+    logging.getLogger("dlaas.test").info("Launched job %s", "42", extra={"job_id": "42"})
+    listener.stop()
+
+    with open(f"{tmp_path}/dl-tui.log", "r") as f:
+        records = [json.loads(line) for line in f]
+
+    assert len(records) == 1
+    assert records[0]["name"] == "dlaas.test"
+    assert records[0]["level"] == "INFO"
+    assert records[0]["message"] == "Launched job 42"
+    assert records[0]["job_id"] == "42"
+
+
+def test_text(root_logger, tmp_path):
+    """
+    Records are written as plain text
+    """
+
+    listener = setup_logging(f"{tmp_path}/dl-tui.log", format="text")
+    logging.getLogger("dlaas.test").warning("Query ran a collection scan")
+    listener.stop()
+
+    with open(f"{tmp_path}/dl-tui.log", "r") as f:
+        assert f.read().endswith(" - dlaas.test - WARNING - Query ran a collection scan\n")
+
+
+def test_truncation(root_logger, tmp_path):
+    """
+    Huge messages are truncated, huge lists are only partially formatted
+    """
+
+    listener = setup_logging(f"{tmp_path}/dl-tui.log", max_length=100)
+    logging.getLogger("dlaas.test").debug("Query results: %s", [f"/path/{i}" for i in range(1000)])
+    logging.getLogger("dlaas.test").debug("Query results: %s", Preview([f"/path/{i}" for i in range(1000)], limit=2))
+    listener.stop()
+
+    with open(f"{tmp_path}/dl-tui.log", "r") as f:
+        records = [json.loads(line) for line in f]
+
+    assert records[0]["message"].startswith("Query results: ['/path/0', ")
+    assert records[0]["message"].endswith(" characters truncated]")
+    assert len(records[0]["message"]) < 200
+    assert records[1]["message"] == "Query results: ['/path/0', '/path/1', ...] (1000 items)"
+
+
+def test_rotation(root_logger, tmp_path):
+    """
+    The log file is rotated when it reaches the maximum size
+    """
+
+    listener = setup_logging(f"{tmp_path}/dl-tui.log", max_bytes=1000, backup_count=2)
+    for i in range(100):
+        logging.getLogger("dlaas.test").info(f"Message {i}")
+    listener.stop()
+
+    assert get_log_files(f"{tmp_path}/dl-tui.log") == [
+        f"{tmp_path}/dl-tui.log.2",
+        f"{tmp_path}/dl-tui.log.1",
+        f"{tmp_path}/dl-tui.log",
+    ]
+    assert os.path.getsize(f"{tmp_path}/dl-tui.log.1") <= 1000
+
+
+def test_unsupported_format(root_logger, tmp_path):
+    """
+    Unsupported log formats are rejected
+    """
+
+    with pytest.raises(ValueError):
+        setup_logging(f"{tmp_path}/dl-tui.log", format="xml")
+
+
+def test_log_options():
+    """
+    Logging settings are read from the configuration
+    """
+
+    assert get_log_options(Config("server")) == {
+        "format": "json",
+        "max_bytes": 104857600,
+        "backup_count": 5,
+        "max_length": 10000,
+    }
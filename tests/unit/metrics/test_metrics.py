@@ -0,0 +1,115 @@
+import pytest
+
+#
+# Testing Metrics class and save_metrics function in metrics.py library
+#
+
+from dlaas.tuilib.metrics import Metrics, record_upload, save_metrics
+import json
+
+
+def test_counter():
+    """
+    Counters are incremented separately for each combination of labels
+    """
+
+    metrics = Metrics()
+    metrics.inc("dl_tui_jobs_total", outcome="submitted")
+    metrics.inc("dl_tui_jobs_total", outcome="submitted")
+    metrics.inc("dl_tui_jobs_total", outcome="cached")
+
+    assert metrics.to_dict()["counters"] == [
+        {"name": "dl_tui_jobs_total", "labels": {"outcome": "cached"}, "value": 1},
+        {"name": "dl_tui_jobs_total", "labels": {"outcome": "submitted"}, "value": 2},
+    ]
+
+
+def test_histogram():
+    """
+    Observations are counted in the first bucket whose upper bound is not exceeded
+    """
+
+    metrics = Metrics()
+    metrics.observe("dl_tui_files_matched", 0)
+    metrics.observe("dl_tui_files_matched", 5)
+    metrics.observe("dl_tui_files_matched", 10)
+    metrics.observe("dl_tui_files_matched", 10**7)
+
+    histogram = metrics.to_dict()["histograms"][0]
+    assert histogram["buckets"] == [1, 0, 2, 0, 0, 0, 0, 0, 1]
+    assert histogram["count"] == 4
+    assert histogram["sum"] == 10**7 + 15
+
+
+def test_unknown_metric():
+    """
+    Metrics must be defined, with the right type
+    """
+
+    metrics = Metrics()
+
+    with pytest.raises(KeyError):
+        metrics.inc("dl_tui_unknown_total")
+    with pytest.raises(KeyError):
+        metrics.inc("dl_tui_files_matched")
+
+
+def test_prometheus():
+    """
+    Metrics are exported in the Prometheus text format, with cumulative buckets
+    """
+
+    metrics = Metrics()
+    metrics.inc("dl_tui_jobs_total", outcome="submitted")
+    record_upload({"stages": {"upload": 0.5}, "bytes": 2000000, "throughput_MBps": 4.0}, metrics=metrics)
+
+    text = metrics.to_prometheus()
+
+    assert "# TYPE dl_tui_jobs_total counter\n" in text
+    assert 'dl_tui_jobs_total{outcome="submitted"} 1\n' in text
+    assert "dl_tui_uploaded_bytes_total 2000000\n" in text
+    assert 'dl_tui_upload_throughput_mbps_bucket{le="1"} 0\n' in text
+    assert 'dl_tui_upload_throughput_mbps_bucket{le="10"} 1\n' in text
+    assert 'dl_tui_upload_throughput_mbps_bucket{le="+Inf"} 1\n' in text
+    assert 'dl_tui_stage_seconds_bucket{stage="upload",le="1"} 1\n' in text
+    assert "dl_tui_upload_throughput_mbps_count 1\n" in text
+
+
+def test_save_metrics(tmp_path):
+    """
+    Metrics are accumulated over the processes sharing the same file
+    """
+
+    for _ in range(2):
+        metrics = Metrics()
+        metrics.inc("dl_tui_jobs_total", outcome="submitted")
+        metrics.observe("dl_tui_ssh_seconds", 0.2, step="launch_job")
+        save_metrics(f"{tmp_path}/metrics.json", metrics=metrics, prometheus_path=f"{tmp_path}/dl_tui.prom")
+
+    with open(f"{tmp_path}/metrics.json", "r") as f:
+        saved = json.load(f)
+
+    assert saved["counters"][0]["value"] == 2
+    assert saved["histograms"][0]["count"] == 2
+
+    with open(f"{tmp_path}/dl_tui.prom", "r") as f:
+        assert 'dl_tui_ssh_seconds_count{step="launch_job"} 2\n' in f.read()
+
+
+def test_metrics_path_default(tmp_path, monkeypatch):
+    """
+    Without metrics_dir, the metrics of a job are saved in ~/.dlaas/metrics rather than in the job folder
+    """
+
+    from dlaas.bin.dl_tui_hpc import get_metrics_path
+    from dlaas.tuilib.common import Config
+
+    monkeypatch.setenv("HOME", str(tmp_path))
+    config = Config(version="hpc")
+    config.metrics_dir = ""
+
+    assert get_metrics_path(config, "42") == f"{tmp_path}/.dlaas/metrics/metrics_42.json"
+    assert (tmp_path / ".dlaas" / "metrics").is_dir()
+
+    config.metrics_dir = f"{tmp_path}/custom"
+    assert get_metrics_path(config, "42") == f"{tmp_path}/custom/metrics_42.json"
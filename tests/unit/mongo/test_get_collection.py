@@ -0,0 +1,104 @@
+import pytest
+
+#
+# Testing get_collection function in mongo.py library
+#
+
+from dlaas.tuilib import mongo
+from dlaas.tuilib.mongo import get_collection, get_client_options, get_compressors, close_clients
+from dlaas.tuilib.common import Config
+
+import mongomock
+
+
+@pytest.fixture(scope="function")
+def clients(monkeypatch):
+    created = []
+
+    def client(uri, **options):
+        created.append(options)
+        return mongomock.MongoClient(uri)
+
+    monkeypatch.setattr("dlaas.tuilib.mongo.MongoClient", client)
+    close_clients()
+    yield created
+    close_clients()
+
+
+def test_shared_client(clients):
+    """
+    A single client is created per process for the same URI and options
+    """
+
+    config = Config("hpc")
+
+    collection = get_collection(config)
+    get_collection(config)
+
+    assert len(clients) == 1
+    assert collection.name == config.collection
+    assert clients[0]["maxPoolSize"] == int(config.mongo_max_pool_size)
+    assert clients[0]["readPreference"] == config.mongo_read_preference
+
+    get_collection(config, serverSelectionTimeoutMS=5000)
+
+    assert len(clients) == 2
+    assert clients[1]["serverSelectionTimeoutMS"] == 5000
+
+
+def test_fork(clients):
+    """
+    Clients inherited from the parent process are not reused after a fork
+    """
+
+    config = Config("hpc")
+
+    get_collection(config)
+    mongo._reset_clients()  # run in the child process after os.fork
+    get_collection(config)
+
+    assert len(clients) == 2
+
+
+def test_client_options():
+    """
+    Options set to 0 are left to the pymongo defaults
+    """
+
+    config = Config("hpc")
+    config.mongo_socket_timeout_ms = 0
+    config.mongo_connect_timeout_ms = "1000"
+    config.mongo_compressors = "zlib"
+
+    options = get_client_options(config)
+
+    assert "socketTimeoutMS" not in options
+    assert options["connectTimeoutMS"] == 1000
+    assert options["compressors"] == "zlib"
+
+
+def test_compressors(monkeypatch):
+    """
+    Compressors whose library is not installed are skipped
+    """
+
+    monkeypatch.setattr("dlaas.tuilib.mongo.snappy", None)
+    monkeypatch.setattr("dlaas.tuilib.mongo.zstandard", None)
+
+    assert get_compressors("zstd,snappy,zlib") == "zlib"
+    assert get_compressors("snappy") == ""
+
+
+def test_credentials_not_logged(clients, caplog):
+    """
+    The MongoDB password is not written to the logs
+    """
+
+    config = Config("hpc")
+    config.password = "s3cr3t-passw0rd"
+
+    with caplog.at_level("DEBUG"):
+        get_collection(config)
+
+    assert "s3cr3t-passw0rd" not in caplog.text
+    assert f"{config.ip}:{config.port}" in caplog.text
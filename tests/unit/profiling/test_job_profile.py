@@ -0,0 +1,66 @@
+import pytest
+
+#
+# Testing JobProfile class and save_upload_profile function in profiling.py library
+#
+
+from dlaas.tuilib.profiling import JobProfile, save_upload_profile
+import os
+import json
+
+
+def test_stages():
+    """
+    Time spent in a stage is accumulated over multiple runs
+    """
+
+    profile = JobProfile(job_id="JOB", enabled=True)
+
+    with profile.stage("script"):
+        pass
+    profile.add("script", 1.0)
+    profile.add("staging", 0.5)
+
+    content = profile.to_dict()
+    assert content["job_id"] == "JOB"
+    assert set(content["stages"]) == {"script", "staging"}
+    assert 1.0 <= content["stages"]["script"] < 1.1
+    assert content["stages"]["staging"] == 0.5
+
+
+def test_write(tmp_path):
+    """
+    Profile is written to a JSON file only if enabled
+    """
+
+    profile = JobProfile(job_id="JOB", enabled="false")
+    profile.write(f"{tmp_path}/disabled.json")
+    assert not os.path.exists(f"{tmp_path}/disabled.json")
+
+    profile = JobProfile(job_id="JOB", enabled="true")
+    profile.explain = {"stages": ["COLLSCAN"]}
+    profile.write(f"{tmp_path}/profile_JOB.json")
+    with open(f"{tmp_path}/profile_JOB.json", "r") as f:
+        assert json.load(f)["explain"] == {"stages": ["COLLSCAN"]}
+
+
+def test_save(mock_mongodb):
+    """
+    Profile is saved in the MongoDB documents of the job results, upload stages are added afterwards
+    """
+
+    mock_mongodb.insert_many([{"job_id": "JOB", "s3_key": "results/JOB/a.txt"}, {"job_id": "JOB", "s3_key": "b"}])
+
+    profile = JobProfile(job_id="JOB", enabled=True)
+    profile.add("retrieve", 0.25)
+    profile.save(mock_mongodb)
+
+    save_upload_profile(
+        collection=mock_mongodb,
+        job_id="JOB",
+        summary={"bytes": 100, "throughput_MBps": 1.0, "stages": {"archive": 0.5, "upload": 1.5}},
+    )
+
+    for entry in mock_mongodb.find({"job_id": "JOB"}):
+        assert entry["profile"]["stages"] == {"retrieve": 0.25, "archive": 0.5, "upload": 1.5}
+        assert entry["profile"]["counters"]["upload_bytes"] == 100
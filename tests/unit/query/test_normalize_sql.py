@@ -0,0 +1,41 @@
+import pytest
+
+#
+# Testing normalize_sql and parameterize_sql functions in query.py library
+#
+
+from dlaas.tuilib.query import normalize_sql, parameterize_sql
+
+
+def test_normalize_whitespace():
+    """
+    Collapse whitespace sequences (including newlines) to a single space
+    """
+    query = "  SELECT *\nFROM   datalake\tWHERE category = motorcycle "
+    assert normalize_sql(query) == "SELECT * FROM datalake WHERE category = motorcycle"
+
+
+def test_normalize_keywords():
+    """
+    Uppercase SQL keywords, leaving field names and values untouched
+    """
+    query = "select * from Datalake where Category = Motorcycle and not width > 600"
+    assert normalize_sql(query) == "SELECT * FROM Datalake WHERE Category = Motorcycle AND NOT width > 600"
+
+
+def test_normalize_quoted():
+    """
+    Leave quoted text untouched
+    """
+    query = "SELECT * FROM datalake WHERE caption = 'a boy  and   a dog' AND \"field  name\" = 1"
+    assert normalize_sql(query) == query
+
+
+def test_parameterize():
+    """
+    Replace single-quoted literals with numbered markers
+    """
+    query = "SELECT * FROM datalake WHERE category = 'motorcycle' OR caption = 'it''s a dog'"
+    template, params = parameterize_sql(query)
+    assert template == "SELECT * FROM datalake WHERE category = '__dlaas_param_0__' OR caption = '__dlaas_param_1__'"
+    assert params == ["motorcycle", "it's a dog"]
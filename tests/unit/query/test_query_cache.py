@@ -0,0 +1,188 @@
+import pytest
+
+#
+# Testing QueryCache class in query.py library
+#
+
+from dlaas.tuilib.query import QueryCache
+import os
+import re
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CountingParser:
+    """Minimal SQL parser which keeps track of the number of calls"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, sql_query):
+        self.calls.append(sql_query)
+        filters = {}
+        for key, op, value in re.findall(r"(\w+) (=|LIKE|CONTAINS) '([^']*)'", sql_query):
+            if op == "=":
+                filters[key] = value
+            elif op == "LIKE":
+                filters[key] = {"$regex": value.replace("%", ".*")}
+            else:
+                filters[key] = {"$regex": f".*{value}.*"}
+        return filters, {}
+
+
+def test_cache_hit():
+    """
+    Equivalent queries are parsed only once
+    """
+    parse = CountingParser()
+    cache = QueryCache()
+
+    first = cache.translate("SELECT * FROM datalake WHERE category = 'dog'", parse)
+    second = cache.translate("select *\nfrom datalake where  category = 'dog'", parse)
+
+    assert first == second == ({"category": "dog"}, {})
+    assert len(parse.calls) == 1
+    assert cache.hits == 1 and cache.misses == 1
+
+
+def test_cache_returns_copies():
+    """
+    Modifying a returned translation does not alter the cached one
+    """
+    parse = CountingParser()
+    cache = QueryCache()
+
+    filters, _ = cache.translate("SELECT * FROM datalake WHERE category = 'dog'", parse)
+    filters["category"] = "cat"
+
+    assert cache.translate("SELECT * FROM datalake WHERE category = 'dog'", parse) == ({"category": "dog"}, {})
+
+
+def test_cache_lru_eviction():
+    """
+    The least recently used entry is evicted when the cache is full
+    """
+    parse = CountingParser()
+    cache = QueryCache(maxsize=2)
+
+    cache.translate("SELECT * FROM datalake WHERE category = 'dog'", parse)
+    cache.translate("SELECT * FROM datalake WHERE category = 'cat'", parse)
+    cache.translate("SELECT * FROM datalake WHERE category = 'dog'", parse)
+    cache.translate("SELECT * FROM datalake WHERE category = 'bird'", parse)  # evicts 'cat'
+
+    assert len(cache) == 2
+    cache.translate("SELECT * FROM datalake WHERE category = 'dog'", parse)
+    assert len(parse.calls) == 3
+    cache.translate("SELECT * FROM datalake WHERE category = 'cat'", parse)
+    assert len(parse.calls) == 4
+
+
+def test_cache_disabled():
+    """
+    With size 0 and no persistent tier, queries are always parsed
+    """
+    parse = CountingParser()
+    cache = QueryCache(maxsize=0)
+
+    cache.translate("SELECT * FROM datalake WHERE category = 'dog'", parse)
+    cache.translate("SELECT * FROM datalake WHERE category = 'dog'", parse)
+
+    assert len(parse.calls) == 2
+
+
+def test_cache_parameterize():
+    """
+    Queries differing only in their literals share the same entry
+    """
+    parse = CountingParser()
+    cache = QueryCache(parameterize=True)
+
+    assert cache.translate("SELECT * FROM datalake WHERE category = 'dog'", parse) == ({"category": "dog"}, {})
+    assert cache.translate("SELECT * FROM datalake WHERE category = 'cat'", parse) == ({"category": "cat"}, {})
+    assert len(parse.calls) == 1
+
+
+def test_cache_parameterize_like():
+    """
+    LIKE patterns are not parameterized
+    """
+    parse = CountingParser()
+    cache = QueryCache(parameterize=True)
+
+    dog = cache.translate("SELECT * FROM datalake WHERE caption LIKE '%dog%' AND category = 'animal'", parse)
+    cat = cache.translate("SELECT * FROM datalake WHERE caption LIKE '%cat%' AND category = 'animal'", parse)
+
+    assert dog == ({"caption": {"$regex": ".*dog.*"}, "category": "animal"}, {})
+    assert cat == ({"caption": {"$regex": ".*cat.*"}, "category": "animal"}, {})
+    assert len(parse.calls) == 2
+
+
+def test_cache_parameterize_fallback():
+    """
+    Literals which end up within longer strings are not parameterized
+    """
+    parse = CountingParser()
+    cache = QueryCache(parameterize=True)
+
+    dog = cache.translate("SELECT * FROM datalake WHERE caption CONTAINS 'dog'", parse)
+    cat = cache.translate("SELECT * FROM datalake WHERE caption CONTAINS 'cat'", parse)
+
+    assert dog == ({"caption": {"$regex": ".*dog.*"}}, {})
+    assert cat == ({"caption": {"$regex": ".*cat.*"}}, {})
+    assert len(parse.calls) == 3  # template, plus each query parsed as is
+
+
+def test_cache_persistent(tmp_path):
+    """
+    Translations are persisted to disk and shared between cache instances
+    """
+    parse = CountingParser()
+    path = f"{tmp_path}/query_cache.json"
+
+    QueryCache(path=path).translate("SELECT * FROM datalake WHERE category = 'dog'", parse)
+
+    with open(path, "r") as f:
+        assert json.load(f) == {"SELECT * FROM datalake WHERE category = 'dog'": [{"category": "dog"}, {}]}
+
+    cache = QueryCache(path=path)
+    assert cache.translate("SELECT * FROM datalake WHERE category = 'dog'", parse) == ({"category": "dog"}, {})
+    assert len(parse.calls) == 1
+    assert cache.disk_hits == 1
+
+
+def test_cache_persistent_concurrent(tmp_path):
+    """
+    Entries saved by concurrent writers sharing the same file are all kept
+    """
+    parse = CountingParser()
+    path = f"{tmp_path}/query_cache.json"
+    queries = [f"SELECT * FROM datalake WHERE category = 'cat{i}'" for i in range(20)]
+
+    # separate instances, as separate jobs would use
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda query: QueryCache(path=path).translate(query, parse), queries))
+
+    with open(path, "r") as f:
+        assert set(json.load(f)) == set(queries)
+
+
+def test_cache_persistent_invalid(tmp_path):
+    """
+    Entries of the persistent tier with unsafe operators or an invalid structure are ignored
+    """
+    parse = CountingParser()
+    path = f"{tmp_path}/query_cache.json"
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "SELECT * FROM datalake WHERE category = 'dog'": [{"$where": "sleep(1000)"}, {}],
+                "SELECT * FROM datalake WHERE category = 'cat'": "unparameterizable",
+            },
+            f,
+        )
+
+    cache = QueryCache(path=path)
+    assert cache.translate("SELECT * FROM datalake WHERE category = 'dog'", parse) == ({"category": "dog"}, {})
+    assert cache.translate("SELECT * FROM datalake WHERE category = 'cat'", parse) == ({"category": "cat"}, {})
+    assert len(parse.calls) == 2
+    assert cache.disk_hits == 0
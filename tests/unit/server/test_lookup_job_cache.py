@@ -0,0 +1,144 @@
+import pytest
+
+#
+# Testing the lookup_job_cache and get_job_hash functions in module server.py
+#
+
+import os
+import json
+import shutil
+from dlaas.tuilib.common import UserInput
+from dlaas.tuilib.hpc import register_results, get_watermark
+from dlaas.tuilib.upload import mark_uploaded
+from dlaas.tuilib.server import lookup_job_cache, get_job_hash
+
+from conftest import ROOT_DIR
+
+QUERY_FILTERS = {"$or": [{"id": "1"}, {"id": "2"}]}
+
+
+@pytest.fixture(scope="function")
+def write_input(tmp_path, mock_mongodb, monkeypatch):
+    """Write the user input of a job (with job cache enabled) and redirect the metadata access to the mock
+    collection"""
+    monkeypatch.setattr("dlaas.tuilib.server.get_read_collection", lambda config, **kwargs: mock_mongodb)
+    monkeypatch.setattr("dlaas.tuilib.server.get_collection", lambda config, **kwargs: mock_mongodb)
+
+    def write_input(job_id: str, **data) -> str:
+        json_path = f"{tmp_path}/{job_id}.json"
+        with open(json_path, "w") as f:
+            json.dump(
+                {
+                    "id": job_id,
+                    "sql_query": "SELECT * FROM metadata WHERE id = '1' OR id = '2'",
+                    "query_filters": QUERY_FILTERS,
+                    "query_fields": {},
+                    "config_server": {"job_cache": "true"},
+                    **data,
+                },
+                f,
+            )
+        return json_path
+
+    yield write_input
+
+
+def run_job(collection, json_path, uploaded: bool = True):
+    """Register the results of a job as done by the HPC version, flagging them as uploaded if the upload succeeded"""
+    user_input = UserInput.from_json(json_path)
+    watermark = get_watermark(collection=collection, query_filters=QUERY_FILTERS, exclude_job_id=user_input.id)
+
+    os.makedirs("output", exist_ok=True)
+    shutil.copy(f"{ROOT_DIR}/tests/utils/sample_files/test1.txt", "output/test1.txt")
+    try:
+        register_results(
+            collection=collection,
+            job_id=user_input.id,
+            pfs_prefix_path=ROOT_DIR,
+            metadata={"job_hash": user_input.job_hash, "job_watermark": watermark},
+        )
+    finally:
+        shutil.rmtree("output")
+
+    if uploaded:
+        mark_uploaded(collection=collection, job_id=user_input.id)
+
+
+def test_cache_hit(mock_mongodb, write_input):
+    """
+    Same job on unchanged data returns the results of the previous job
+    """
+
+    json_path = write_input("JOB1")
+    assert lookup_job_cache(json_path) == {}
+    assert UserInput.from_json(json_path).job_hash, "Job hash was not saved for the HPC version"
+    run_job(mock_mongodb, json_path)
+
+    cached = lookup_job_cache(write_input("JOB2"))
+
+    assert cached == {"job_id": "JOB1", "s3_keys": ["results_JOB1.zip"]}
+    assert mock_mongodb.find_one({"job_id": "JOB2"})["cached_from"] == "JOB1"
+
+
+def test_not_uploaded(mock_mongodb, write_input):
+    """
+    Results which were not uploaded (upload failed or still in progress) are not returned
+    """
+
+    json_path = write_input("JOB1")
+    lookup_job_cache(json_path)
+    run_job(mock_mongodb, json_path, uploaded=False)
+
+    assert lookup_job_cache(write_input("JOB2")) == {}
+
+
+def test_data_changed(mock_mongodb, write_input):
+    """
+    New files matching the query invalidate the previous results
+    """
+
+    json_path = write_input("JOB1")
+    lookup_job_cache(json_path)
+    run_job(mock_mongodb, json_path)
+
+    mock_mongodb.insert_one({"id": "2", "s3_key": "test2_new.txt", "path": "test2_new.txt"})
+
+    assert lookup_job_cache(write_input("JOB2")) == {}
+
+
+def test_different_script(mock_mongodb, write_input, tmp_path):
+    """
+    Jobs with a different script do not share the results
+    """
+
+    with open(f"{tmp_path}/script.py", "w") as f:
+        f.write("def main(files_in):\n    return files_in\n")
+
+    json_path = write_input("JOB1")
+    lookup_job_cache(json_path)
+    run_job(mock_mongodb, json_path)
+
+    assert lookup_job_cache(write_input("JOB2", script_path=f"{tmp_path}/script.py")) == {}
+
+
+def test_disabled(mock_mongodb, write_input):
+    """
+    Nothing is done if the job cache is disabled
+    """
+
+    json_path = write_input("JOB1", config_server={"job_cache": "false"})
+
+    assert lookup_job_cache(json_path) == {}
+    assert UserInput.from_json(json_path).job_hash is None
+
+
+def test_unpinned_container():
+    """
+    Containers not pinned to a digest cannot be cached
+    """
+
+    data = {"id": "JOB", "sql_query": "SELECT * FROM metadata"}
+
+    assert get_job_hash(UserInput({**data, "container_url": "docker://image:latest"}), {}, {}) == ""
+    assert get_job_hash(UserInput({**data, "container_url": "docker://image@sha256:abc"}), {}, {}) != ""
+    assert get_job_hash(UserInput({**data, "container_path": "/path/to/container.sif"}), {}, {}) == ""
@@ -0,0 +1,110 @@
+import pytest
+
+#
+# Testing the preflight_job and estimate_resources functions in module server.py
+#
+
+import json
+from dlaas.tuilib.common import Config
+from dlaas.tuilib.server import preflight_job, estimate_resources
+
+
+@pytest.fixture(scope="function")
+def json_path(tmp_path, mock_mongodb, monkeypatch):
+    """Write the user input and redirect the metadata access to the mock collection"""
+    monkeypatch.setattr("dlaas.tuilib.server.get_read_collection", lambda config, **kwargs: mock_mongodb)
+
+    mock_mongodb.update_one({"id": "1"}, {"$set": {"size": 2e9}})
+    mock_mongodb.update_one({"id": "2"}, {"$set": {"size": 1e9}})
+
+    json_path = f"{tmp_path}/input.json"
+    with open(json_path, "w") as f:
+        json.dump(
+            {
+                "id": "DLAAS-TUI-TEST",
+                "sql_query": "SELECT * FROM metadata WHERE id = '1' OR id = '2'",
+                "query_filters": {"$or": [{"id": "1"}, {"id": "2"}]},
+                "query_fields": {},
+                "config_server": {"walltime": "00:05:00"},
+            },
+            f,
+        )
+    yield json_path
+
+
+def set_config_server(json_path, **options):
+    """Add custom server options to the user input"""
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    data["config_server"].update(options)
+    with open(json_path, "w") as f:
+        json.dump(data, f)
+
+
+def test_preflight(json_path):
+    """
+    Count matches and size, without changing the job resources
+    """
+    assert preflight_job(json_path=json_path) == {"matches": 2, "size": 3e9}
+
+    with open(json_path, "r") as f:
+        assert json.load(f)["config_server"] == {"walltime": "00:05:00"}
+
+
+def test_preflight_disabled(json_path):
+    """
+    No pre-flight check if disabled
+    """
+    set_config_server(json_path, preflight=False)
+
+    assert preflight_job(json_path=json_path) == {}
+
+
+def test_too_many_matches(json_path):
+    """
+    Make sure exception is raised if the query matches too many files
+    """
+    set_config_server(json_path, max_matches=1)
+
+    with pytest.raises(RuntimeError):
+        preflight_job(json_path=json_path)
+
+
+def test_too_large(json_path):
+    """
+    Make sure exception is raised if the query matches too much data
+    """
+    set_config_server(json_path, max_result_size=2.5)
+
+    with pytest.raises(RuntimeError):
+        preflight_job(json_path=json_path)
+
+
+def test_auto_resources(json_path):
+    """
+    Nodes and walltime are saved in the user input
+    """
+    set_config_server(json_path, auto_resources=True, files_per_node=1, seconds_per_file=100)
+
+    preflight_job(json_path=json_path)
+
+    with open(json_path, "r") as f:
+        config_server = json.load(f)["config_server"]
+
+    assert config_server["nodes"] == 2
+    assert config_server["walltime"] == "00:12:30"
+    assert config_server["files_per_node"] == 1
+
+
+def test_estimate_resources():
+    """
+    Estimate is capped by the maximum number of nodes and walltime
+    """
+    config = Config("server")
+    config.load_custom_config(
+        {"files_per_node": 100, "seconds_per_file": 10, "max_nodes": 4, "max_walltime": "10:00:00"}
+    )
+
+    assert estimate_resources(matches=150, config=config) == {"nodes": 2, "walltime": "00:28:45"}
+    assert estimate_resources(matches=0, config=config) == {"nodes": 1, "walltime": "00:10:00"}
+    assert estimate_resources(matches=100000, config=config) == {"nodes": 4, "walltime": "10:00:00"}
@@ -0,0 +1,175 @@
+import pytest
+
+#
+# Testing the local execution of small jobs (is_local_job and run_local_job functions in server.py library)
+#
+
+import os
+import sys
+import json
+
+from dlaas.tuilib.server import is_local_job, run_local_job
+
+
+def write_input(tmp_path, **user_input) -> str:
+    json_path = str(tmp_path / "input.json")
+    with open(json_path, "w") as f:
+        json.dump({"id": "LOCAL", "sql_query": "SELECT * FROM metadata", **user_input}, f)
+    return json_path
+
+
+@pytest.fixture(scope="function")
+def operator_config(tmp_path, monkeypatch):
+    """Write the server and HPC configuration files of the operator, returning a function setting server options"""
+
+    monkeypatch.setenv("HOME", str(tmp_path))
+    os.makedirs(tmp_path / ".config" / "dlaas")
+    os.makedirs(tmp_path / "pfs")
+    with open(tmp_path / ".config" / "dlaas" / "config_hpc.json", "w") as f:
+        json.dump({"pfs_prefix_path": str(tmp_path / "pfs")}, f)
+
+    def set_options(**options) -> None:
+        with open(tmp_path / ".config" / "dlaas" / "config_server.json", "w") as f:
+            json.dump({"local_dir": str(tmp_path / "local"), **options}, f)
+
+    set_options()
+    return set_options
+
+
+@pytest.fixture(scope="function")
+def job(tmp_path, monkeypatch):
+    """Replace the Python interpreter running dl_tui_hpc with a shell script, returning a function setting its body"""
+
+    executable = tmp_path / "python"
+    monkeypatch.setattr(sys, "executable", str(executable))
+
+    def set_job(body: str) -> None:
+        executable.write_text(f"#!/bin/sh\n{body}\n")
+        executable.chmod(0o755)
+
+    return set_job
+
+
+def test_is_local_job(tmp_path, operator_config):
+    """
+    Jobs run locally only if local execution is enabled and the pre-flight check found few enough matches
+    """
+
+    assert not is_local_job(write_input(tmp_path), {"matches": 1, "size": 0})
+
+    operator_config(local_max_matches=10, local_user="nobody")
+    assert is_local_job(write_input(tmp_path), {"matches": 10, "size": 0})
+    assert not is_local_job(write_input(tmp_path), {"matches": 11, "size": 0})
+    assert not is_local_job(write_input(tmp_path), {})
+
+
+def test_local_options_operator_only(tmp_path, operator_config):
+    """
+    The local execution options cannot be set in the custom configuration of a job
+    """
+
+    for option in [{"local_max_matches": 10}, {"local_timeout": 0}, {"local_dir": "/etc"}, {"local_user": "root"}]:
+        with pytest.raises(KeyError, match="can only be set in the configuration file"):
+            is_local_job(write_input(tmp_path, config_server=option), {"matches": 1, "size": 0})
+
+
+def test_local_requirements(tmp_path, operator_config):
+    """
+    Jobs are not run locally without a separate user, or if the parallel filesystem is not mounted
+    """
+
+    operator_config(local_max_matches=10)
+    assert not is_local_job(write_input(tmp_path), {"matches": 1, "size": 0})
+
+    operator_config(local_max_matches=10, local_user="nobody")
+    json_path = write_input(tmp_path, config_hpc={"pfs_prefix_path": "/not/mounted"})
+    assert not is_local_job(json_path, {"matches": 1, "size": 0})
+
+
+def test_container_job_not_local(tmp_path, operator_config):
+    """
+    Jobs running a container are always submitted to Slurm, whether the container is given by URL or by path
+    """
+
+    operator_config(local_max_matches=10, local_user="nobody")
+    for container in [{"container_url": "docker://alpine"}, {"container_path": "container.sif"}]:
+        json_path = write_input(tmp_path, exec_command="ls", **container)
+        assert not is_local_job(json_path, {"matches": 1, "size": 0})
+
+
+def test_run_local_job(tmp_path, operator_config, job):
+    """
+    dl_tui_hpc runs in the job folder, which is removed at the end
+    """
+
+    job('echo "$@"; pwd')
+
+    stdout, stderr = run_local_job(write_input(tmp_path))
+
+    assert stdout.splitlines() == [
+        "-m dlaas.bin.dl_tui_hpc run --upload input.json",
+        str(tmp_path / "local" / "LOCAL"),
+    ]
+    assert stderr == ""
+    assert not os.path.exists(tmp_path / "local" / "LOCAL")
+
+
+def test_resource_limits(tmp_path, operator_config, job):
+    """
+    The resource limits are applied to the job by its wrapper
+    """
+
+    operator_config(local_timeout=42, local_memory=4096)
+    job("ulimit -t; ulimit -v")
+
+    stdout, stderr = run_local_job(write_input(tmp_path))
+
+    assert stdout.splitlines() == ["42", str(4096 * 1024)]
+
+
+def test_failed_job(tmp_path, operator_config, job):
+    """
+    Jobs exiting with an error raise RuntimeError
+    """
+
+    job("echo 'Traceback' >&2; exit 3")
+
+    with pytest.raises(RuntimeError, match="exit code 3"):
+        run_local_job(write_input(tmp_path))
+
+
+def test_failed_job_log(tmp_path, operator_config, job):
+    """
+    The log of a failed job is kept, while the job folder is removed
+    """
+
+    job("echo 'Traceback' > dl-tui.log; exit 3")
+
+    with pytest.raises(RuntimeError):
+        run_local_job(write_input(tmp_path))
+
+    assert not os.path.exists(tmp_path / "local" / "LOCAL")
+    assert (tmp_path / "local" / "logs" / "LOCAL.log").read_text() == "Traceback\n"
+
+
+def test_timeout(tmp_path, operator_config, job):
+    """
+    Jobs not completing within local_timeout are killed
+    """
+
+    operator_config(local_timeout=1)
+    job("sleep 30")
+
+    with pytest.raises(RuntimeError, match="did not complete within 1 s"):
+        run_local_job(write_input(tmp_path))
+
+
+def test_busy_workers(tmp_path, operator_config, job):
+    """
+    If all the workers are busy, the job is not run
+    """
+
+    operator_config(local_workers=0)
+    job("echo done")
+
+    assert run_local_job(write_input(tmp_path)) is None
@@ -0,0 +1,74 @@
+import pytest
+
+#
+# Testing the validate_query function in module server.py
+#
+
+import json
+from dlaas.tuilib.server import validate_query
+
+
+def test_translation_added(tmp_path):
+    """
+    The translated query is added to the JSON file with the user input
+    """
+
+    json_path = f"{tmp_path}/input.json"
+    with open(json_path, "w") as f:
+        json.dump({"id": "DLAAS-TUI-TEST", "sql_query": "SELECT * FROM metadata WHERE category = 'motorcycle'"}, f)
+
+    query_filters, query_fields = validate_query(json_path=json_path)
+
+    assert query_filters == {"category": "motorcycle"}
+    assert query_fields == {}
+
+    with open(json_path, "r") as f:
+        data = json.load(f)
+
+    assert data["id"] == "DLAAS-TUI-TEST"
+    assert data["query_filters"] == {"category": "motorcycle"}
+    assert data["query_fields"] == {}
+
+
+def test_invalid_query(tmp_path):
+    """
+    Make sure exception is raised (and the JSON file is left untouched) if the query is not valid SQL
+    """
+
+    json_path = f"{tmp_path}/input.json"
+    with open(json_path, "w") as f:
+        json.dump({"id": "DLAAS-TUI-TEST", "sql_query": "blablabla"}, f)
+
+    with pytest.raises(SyntaxError):
+        validate_query(json_path=json_path)
+
+    with open(json_path, "r") as f:
+        assert "query_filters" not in json.load(f)
+
+
+def test_internal_keys_replaced(tmp_path):
+    """
+    Translation and job hash provided by the user are replaced by the server translation, or removed
+    """
+
+    json_path = f"{tmp_path}/input.json"
+    with open(json_path, "w") as f:
+        json.dump(
+            {
+                "id": "DLAAS-TUI-TEST",
+                "sql_query": "SELECT * FROM metadata WHERE category = 'motorcycle'",
+                "query_filters": {"category": {"$ne": "motorcycle"}},
+                "query_fields": {"path": 1},
+                "job_hash": "0123456789abcdef",
+            },
+            f,
+        )
+
+    validate_query(json_path=json_path)
+
+    with open(json_path, "r") as f:
+        data = json.load(f)
+
+    assert data["query_filters"] == {"category": "motorcycle"}
+    assert data["query_fields"] == {}
+    assert "job_hash" not in data
@@ -0,0 +1,93 @@
+import pytest
+
+#
+# Testing Tracer class and format_timeline function in tracing.py library
+#
+
+from dlaas.tuilib.tracing import Tracer, get_trace_id, get_root_span_id, load_spans, format_timeline
+import os
+
+
+def test_disabled(tmp_path):
+    """
+    Nothing is recorded if the tracer is not configured
+    """
+
+    tracer = Tracer()
+    with tracer.span("retrieve"):
+        pass
+
+    assert tracer.record("queue_wait", 0, 1) == None
+    assert os.listdir(tmp_path) == []
+
+
+def test_spans(tmp_path):
+    """
+    Nested spans are children of the enclosing span, top-level spans of the root span of the job
+    """
+
+    tracer = Tracer()
+    tracer.configure(job_id="42", trace_dir=f"{tmp_path}/traces", service="dl_tui_hpc")
+
+    with tracer.span("run"):
+        with tracer.span("retrieve", files=10):
+            pass
+    tracer.record("queue_wait", 1000, 2000)
+
+    spans = {span["name"]: span for span in load_spans([f"{tmp_path}/traces/trace_42.jsonl"])}
+
+    assert spans["run"]["traceId"] == get_trace_id("42")
+    assert spans["run"]["parentSpanId"] == get_root_span_id("42")
+    assert spans["retrieve"]["parentSpanId"] == spans["run"]["spanId"]
+    assert spans["retrieve"]["attributes"] == {"service.name": "dl_tui_hpc", "job_id": "42", "files": "10"}
+    assert spans["queue_wait"]["parentSpanId"] == get_root_span_id("42")
+    assert spans["queue_wait"]["endTimeUnixNano"] - spans["queue_wait"]["startTimeUnixNano"] == 1000
+
+
+def test_error(tmp_path):
+    """
+    Spans ended by an exception have an error status
+    """
+
+    tracer = Tracer()
+    tracer.configure(job_id="42", trace_dir=str(tmp_path), service="dl_tui_server")
+
+    with pytest.raises(SyntaxError):
+        with tracer.span("validate_query"):
+            raise SyntaxError("Invalid SQL query")
+
+    span = load_spans([f"{tmp_path}/trace_42.jsonl"])[0]
+    assert span["status"] == {"code": "STATUS_CODE_ERROR", "message": "SyntaxError: Invalid SQL query"}
+
+
+def test_trace_id():
+    """
+    UUID.hex job IDs are used as trace IDs, other IDs are hashed
+    """
+
+    assert get_trace_id("0123456789abcdef0123456789abcdef") == "0123456789abcdef0123456789abcdef"
+    assert len(get_trace_id("42")) == 32
+
+
+def test_timeline(tmp_path):
+    """
+    Spans recorded by different executables are aggregated in one timeline
+    """
+
+    server = Tracer()
+    server.configure(job_id="42", trace_dir=str(tmp_path), service="dl_tui_server")
+    server.record("submit", 0, 2 * 10**9)
+
+    hpc = Tracer()
+    hpc.configure(job_id="42", trace_dir=str(tmp_path), service="dl_tui_hpc")
+    run = hpc.record("run", 5 * 10**9, 10 * 10**9)
+    hpc.record("retrieve", 5 * 10**9, 6 * 10**9, parent_id=run)
+
+    lines = format_timeline(load_spans([f"{tmp_path}/trace_42.jsonl", f"{tmp_path}/missing.jsonl"])).split("\n")
+
+    assert lines[0].endswith("(job 42): 3 spans, 10.000 s")
+    assert lines[2].split() == ["0.000", "s", "2.000", "s", "dl_tui_server", "submit"]
+    assert lines[3].split() == ["5.000", "s", "5.000", "s", "dl_tui_hpc", "run"]
+    assert lines[4].split() == ["5.000", "s", "1.000", "s", "dl_tui_hpc", "retrieve"]
+    assert lines[4].endswith("  retrieve")
+    assert format_timeline([]) == "No spans found"
@@ -0,0 +1,83 @@
+import pytest
+
+#
+# Testing archive_results function in upload.py library
+#
+
+from dlaas.tuilib.upload import archive_results, get_archive_name
+import os
+import shutil
+import tarfile
+from zipfile import ZipFile, ZIP_STORED
+
+from conftest import ROOT_DIR
+
+
+@pytest.fixture(scope="function")
+def output_dir():
+    os.makedirs("output", exist_ok=True)
+    shutil.copy(f"{ROOT_DIR}/tests/utils/sample_files/test1.txt", "output/test1.txt")
+    shutil.copy(f"{ROOT_DIR}/tests/utils/sample_files/test2.txt", "output/test2.txt")
+    yield "output"
+    shutil.rmtree("output")
+    for archive in ["results_1.zip", "results_1.tar.zst"]:
+        if os.path.exists(archive):
+            os.remove(archive)
+
+
+def test_archive_zip(output_dir):
+    """
+    Archive the output folder in a zip archive
+    """
+
+    archive = archive_results(source_dir=output_dir, archive_path=get_archive_name(job_id=1))
+
+    assert archive == "results_1.zip"
+    with ZipFile(archive, "r") as f:
+        assert f.namelist() == ["test1.txt", "test2.txt"], "Archive does not contain the expected files."
+
+
+def test_archive_store(output_dir):
+    """
+    Archive the output folder in a zip archive without compression
+    """
+
+    archive = archive_results(
+        source_dir=output_dir,
+        archive_path=get_archive_name(job_id=1, archive_format="store"),
+        archive_format="store",
+    )
+
+    with ZipFile(archive, "r") as f:
+        assert f.namelist() == ["test1.txt", "test2.txt"], "Archive does not contain the expected files."
+        assert all(info.compress_type == ZIP_STORED for info in f.infolist())
+
+
+def test_archive_zstd(output_dir):
+    """
+    Archive the output folder in a tar.zst archive
+    """
+
+    zstandard = pytest.importorskip("zstandard")
+
+    archive = archive_results(
+        source_dir=output_dir,
+        archive_path=get_archive_name(job_id=1, archive_format="tar.zst"),
+        archive_format="tar.zst",
+        compress_level=3,
+        archive_threads=2,
+    )
+
+    assert archive == "results_1.tar.zst"
+    with open(archive, "rb") as f:
+        with zstandard.ZstdDecompressor().stream_reader(f) as reader:
+            with tarfile.open(fileobj=reader, mode="r|") as tar:
+                assert [member.name for member in tar] == ["test1.txt", "test2.txt"]
+
+
+def test_wrong_format(output_dir):
+    """
+    Test that an unsupported archive format raises an exception
+    """
+    with pytest.raises(ValueError):
+        get_archive_name(job_id=1, archive_format="rar")
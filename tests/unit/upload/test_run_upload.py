@@ -0,0 +1,186 @@
+import pytest
+
+#
+# Testing write_manifest and run_upload functions in upload.py library
+#
+
+from dlaas.tuilib.upload import write_manifest, update_manifest, run_upload
+from dlaas.tuilib.hpc import register_results
+import os
+import json
+import shutil
+from zipfile import ZipFile
+
+import boto3
+from moto import mock_aws
+
+from conftest import ROOT_DIR
+
+
+@pytest.fixture(scope="function")
+def s3_client():
+    with mock_aws():
+        s3 = boto3.client(service_name="s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="test")
+        yield s3
+
+
+@pytest.fixture(scope="function")
+def job_dir():
+    job_dir = os.path.abspath("run_upload_test")
+    os.makedirs(f"{job_dir}/output")
+    shutil.copy(f"{ROOT_DIR}/tests/utils/sample_files/test1.txt", f"{job_dir}/output/test1.txt")
+    shutil.copy(f"{ROOT_DIR}/tests/utils/sample_files/test2.txt", f"{job_dir}/output/test2.txt")
+    with open(f"{job_dir}/slurm-1234.out", "w") as f:
+        f.write("slurm log")
+    cwd = os.getcwd()
+    os.chdir(job_dir)
+    yield job_dir
+    os.chdir(cwd)
+    shutil.rmtree(job_dir)
+
+
+def test_write_manifest(job_dir):
+    """
+    Write a manifest with custom options, using the defaults for the missing ones
+    """
+
+    manifest = write_manifest(
+        job_id="JOB",
+        s3_endpoint_url="https://s3.amazonaws.com",
+        s3_bucket="test",
+        upload_options={"archive_format": "store"},
+    )
+
+    assert manifest == f"{job_dir}/upload_manifest_JOB.json"
+
+    with open(manifest, "r") as f:
+        content = json.load(f)
+
+    assert content["job_id"] == "JOB"
+    assert content["s3_bucket"] == "test"
+    assert content["output_dir"] == "output"
+    assert content["archive_format"] == "store"
+    assert content["output_layout"] == "archive"
+
+
+def test_run_upload_archive(s3_client, job_dir):
+    """
+    Upload the output folder as a zip archive, including the Slurm logs
+    """
+
+    manifest = write_manifest(job_id="JOB", s3_endpoint_url="https://s3.amazonaws.com", s3_bucket="test")
+
+    summary = run_upload(manifest_path=manifest)
+
+    assert summary["s3_keys"] == ["results_JOB.zip"]
+    assert summary["bytes"] == os.path.getsize(f"{job_dir}/results_JOB.zip")
+    assert set(summary["stages"]) == {"archive", "upload"}
+    assert "profile" not in summary
+    assert not os.path.exists(f"{job_dir}/output"), "Output folder was not removed."
+
+    s3_client.download_file(Bucket="test", Key="results_JOB.zip", Filename=f"{job_dir}/downloaded.zip")
+    with ZipFile(f"{job_dir}/downloaded.zip", "r") as archive:
+        assert sorted(archive.namelist()) == ["slurm-1234.out", "test1.txt", "test2.txt"]
+
+
+def test_run_upload_objects(s3_client, job_dir):
+    """
+    Upload each file in the output folder as a separate object
+    """
+
+    manifest = write_manifest(
+        job_id="JOB",
+        s3_endpoint_url="https://s3.amazonaws.com",
+        s3_bucket="test",
+        upload_options={"output_layout": "objects"},
+    )
+
+    summary = run_upload(manifest_path=manifest)
+
+    assert summary["s3_keys"] == [
+        "results/JOB/slurm-1234.out",
+        "results/JOB/test1.txt",
+        "results/JOB/test2.txt",
+    ]
+
+    objects = s3_client.list_objects_v2(Bucket="test", Prefix="results/JOB/")["Contents"]
+    assert sorted(obj["Key"] for obj in objects) == summary["s3_keys"]
+
+
+def test_run_upload_profile(s3_client, job_dir):
+    """
+    Profiling information recorded in the manifest is returned with the summary
+    """
+
+    manifest = write_manifest(job_id="JOB", s3_endpoint_url="https://s3.amazonaws.com", s3_bucket="test")
+    update_manifest(manifest_path=manifest, updates={"profile": {"database": "db", "collection": "coll"}})
+
+    summary = run_upload(manifest_path=manifest)
+
+    assert summary["profile"] == {"database": "db", "collection": "coll"}
+
+
+def test_run_upload_register_archive(s3_client, job_dir, mock_mongodb):
+    """
+    Slurm logs copied at upload time are added to the file list of the archive entry
+    """
+
+    register_results(collection=mock_mongodb, job_id="JOB", pfs_prefix_path="/pfs")
+    manifest = write_manifest(
+        job_id="JOB",
+        s3_endpoint_url="https://s3.amazonaws.com",
+        s3_bucket="test",
+        collection=mock_mongodb,
+    )
+
+    run_upload(manifest_path=manifest, collection=mock_mongodb)
+
+    entry = mock_mongodb.find_one({"job_id": "JOB"})
+    assert entry["file_count"] == 3
+    assert entry["uploaded"], "Results entry not flagged as uploaded"
+    assert [file["name"] for file in entry["files"]] == ["test1.txt", "test2.txt", "slurm-1234.out"]
+
+
+def test_run_upload_register_objects(s3_client, job_dir, mock_mongodb):
+    """
+    An entry is created for each Slurm log copied at upload time with the "objects" layout
+    """
+
+    upload_options = {"output_layout": "objects"}
+    register_results(
+        collection=mock_mongodb,
+        job_id="JOB",
+        pfs_prefix_path="/pfs",
+        upload_options=upload_options,
+        metadata={"job_hash": "HASH"},
+    )
+    manifest = write_manifest(
+        job_id="JOB",
+        s3_endpoint_url="https://s3.amazonaws.com",
+        s3_bucket="test",
+        upload_options=upload_options,
+        collection=mock_mongodb,
+    )
+
+    summary = run_upload(manifest_path=manifest, collection=mock_mongodb)
+
+    entries = [entry for entry in mock_mongodb.find({"job_id": "JOB"}).sort("s3_key")]
+    assert [entry["s3_key"] for entry in entries] == summary["s3_keys"]
+    assert entries[0]["path"] == "/pfs/results/JOB/slurm-1234.out"
+    assert entries[0]["job_hash"] == "HASH"
+    assert entries[0]["size"] == len("slurm log")
+
+
+def test_job_config(job_dir):
+    """
+    The custom options of the job recorded in the manifest are applied to a separate upload
+    """
+
+    from dlaas.bin.dl_tui_hpc import get_job_config
+
+    manifest = write_manifest(job_id="JOB", s3_endpoint_url="https://s3.amazonaws.com", s3_bucket="test")
+    assert get_job_config(manifest).collection == "metadata"
+
+    update_manifest(manifest_path=manifest, updates={"config_hpc": {"collection": "custom"}})
+    assert get_job_config(manifest).collection == "custom"
@@ -0,0 +1,81 @@
+import pytest
+
+#
+# Testing stream_results function in upload.py library
+#
+
+from dlaas.tuilib.upload import S3MultipartWriter, stream_results
+import io
+import os
+import shutil
+from zipfile import ZipFile
+
+import boto3
+from moto import mock_aws
+
+from conftest import ROOT_DIR
+
+
+@pytest.fixture(scope="function")
+def s3_client():
+    with mock_aws():
+        s3 = boto3.client(service_name="s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="test")
+        yield s3
+
+
+@pytest.fixture(scope="function")
+def output_dir():
+    os.makedirs("output", exist_ok=True)
+    shutil.copy(f"{ROOT_DIR}/tests/utils/sample_files/test1.txt", "output/test1.txt")
+    shutil.copy(f"{ROOT_DIR}/tests/utils/sample_files/test2.txt", "output/test2.txt")
+    yield "output"
+    shutil.rmtree("output")
+
+
+def test_stream_zip(s3_client, output_dir):
+    """
+    Stream the output folder as a zip archive into a multipart upload
+    """
+
+    size = stream_results(s3_client=s3_client, source_dir=output_dir, bucket="test", key="results_1.zip")
+
+    body = s3_client.get_object(Bucket="test", Key="results_1.zip")["Body"].read()
+    assert len(body) == size
+
+    with ZipFile(io.BytesIO(body), "r") as f:
+        assert f.namelist() == ["test1.txt", "test2.txt"], "Archive does not contain the expected files."
+        assert f.read("test1.txt") == open(f"{ROOT_DIR}/tests/utils/sample_files/test1.txt", "rb").read()
+
+
+def test_stream_abort(s3_client, output_dir):
+    """
+    Test that the multipart upload is aborted if archiving fails
+    """
+
+    with pytest.raises(ValueError):
+        stream_results(
+            s3_client=s3_client, source_dir=output_dir, bucket="test", key="results_1.zip", archive_format="rar"
+        )
+
+    assert s3_client.list_multipart_uploads(Bucket="test").get("Uploads", []) == []
+    assert s3_client.list_objects_v2(Bucket="test")["KeyCount"] == 0
+
+
+def test_complete_abort(s3_client, monkeypatch):
+    """
+    Test that the multipart upload is aborted if it cannot be completed
+    """
+
+    def fail(**kwargs):
+        raise ConnectionError("S3 unreachable")
+
+    writer = S3MultipartWriter(s3_client=s3_client, bucket="test", key="results_1.zip")
+    writer.write(b"results")
+    monkeypatch.setattr(s3_client, "complete_multipart_upload", fail)
+
+    with pytest.raises(ConnectionError):
+        writer.close()
+
+    assert writer.closed
+    assert s3_client.list_multipart_uploads(Bucket="test").get("Uploads", []) == []
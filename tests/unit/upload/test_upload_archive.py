@@ -0,0 +1,49 @@
+import pytest
+
+#
+# Testing upload_archive function in upload.py library
+#
+
+from dlaas.tuilib.upload import upload_archive, get_transfer_config
+
+import boto3
+from moto import mock_aws
+
+from conftest import ROOT_DIR
+
+
+@pytest.fixture(scope="function")
+def s3_client():
+    with mock_aws():
+        s3 = boto3.client(service_name="s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="test")
+        yield s3
+
+
+def test_upload_archive(s3_client):
+    """
+    Upload a file with a custom transfer configuration
+    """
+
+    transfer_config = get_transfer_config(
+        multipart_threshold=8,
+        multipart_chunksize=8,
+        max_concurrency=2,
+        use_threads=False,
+    )
+
+    assert transfer_config.multipart_threshold == 8 * 1024 * 1024
+    assert transfer_config.max_concurrency == 2
+    assert transfer_config.use_threads == False
+
+    size = upload_archive(
+        s3_client=s3_client,
+        filename=f"{ROOT_DIR}/tests/utils/sample_files/test1.txt",
+        bucket="test",
+        key="results_1.zip",
+        transfer_config=transfer_config,
+    )
+
+    body = s3_client.get_object(Bucket="test", Key="results_1.zip")["Body"].read()
+    assert len(body) == size
+    assert body == open(f"{ROOT_DIR}/tests/utils/sample_files/test1.txt", "rb").read()
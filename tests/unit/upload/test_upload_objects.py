@@ -0,0 +1,47 @@
+import pytest
+
+#
+# Testing upload_objects function in upload.py library
+#
+
+from dlaas.tuilib.upload import upload_objects, get_objects_prefix
+import os
+import shutil
+
+import boto3
+from moto import mock_aws
+
+from conftest import ROOT_DIR
+
+
+@pytest.fixture(scope="function")
+def s3_client():
+    with mock_aws():
+        s3 = boto3.client(service_name="s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="test")
+        yield s3
+
+
+@pytest.fixture(scope="function")
+def output_dir():
+    os.makedirs("output", exist_ok=True)
+    shutil.copy(f"{ROOT_DIR}/tests/utils/sample_files/test1.txt", "output/test1.txt")
+    shutil.copy(f"{ROOT_DIR}/tests/utils/sample_files/test2.txt", "output/test2.txt")
+    yield "output"
+    shutil.rmtree("output")
+
+
+def test_upload_objects(s3_client, output_dir):
+    """
+    Upload each output file as a separate object
+    """
+
+    keys = upload_objects(s3_client=s3_client, source_dir=output_dir, bucket="test", prefix=get_objects_prefix(1))
+
+    assert keys == ["results/1/test1.txt", "results/1/test2.txt"]
+
+    objects = [item["Key"] for item in s3_client.list_objects_v2(Bucket="test", Prefix="results/1/")["Contents"]]
+    assert sorted(objects) == keys
+
+    body = s3_client.get_object(Bucket="test", Key="results/1/test2.txt")["Body"].read()
+    assert body == open(f"{ROOT_DIR}/tests/utils/sample_files/test2.txt", "rb").read()